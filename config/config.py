@@ -31,6 +31,69 @@ class Config:
     IMAGES_DIR = os.environ.get('IMAGES_DIR', 'data/images')
     ANNOTATIONS_DIR = os.environ.get('ANNOTATIONS_DIR', 'data/annotations')
     EXPORTS_DIR = os.environ.get('EXPORTS_DIR', 'data/exports')
+    IMAGE_METADATA_FILE = os.environ.get('IMAGE_METADATA_FILE', 'data/image_metadata.json')
+    DERIVATIVES_DIR = os.environ.get('DERIVATIVES_DIR', 'data/derivatives')
+    # Only one process may serve a data directory (in-memory event bus, collaboration
+    # sessions and catalogs); empty disables the check
+    INSTANCE_LOCK_FILE = os.environ.get('INSTANCE_LOCK_FILE', 'data/server.lock')
+    
+    # Projects (each subdirectory of PROJECTS_DIR is a separate dataset)
+    PROJECTS_DIR = os.environ.get('PROJECTS_DIR', 'data/projects')
+    PROJECT_IDLE_SECONDS = int(os.environ.get('PROJECT_IDLE_SECONDS', 1800))
+    
+    # Image storage: 'local' (IMAGES_DIR) or 's3' (S3-compatible object store,
+    # objects under <S3_PREFIX><project>/images/ with a local read-through cache)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_ENDPOINT = os.environ.get('S3_ENDPOINT', 'http://127.0.0.1:9000')
+    S3_BUCKET = os.environ.get('S3_BUCKET', 'bee-annotate')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+    S3_POOL_SIZE = int(os.environ.get('S3_POOL_SIZE', 8))
+    S3_MULTIPART_THRESHOLD_MB = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 16))
+    S3_PART_SIZE_MB = int(os.environ.get('S3_PART_SIZE_MB', 8))
+    S3_MAX_WORKERS = int(os.environ.get('S3_MAX_WORKERS', 4))
+    STORAGE_CACHE_DIR = os.environ.get('STORAGE_CACHE_DIR', 'data/storage_cache')
+    STORAGE_CACHE_MB = int(os.environ.get('STORAGE_CACHE_MB', 1024))
+    STORAGE_LIST_TTL = int(os.environ.get('STORAGE_LIST_TTL', 30))
+    
+    # Annotation settings
+    SPATIAL_INDEX_CELL_SIZE = int(os.environ.get('SPATIAL_INDEX_CELL_SIZE', 128))
+    ANNOTATION_BATCH_MAX_SIZE = int(os.environ.get('ANNOTATION_BATCH_MAX_SIZE', 500))
+    ANNOTATION_BATCH_WORKERS = int(os.environ.get('ANNOTATION_BATCH_WORKERS', 8))
+    IMAGE_METADATA_WORKERS = int(os.environ.get('IMAGE_METADATA_WORKERS', 8))
+    COLLAB_SNAPSHOT_SECONDS = float(os.environ.get('COLLAB_SNAPSHOT_SECONDS', 5))
+    ANNOTATION_MAX_PAYLOAD_MB = float(os.environ.get('ANNOTATION_MAX_PAYLOAD_MB', 4))
+    ANNOTATION_MAX_COUNT = int(os.environ.get('ANNOTATION_MAX_COUNT', 20000))
+    ANNOTATION_MAX_VERTICES = int(os.environ.get('ANNOTATION_MAX_VERTICES', 10000))
+    ANNOTATION_MAX_TOTAL_VERTICES = int(os.environ.get('ANNOTATION_MAX_TOTAL_VERTICES', 200000))
+    ANNOTATION_NORMALIZE = os.environ.get('ANNOTATION_NORMALIZE', 'False').lower() == 'true'
+    ANNOTATION_SIMPLIFY_TOLERANCE = float(os.environ.get('ANNOTATION_SIMPLIFY_TOLERANCE', 0.5))
+    ANNOTATION_COORD_PRECISION = int(os.environ.get('ANNOTATION_COORD_PRECISION', 2))
+    HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', 'True').lower() == 'true'
+    HISTORY_SNAPSHOT_INTERVAL = int(os.environ.get('HISTORY_SNAPSHOT_INTERVAL', 20))
+    HISTORY_MAX_REVISIONS = int(os.environ.get('HISTORY_MAX_REVISIONS', 200))
+    HISTORY_MAX_DAYS = int(os.environ.get('HISTORY_MAX_DAYS', 90))
+    
+    # Web view copy settings (requires Pillow)
+    DERIVATIVE_MAX_EDGE = int(os.environ.get('DERIVATIVE_MAX_EDGE', 4096))
+    DERIVATIVE_FORMAT = os.environ.get('DERIVATIVE_FORMAT', 'jpeg')
+    DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 85))
+    DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+    
+    # Export settings
+    EXPORT_ROW_GROUP_SIZE = int(os.environ.get('EXPORT_ROW_GROUP_SIZE', 65536))
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 256 * 1024))
+    
+    # Browser cache settings (service worker)
+    IMAGE_CACHE_MAX_MB = int(os.environ.get('IMAGE_CACHE_MAX_MB', 200))
+    IMAGE_CACHE_REVALIDATE_SECONDS = int(os.environ.get('IMAGE_CACHE_REVALIDATE_SECONDS', 600))
+    
+    # File offload: '' (Flask sends files), 'x-sendfile' (lighttpd/Apache) or
+    # 'x-accel-redirect' (nginx; X_ACCEL_MAPPINGS maps local dirs to internal locations)
+    FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', '')
+    X_ACCEL_MAPPINGS = os.environ.get('X_ACCEL_MAPPINGS', 'data=/_protected')
     
     # Security settings
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'True').lower() == 'true'
@@ -102,6 +165,7 @@ class TestingConfig(Config):
     # Use in-memory or temporary directories for testing
     DATA_DIR = 'test_data'
     IMAGES_DIR = 'test_data/images'
+    INSTANCE_LOCK_FILE = 'test_data/server.lock'
     ANNOTATIONS_DIR = 'test_data/annotations'
     EXPORTS_DIR = 'test_data/exports'
 
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+JSON codec benchmark
+
+Compares the previous annotation serialization (stdlib json, indent=2,
+ensure_ascii=False) with the codec in app.codec (orjson when installed,
+compact output) on synthetic frames of circle and freehand polygon
+annotations, and compares loading a large export with json.load against
+streaming it image by image with iter_export_annotations.
+
+Usage: python scripts/benchmark_codec.py [--annotations N] [--images N] [--repeat N]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+# Add project root and src to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+from app import codec
+
+CLASSES = ['capped_brood', 'eggs', 'honey', 'larvae', 'nectar', 'pollen', 'other']
+
+
+def make_frame(count, polygon_ratio=0.1, vertices=120, seed=0):
+    """Synthetic frame: mostly circles, some freehand polygons with float vertices"""
+    rng = random.Random(seed)
+    frame = []
+    for i in range(count):
+        annotation = {
+            'id': f"{i:016x}",
+            'class': rng.choice(CLASSES),
+            'timestamp': '2024-05-01T12:00:00.000000'
+        }
+        if rng.random() < polygon_ratio:
+            cx, cy = rng.uniform(0, 4000), rng.uniform(0, 3000)
+            annotation.update(type='polygon', points=[
+                {'x': cx + rng.uniform(-40, 40), 'y': cy + rng.uniform(-40, 40)} for _ in range(vertices)])
+        else:
+            annotation.update(type='circle', x=rng.uniform(0, 4000), y=rng.uniform(0, 3000),
+                              radius=rng.uniform(8, 20))
+        frame.append(annotation)
+    return frame
+
+
+def best_of(repeat, func):
+    """Best wall time in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def bench_frame(count, repeat):
+    frame = make_frame(count)
+    old_text = json.dumps(frame, ensure_ascii=False, indent=2)
+    old_bytes = old_text.encode('utf-8')
+    new_bytes = codec.dumps(frame)
+
+    rows = [
+        ('save (serialize)', best_of(repeat, lambda: json.dumps(frame, ensure_ascii=False, indent=2).encode('utf-8')),
+         best_of(repeat, lambda: codec.dumps(frame))),
+        ('load (parse)', best_of(repeat, lambda: json.loads(old_bytes.decode('utf-8'))),
+         best_of(repeat, lambda: codec.loads(new_bytes))),
+    ]
+    print(f"\nFrame with {count} annotations")
+    print(f"  {'':18} {'stdlib indent=2':>16} {codec.codec_name() + ' compact':>16} {'speedup':>8}")
+    for name, old, new in rows:
+        print(f"  {name:18} {old:13.2f} ms {new:13.2f} ms {old / new:7.1f}x")
+    print(f"  {'file size':18} {len(old_bytes) / 1024:13.1f} KB {len(new_bytes) / 1024:13.1f} KB "
+          f"{len(old_bytes) / len(new_bytes):7.1f}x")
+    assert codec.loads(new_bytes) == frame
+
+
+def write_export(path, images, per_image):
+    """Export file in the same layout as export_all_annotations (one image per line)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"dataset_info": ')
+        f.write(codec.dumps_text({'total_images': images}, pretty=True))
+        f.write(',\n"annotations": {')
+        for i in range(images):
+            f.write(',\n' if i else '\n')
+            f.write(f'"frame_{i:05d}": ')
+            f.write(codec.dumps_text(make_frame(per_image, seed=i)))
+        f.write('\n}}\n')
+
+
+def bench_export(images, per_image):
+    with tempfile.TemporaryDirectory(prefix='codec-bench-') as directory:
+        path = os.path.join(directory, 'export.json')
+        write_export(path, images, per_image)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+        def full_load():
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return sum(len(annotations) for annotations in data['annotations'].values())
+
+        def streamed():
+            return sum(len(annotations) for _, annotations in codec.iter_export_annotations(path))
+
+        results = []
+        for name, func in (('json.load (whole file)', full_load), ('iter_export_annotations', streamed)):
+            start = time.perf_counter()
+            total = func()
+            elapsed = (time.perf_counter() - start) * 1000
+            # Memory is measured in a separate pass, tracemalloc slows the timed run down
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+            results.append(total)
+            print(f"  {name:26} {elapsed:9.1f} ms   peak memory {peak:7.1f} MB")
+        assert results[0] == results[1]
+        print(f"  ({images} images, {results[0]} annotations, {size_mb:.1f} MB export)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the annotation JSON codec")
+    parser.add_argument('--annotations', type=int, default=20000, help="Annotations in the large frame")
+    parser.add_argument('--images', type=int, default=200, help="Images in the export file")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Codec: {codec.codec_name()}")
+    for count in (500, args.annotations):
+        bench_frame(count, args.repeat)
+
+    print("\nExport parsing")
+    bench_export(args.images, 500)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
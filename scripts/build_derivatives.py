@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Build web-optimized view copies (derivatives) for all images
+
+Reads image headers to decide which images need a view copy (non-web formats
+or images larger than DERIVATIVE_MAX_EDGE) and transcodes them in parallel.
+Images with an up-to-date view copy are skipped. Requires Pillow.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Add project root and src to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+from config.env_loader import load_environment
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build web-optimized view copies for all images")
+    parser.add_argument('--workers', type=int, help="Number of parallel workers (default: DERIVATIVE_WORKERS)")
+    args = parser.parse_args()
+
+    load_environment()
+
+    from app import create_app
+    from app.derivatives import derivatives_available
+    from app.models import list_image_files, get_image_metadata, schedule_image_derivatives
+
+    if not derivatives_available():
+        print("Pillow is not installed; run: pip install Pillow")
+        return 1
+
+    app = create_app()
+    if args.workers:
+        app.config['DERIVATIVE_WORKERS'] = args.workers
+
+    with app.app_context():
+        filenames = list_image_files()
+        metadata = get_image_metadata(filenames)
+        futures = schedule_image_derivatives([{'filename': f, 'metadata': metadata.get(f)} for f in filenames])
+
+        print(f"Images: {len(filenames)}, view copies to build: {len(futures)}")
+        failed = 0
+        for done, (filename, future) in enumerate(futures.items(), 1):
+            if future.result() is None:
+                failed += 1
+            print(f"[{done}/{len(futures)}] {filename}")
+
+    print(f"Done ({failed} failed)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
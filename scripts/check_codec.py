@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+JSON codec test harness
+
+Runs the same checks against the orjson path (when orjson is installed) and
+the standard-library path of app.codec:
+
+- round trips, including values orjson hands over to the standard library;
+- NaN / Infinity / -Infinity are rejected by loads, the streaming export
+  reader and the Flask JSON provider on both paths;
+- dumps never writes a non-finite number that loads would then reject.
+
+Usage: python scripts/check_codec.py
+"""
+
+import io
+import sys
+from pathlib import Path
+
+# Add project root and src to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+
+def check(results, name, condition, detail=''):
+    results.append(bool(condition))
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}{f' ({detail})' if detail else ''}")
+
+
+def raises(func, *args):
+    try:
+        func(*args)
+    except ValueError:
+        return True
+    return False
+
+
+def check_path(results, label, app):
+    from app import codec
+
+    document = {'image_id': 'frame', 'annotations': [{'class': 'eggs', 'x': 1.5, 'y': 2, 'radius': 3}]}
+    check(results, f"{label}: round trip", codec.loads(codec.dumps(document)) == document)
+    check(results, f"{label}: pretty round trip", codec.loads(codec.dumps(document, pretty=True)) == document)
+    check(results, f"{label}: integer beyond 64 bits", codec.loads(codec.dumps({'n': 2 ** 70})) == {'n': 2 ** 70})
+
+    for constant in ('NaN', 'Infinity', '-Infinity'):
+        text = f'{{"x": {constant}}}'
+        check(results, f"{label}: loads rejects {constant}", raises(codec.loads, text))
+        check(results, f"{label}: loads rejects {constant} bytes", raises(codec.loads, text.encode('utf-8')))
+        export = io.StringIO(f'{{"annotations": {{"frame": [{{"x": {constant}}}]}}}}')
+        check(results, f"{label}: export reader rejects {constant}",
+              raises(lambda: list(codec.iter_object_items(export, 'annotations'))))
+        check(results, f"{label}: request JSON rejects {constant}", raises(app.json.loads, text))
+
+    for value in (float('nan'), float('inf')):
+        try:
+            written = codec.dumps({'x': value})
+        except ValueError:
+            written = None
+        check(results, f"{label}: dumps {value} is readable or refused",
+              written is None or codec.loads(written) == {'x': None}, written)
+
+
+def main():
+    from app import create_app, codec
+
+    app = create_app()
+    results = []
+    orjson = codec.orjson
+    if orjson is not None:
+        check_path(results, 'orjson', app)
+    else:
+        print("orjson not installed, checking the standard-library path only")
+    codec.orjson = None
+    try:
+        check_path(results, 'json', app)
+    finally:
+        codec.orjson = orjson
+
+    passed = sum(results)
+    print(f"\n{passed}/{len(results)} checks passed")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Image query test harness
+
+Builds a small dataset in a temporary directory and checks /api/images/query
+and the index page, which are both served from the dataset catalog:
+
+- class count ranges, status, prefix and search filters;
+- cursor pagination returns every matching image exactly once in each sort;
+- malformed or tampered cursors (wrong sort, wrong value type, not a
+  cursor at all) are rejected with 400 instead of failing inside the query.
+
+Usage: python scripts/check_image_query.py
+"""
+
+import os
+import sys
+import base64
+import tempfile
+from pathlib import Path
+
+# Add project root and src to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+
+def check(results, name, condition, detail=''):
+    results.append(bool(condition))
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}{f' ({detail})' if detail else ''}")
+
+
+def circles(cls, count):
+    return [{'class': cls, 'x': 10, 'y': 10 + i, 'radius': 3} for i in range(count)]
+
+
+def make_cursor(*parts):
+    from app import codec
+    return base64.urlsafe_b64encode(codec.dumps(list(parts))).decode('ascii').rstrip('=')
+
+
+def page_through(client, query):
+    """Follow next_cursor until the last page, return (ids, total, statuses)"""
+    ids, total, cursor = [], None, None
+    while True:
+        response = client.get(f"/api/images/query?{query}&limit=3" + (f"&cursor={cursor}" if cursor else ''))
+        data = response.get_json()
+        if response.status_code != 200 or not data.get('success'):
+            return ids, total, data
+        ids.extend(image['id'] for image in data['images'])
+        total = data['total']
+        cursor = data['next_cursor']
+        if not cursor:
+            return ids, total, None
+
+
+def main():
+    root = tempfile.mkdtemp(prefix='image-query-')
+    os.environ['DATA_DIR'] = os.path.join(root, 'data')
+    for name in ('images', 'annotations', 'exports'):
+        os.environ[f'{name.upper()}_DIR'] = os.path.join(root, 'data', name)
+    os.chdir(root)
+
+    from PIL import Image
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    os.makedirs(app.config['IMAGES_DIR'], exist_ok=True)
+    for i in range(10):
+        Image.new('RGB', (400, 300)).save(os.path.join(app.config['IMAGES_DIR'], f'frame{i}.jpg'))
+    client = app.test_client()
+
+    results = []
+    for i in range(6):
+        saved = client.post('/api/save_annotation', json={
+            'image_id': f'frame{i}', 'annotations': circles('capped_brood', i * 10) + circles('larvae', i % 2)}).get_json()
+        check(results, f"save frame{i}", saved.get('success'), '' if saved.get('success') else saved)
+
+    data = client.get('/api/images/query?min.capped_brood=21&max.larvae=0').get_json()
+    check(results, "class count ranges", [image['id'] for image in data['images']] == ['frame4'],
+          [image['id'] for image in data['images']])
+    data = client.get('/api/images/query?status=unannotated').get_json()
+    check(results, "status filter", data['total'] == 5, data['total'])
+    data = client.get('/api/images/query?search=FRAME1').get_json()
+    check(results, "filename search", [image['id'] for image in data['images']] == ['frame1'],
+          [image['id'] for image in data['images']])
+
+    for query in ('sort=name', 'sort=name&order=desc', 'sort=count', 'sort=count&order=asc', 'sort=larvae',
+                  'sort=annotated', 'sort=modified&status=annotated'):
+        ids, total, error = page_through(client, query)
+        check(results, f"pagination {query}", error is None and len(ids) == total == len(set(ids)),
+              error or f"{len(ids)} ids, total {total}")
+
+    for name, cursor in (('string value on numeric sort', make_cursor('count', True, 'abc', 'frame1')),
+                         ('number value on name sort', make_cursor('name', False, 5, 'frame1')),
+                         ('boolean value', make_cursor('count', True, True, 'frame1')),
+                         ('list value', make_cursor('count', True, [1], 'frame1')),
+                         ('numeric image id', make_cursor('count', True, 3, 7)),
+                         ('object instead of list', base64.urlsafe_b64encode(b'{"a":1}').decode('ascii')),
+                         ('not base64 JSON', 'zzz')):
+        sort = 'name' if 'name sort' in name else 'count'
+        response = client.get(f"/api/images/query?sort={sort}&cursor={cursor}")
+        check(results, f"cursor rejected: {name}", response.status_code == 400, response.status_code)
+
+    index = client.get('/?search=frame3&per_page=10').get_data(as_text=True)
+    check(results, "index page search", 'data-image-id="frame3"' in index and 'data-image-id="frame4"' not in index)
+
+    passed = sum(results)
+    print(f"\n{passed}/{len(results)} checks passed")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
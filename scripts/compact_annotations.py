@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compact existing annotation files
+
+Simplifies freehand polygons (Douglas-Peucker with a pixel tolerance),
+quantizes coordinates, drops duplicate and closing vertices, and rewrites
+each annotation file in the compact format. Spatial indexes, CSV files and
+the dataset catalog are updated through the normal save path; annotation
+timestamps are preserved. Prints the size and vertex reduction per file
+and in total.
+
+Usage: python scripts/compact_annotations.py [--project NAME] [--tolerance PX] [--precision N] [--dry-run]
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+# Add project root and src to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "src"))
+
+from config.env_loader import load_environment
+
+
+def percent(before, after):
+    return f"{(1 - after / before) * 100:5.1f}%" if before else "  0.0%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simplify polygons and compact annotation files")
+    parser.add_argument('--project', help="Project name (default: the default project)")
+    parser.add_argument('--tolerance', type=float,
+                        help="Simplification tolerance in pixels (default: ANNOTATION_SIMPLIFY_TOLERANCE, 0 disables)")
+    parser.add_argument('--precision', type=int,
+                        help="Decimal places kept in coordinates (default: ANNOTATION_COORD_PRECISION)")
+    parser.add_argument('--dry-run', action='store_true', help="Report the reduction without writing files")
+    parser.add_argument('--quiet', action='store_true', help="Only print the summary")
+    args = parser.parse_args()
+
+    load_environment()
+
+    from app import create_app, codec
+    from app.projects import load_project, use_project
+    from app.simplify import normalize_annotations
+    from app.models import get_annotation_storage, save_annotations
+
+    app = create_app()
+    with app.app_context():
+        project = load_project(args.project)
+        if project is None:
+            print(f"Project not found: {args.project}")
+            return 1
+        use_project(project)
+
+        tolerance = args.tolerance if args.tolerance is not None else app.config.get('ANNOTATION_SIMPLIFY_TOLERANCE', 0.5)
+        precision = args.precision if args.precision is not None else app.config.get('ANNOTATION_COORD_PRECISION', 2)
+        storage = get_annotation_storage()
+        files = sorted(obj for obj in storage.list() if obj.key.endswith('.json'))
+
+        print(f"Project: {project.name}, files: {len(files)}, tolerance: {tolerance}px, precision: {precision}"
+              f"{' (dry run)' if args.dry_run else ''}")
+        totals = {'files': 0, 'changed': 0, 'bytes_before': 0, 'bytes_after': 0,
+                  'polygons': 0, 'vertices_before': 0, 'vertices_after': 0}
+        failed = 0
+        for obj in files:
+            image_id = os.path.splitext(obj.key)[0]
+            try:
+                annotations = codec.loads(storage.get(obj.key))
+            except ValueError:
+                print(f"  {obj.key}: invalid JSON, skipped")
+                failed += 1
+                continue
+            if not isinstance(annotations, list):
+                continue
+
+            compacted, stats = normalize_annotations(annotations, tolerance, precision)
+            size_after = len(codec.dumps(compacted))
+            totals['files'] += 1
+            totals['bytes_before'] += obj.size
+            totals['bytes_after'] += size_after
+            for key in ('polygons', 'vertices_before', 'vertices_after'):
+                totals[key] += stats[key]
+
+            if compacted == annotations and size_after == obj.size:
+                continue
+            totals['changed'] += 1
+            if not args.quiet:
+                print(f"  {obj.key}: {obj.size} -> {size_after} bytes ({percent(obj.size, size_after)}), "
+                      f"vertices {stats['vertices_before']} -> {stats['vertices_after']} "
+                      f"({percent(stats['vertices_before'], stats['vertices_after'])})")
+            if not args.dry_run:
+                save_annotations(image_id, compacted, touch=False, normalize=False, source='compact')
+
+    print(f"Files: {totals['files']} ({totals['changed']} {'would change' if args.dry_run else 'rewritten'}, "
+          f"{failed} failed)")
+    print(f"Size: {totals['bytes_before'] / 1024:.1f} KB -> {totals['bytes_after'] / 1024:.1f} KB "
+          f"({percent(totals['bytes_before'], totals['bytes_after'])} smaller)")
+    print(f"Polygon vertices: {totals['vertices_before']} -> {totals['vertices_after']} "
+          f"({percent(totals['vertices_before'], totals['vertices_after'])} fewer, {totals['polygons']} polygons)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
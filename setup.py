@@ -53,6 +53,9 @@ setup(
             'flake8>=3.8',
             'mypy>=0.800',
         ],
+        'analytics': [
+            'pyarrow>=10.0',
+        ],
         'prod': [
             'gunicorn>=20.0',
             'gevent>=21.0',
@@ -45,6 +45,10 @@ def create_app():
     app.jinja_env.auto_reload = True
     config_class.init_app(app)
 
+    # Use the annotation JSON codec for jsonify and request parsing (orjson when installed)
+    from app.codec import CodecJSONProvider
+    app.json = CodecJSONProvider(app)
+
     # Add font file MIME type support
     mimetypes.add_type('font/woff', '.woff')
     mimetypes.add_type('font/woff2', '.woff2')
@@ -55,6 +59,10 @@ def create_app():
     from app.i18n import init_i18n
     init_i18n(app, default_language='en')
 
+    # Bus, collaboration sessions and catalogs are per process: serve from a single process
+    from app.instance_lock import init_instance_lock
+    init_instance_lock(app)
+
     # Register blueprints
     from app.routes import bp
     app.register_blueprint(bp)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+蜂格数据集流式ZIP打包（图像 + 标注 + 清单）
+"""
+
+import os
+import io
+import sys
+import hashlib
+import zipfile
+from datetime import datetime
+import logging
+
+from app.models import get_image_storage, get_annotations_dir, get_dataset_catalog
+from app.catalog import ImageQuery
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ANNOTATION_FORMATS = ('json', 'csv')
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+class _StreamSink(io.RawIOBase):
+    """
+    只写、不可定位的输出缓冲
+
+    zipfile检测到不可定位时会使用数据描述符写入条目，
+    已写入的字节由生成器及时取走，缓冲区大小因此有界。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def drain(self):
+        """取出并清空已缓冲的数据"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+    @property
+    def pending(self):
+        return self._size
+
+
+def collect_archive_entries(annotated_only=False, annotation_format='json'):
+    """收集需要打包的图像及其标注文件（按文件名排序，标注数量取自统计索引，不读取标注文件）"""
+    annotations_dir = get_annotations_dir()
+    query = ImageQuery(status='annotated' if annotated_only else None, sort='name', limit=sys.maxsize)
+    rows, _, _ = get_dataset_catalog().query(query)
+    entries = []
+
+    for row in rows:
+        annotation_path = os.path.join(annotations_dir, f"{row['id']}.{annotation_format}")
+        entries.append({
+            'image_id': row['id'],
+            'filename': row['filename'],
+            'annotation_path': annotation_path if os.path.exists(annotation_path) else None,
+            'annotation_count': row['annotation_count']
+        })
+
+    return entries
+
+
+def _write_file_entry(zf, sink, arcname, path, compress_type, chunk_size):
+    """
+    分块写入单个文件条目，每写一块就产出缓冲数据
+
+    返回生成器，最终值为 (文件大小, sha256)。
+    """
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = compress_type
+    digest = hashlib.sha256()
+    size = 0
+
+    with open(path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=zinfo.file_size > 0x7FFFFFFF) as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dst.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+            if sink.pending >= chunk_size:
+                yield sink.drain()
+
+    if sink.pending:
+        yield sink.drain()
+    return size, digest.hexdigest()
+
+
+def iter_dataset_archive(annotated_only=False, annotation_format='json', chunk_size=None):
+    """
+    边构建边产出数据集ZIP的字节块
+
+    图像以STORED方式写入（不再压缩），标注文件以DEFLATE压缩，
+    最后写入 manifest.json。不产生任何临时文件。
+    """
+    if annotation_format not in ARCHIVE_ANNOTATION_FORMATS:
+        raise ValueError(f"不支持的标注格式: {annotation_format}")
+
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    storage = get_image_storage()
+    entries = collect_archive_entries(annotated_only, annotation_format)
+
+    sink = _StreamSink()
+    manifest = {
+        'created': datetime.now().isoformat(),
+        'annotated_only': annotated_only,
+        'annotation_format': annotation_format,
+        'total_images': len(entries),
+        'total_annotations': sum(entry['annotation_count'] for entry in entries),
+        'images': []
+    }
+
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as zf:
+        for entry in entries:
+            item = {
+                'image_id': entry['image_id'],
+                'image': f"images/{entry['filename']}",
+                'annotation_count': entry['annotation_count'],
+                'annotation': None
+            }
+            try:
+                # 远程存储的图像在写入时才下载到本地缓存
+                image_path = storage.local_path(entry['filename'])
+                if image_path is None:
+                    raise FileNotFoundError(entry['filename'])
+                size, sha256 = yield from _write_file_entry(
+                    zf, sink, item['image'], image_path, zipfile.ZIP_STORED, chunk_size)
+                item['size'] = size
+                item['sha256'] = sha256
+
+                if entry['annotation_path']:
+                    item['annotation'] = f"annotations/{entry['image_id']}.{annotation_format}"
+                    yield from _write_file_entry(
+                        zf, sink, item['annotation'], entry['annotation_path'], zipfile.ZIP_DEFLATED, chunk_size)
+            except OSError as e:
+                logger.error(f"打包文件失败 {entry['filename']}: {e}")
+                continue
+
+            manifest['images'].append(item)
+
+        zf.writestr('manifest.json', codec.dumps(manifest, pretty=True),
+                    compress_type=zipfile.ZIP_DEFLATED)
+
+    yield sink.drain()
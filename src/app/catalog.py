@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+数据集目录：每个图像的标注数量与类别计数
+
+首次使用时扫描一次图像和标注目录，之后由保存、删除、上传操作增量更新，
+统计查询不再需要重新读取标注文件。每个标注文件的计数连同其修改时间和大小
+保存在标注目录的 .catalog.cache 中，重启或索引被释放后重建时只需列目录，
+修改时间和大小未变的文件直接使用保存的计数，不再读取。图像查询（按类别数量范围、标注状态、
+文件名、修改 / 标注时间筛选并排序、分页）同样只使用索引：每种排序方式的
+有序键列表在首次使用时建立，之后随单个图像的变化用二分查找增量调整，
+筛选结果按条件缓存到下一次变化，翻页只需切片。
+"""
+
+import os
+import time
+import base64
+import tempfile
+import threading
+import logging
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.idle_cache import IdleCache
+from app.storage import StorageObject
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+_catalogs = IdleCache()
+
+# 缓存的筛选结果数量上限（超过时全部清除）
+MAX_FILTERED_RESULTS = 32
+
+# 标注计数缓存文件（标注目录中），及变化后延迟写入的秒数
+CACHE_FILENAME = '.catalog.cache'
+CACHE_SAVE_DELAY = 10
+
+
+def _count_classes(annotations):
+    return Counter(annotation.get('class', 'other') for annotation in annotations)
+
+
+class Catalog:
+    """单个（图像存储, 标注目录）组合的统计索引"""
+
+    def __init__(self, storage, annotations_dir, is_image):
+        self.storage = storage
+        self.annotations_dir = annotations_dir
+        self.is_image = is_image
+        self.lock = threading.Lock()
+        self.images = {}               # image_id -> StorageObject（新上传的图像大小未知）
+        self.entries = {}              # image_id -> (标注数量, 类别计数)
+        self.annotated_at = {}         # image_id -> 标注最后保存时间 ns
+        self.files = {}                # image_id -> 标注文件 (修改时间 ns, 大小)，与 entries 一起写入缓存
+        self.save_timer = None
+        self.class_totals = Counter()  # 所有标注文件的类别计数
+        self.total_annotations = 0     # 仅统计存在图像的标注
+        self.annotated_images = 0
+        self.images_mtime = None
+        self.orders = {}               # (排序字段, 是否取负) -> 升序的 (排序值, image_id) 列表
+        self.filtered = {}             # (排序, 筛选条件) -> 筛选后的有序键列表
+        self.rebuild()
+
+    def _dir_mtime(self):
+        return self.storage.version()
+
+    def _scan_images(self):
+        return {os.path.splitext(obj.key)[0]: obj for obj in self.storage.list() if self.is_image(obj.key)}
+
+    def _cache_path(self):
+        return os.path.join(self.annotations_dir, CACHE_FILENAME)
+
+    def _load_cache(self):
+        """读取标注计数缓存 {image_id: [修改时间 ns, 大小, 数量, 类别计数]}，损坏或不存在时返回空"""
+        try:
+            with open(self._cache_path(), 'rb') as f:
+                return codec.load(f).get('files', {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def save_cache(self):
+        """将标注计数写入缓存文件（写临时文件后替换）"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            files = {image_id: [*self.files[image_id], *self.entries[image_id]]
+                     for image_id in self.entries if image_id in self.files}
+        if not os.path.isdir(self.annotations_dir):
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{CACHE_FILENAME}.", suffix='.tmp', dir=self.annotations_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(codec.dumps({'files': files}))
+            os.replace(tmp_path, self._cache_path())
+        except OSError as e:
+            logger.warning(f"写入统计索引缓存失败 {self.annotations_dir}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _schedule_save(self):
+        """延迟写入缓存，连续保存只写一次（调用方持有锁）"""
+        if self.save_timer is not None:
+            return
+        self.save_timer = threading.Timer(CACHE_SAVE_DELAY, self.save_cache)
+        self.save_timer.daemon = True
+        self.save_timer.start()
+
+    def _stat_annotations(self, image_id):
+        """标注文件的 (修改时间 ns, 大小)，不存在时返回None"""
+        try:
+            stat = os.stat(os.path.join(self.annotations_dir, f"{image_id}.json"))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def rebuild(self):
+        """全量扫描目录重建索引；修改时间和大小与缓存一致的标注文件不重新读取"""
+        images_mtime = self._dir_mtime()
+        images = self._scan_images()
+
+        cache = self._load_cache()
+        entries = {}
+        annotated_at = {}
+        files = {}
+        parsed = 0
+        if os.path.exists(self.annotations_dir):
+            with os.scandir(self.annotations_dir) as listing:
+                for item in listing:
+                    if not item.name.endswith('.json') or item.name.startswith('.'):
+                        continue
+                    image_id = os.path.splitext(item.name)[0]
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    signature = (stat.st_mtime_ns, stat.st_size)
+                    cached = cache.get(image_id)
+                    if cached and tuple(cached[:2]) == signature:
+                        entry = (cached[2], Counter(cached[3]))
+                    else:
+                        try:
+                            with open(item.path, 'rb') as f:
+                                annotations = codec.load(f)
+                                fstat = os.fstat(f.fileno())
+                        except (OSError, ValueError):
+                            continue
+                        signature = (fstat.st_mtime_ns, fstat.st_size)
+                        entry = (len(annotations), _count_classes(annotations))
+                        parsed += 1
+                    entries[image_id] = entry
+                    annotated_at[image_id] = signature[0]
+                    files[image_id] = signature
+
+        with self.lock:
+            self.images = images
+            self.images_mtime = images_mtime
+            self.entries = {}
+            self.annotated_at = annotated_at
+            self.files = files
+            self.orders = {}
+            self.filtered = {}
+            self.class_totals = Counter()
+            self.total_annotations = 0
+            self.annotated_images = 0
+            for image_id, entry in entries.items():
+                self._apply(image_id, entry)
+        logger.info(f"统计索引已重建 {self.annotations_dir}: {len(entries)} 个标注文件，读取 {parsed} 个")
+        if parsed or len(cache) != len(entries):
+            self.save_cache()
+
+    def _apply(self, image_id, entry):
+        """替换某图像的条目并增量更新汇总（调用方持有锁）"""
+        old_count, old_classes = self.entries.get(image_id, (0, Counter()))
+        new_count, new_classes = entry if entry else (0, Counter())
+
+        self.class_totals.subtract(old_classes)
+        self.class_totals.update(new_classes)
+        if image_id in self.images:
+            self.total_annotations += new_count - old_count
+            self.annotated_images += (new_count > 0) - (old_count > 0)
+
+        if entry:
+            self.entries[image_id] = entry
+        else:
+            self.entries.pop(image_id, None)
+        return old_count
+
+    def update_annotations(self, image_id, annotations):
+        """标注保存后更新，返回 (旧数量, 新数量)"""
+        signature = self._stat_annotations(image_id)
+        with self.lock:
+            self._unindex(image_id)
+            old_count = self._apply(image_id, (len(annotations), _count_classes(annotations)))
+            self.annotated_at[image_id] = signature[0] if signature else time.time_ns()
+            if signature:
+                self.files[image_id] = signature
+            else:
+                self.files.pop(image_id, None)
+            self._index(image_id)
+            self._schedule_save()
+        return old_count, len(annotations)
+
+    def remove_annotations(self, image_id):
+        """标注删除后更新，返回 (旧数量, 0)"""
+        with self.lock:
+            self._unindex(image_id)
+            old_count = self._apply(image_id, None)
+            self.annotated_at.pop(image_id, None)
+            self.files.pop(image_id, None)
+            self._index(image_id)
+            self._schedule_save()
+        return old_count, 0
+
+    def add_image(self, filename):
+        """新增图像后更新"""
+        image_id = os.path.splitext(filename)[0]
+        with self.lock:
+            exists = image_id in self.images
+            self._unindex(image_id)
+            self.images[image_id] = StorageObject(filename, None, time.time_ns(), None)
+            self._index(image_id)
+            if exists:
+                return
+            count = self.entries.get(image_id, (0, None))[0]
+            self.total_annotations += count
+            self.annotated_images += count > 0
+
+    def refresh_images(self):
+        """
+        图像列表的版本标记变化时（如在应用外复制了图像）重新列出图像
+
+        只重新列目录并按内存中的条目重算汇总，不读取标注文件。
+        """
+        images_mtime = self._dir_mtime()
+        if images_mtime == self.images_mtime:
+            return
+
+        images = self._scan_images()
+        with self.lock:
+            self.images = images
+            self.images_mtime = images_mtime
+            self.orders = {}
+            self.filtered = {}
+            present = [self.entries[i][0] for i in images if i in self.entries]
+            self.total_annotations = sum(present)
+            self.annotated_images = sum(1 for count in present if count > 0)
+
+    def has_image(self, image_id):
+        return self.find_image(image_id) is not None
+
+    def find_image(self, image_id):
+        """按图像ID返回列出时的 StorageObject，不存在时返回None（不重新列出存储）"""
+        self.refresh_images()
+        with self.lock:
+            return self.images.get(image_id)
+
+    def stats(self, class_keys):
+        """与 /api/stats 相同结构的统计信息"""
+        self.refresh_images()
+        with self.lock:
+            return {
+                'total_images': len(self.images),
+                'annotated_images': self.annotated_images,
+                'total_annotations': self.total_annotations,
+                'class_distribution': {key: self.class_totals.get(key, 0) for key in class_keys}
+            }
+
+    def _state(self, image_id):
+        """图像的 (文件名, 修改时间, 标注数量, 类别计数, 标注保存时间)（调用方持有锁）"""
+        image = self.images[image_id]
+        filename, mtime_ns = image.key, image.mtime_ns
+        count, classes = self.entries.get(image_id, (0, None))
+        return filename, mtime_ns, count, classes, self.annotated_at.get(image_id) if count else None
+
+    def _order(self, sort, negate):
+        """按需建立排序键列表"""
+        keys = self.orders.get((sort, negate))
+        if keys is None:
+            keys = sorted((_sort_value(sort, negate, *self._state(image_id)), image_id) for image_id in self.images)
+            self.orders[(sort, negate)] = keys
+        return keys
+
+    def _unindex(self, image_id):
+        """图像变化前从已建立的排序中移除（调用方持有锁）"""
+        if image_id not in self.images:
+            return
+        state = self._state(image_id)
+        for (sort, negate), keys in self.orders.items():
+            key = (_sort_value(sort, negate, *state), image_id)
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def _index(self, image_id):
+        """图像变化后插回已建立的排序，并清除筛选结果（调用方持有锁）"""
+        self.filtered = {}
+        if image_id not in self.images:
+            return
+        state = self._state(image_id)
+        for (sort, negate), keys in self.orders.items():
+            insort(keys, (_sort_value(sort, negate, *state), image_id))
+
+    def _matching(self, query):
+        """查询条件对应的有序键列表（升序；query.reverse 时由调用方反向读取）"""
+        order = (query.sort, query.descending and not query.reverse)
+        keys = self._order(*order)
+        filters = query.filters()
+        if filters is None:
+            return keys
+
+        cached = self.filtered.get((order, filters))
+        if cached is None:
+            if query.prefix and query.sort == 'name':
+                # 按文件名排序时前缀对应连续的一段
+                keys = keys[bisect_left(keys, (query.prefix,)):bisect_left(keys, (query.prefix + '\U0010ffff',))]
+            cached = [key for key in keys if query.matches(*self._state(key[1]))]
+            if len(self.filtered) >= MAX_FILTERED_RESULTS:
+                self.filtered = {}
+            self.filtered[(order, filters)] = cached
+        return cached
+
+    def _row(self, image_id):
+        filename, mtime_ns, count, classes, annotated_ns = self._state(image_id)
+        return {
+            'id': image_id,
+            'filename': filename,
+            'annotation_count': count,
+            'classes': {cls: n for cls, n in classes.items() if n} if classes else {},
+            'modified': _format_ns(mtime_ns),
+            'annotated': _format_ns(annotated_ns)
+        }
+
+    def locate(self, query, image_id):
+        """
+        图像在查询结果中的位置，返回 (序号, 总数, 上一项, 当前项, 下一项)
+
+        用排序键二分查找，不遍历结果；图像不存在或不在结果中时返回None，
+        没有上一项 / 下一项时对应值为None。
+        """
+        self.refresh_images()
+        with self.lock:
+            if image_id not in self.images:
+                return None
+            keys = self._matching(query)
+            negate = query.descending and not query.reverse
+            key = (_sort_value(query.sort, negate, *self._state(image_id)), image_id)
+            i = bisect_left(keys, key)
+            if i >= len(keys) or keys[i] != key:
+                return None
+            total = len(keys)
+            before, after = (i + 1, i - 1) if query.reverse else (i - 1, i + 1)
+            neighbour = lambda j: self._row(keys[j][1]) if 0 <= j < total else None
+            position = total - i if query.reverse else i + 1
+            return position, total, neighbour(before), self._row(image_id), neighbour(after)
+
+    def query(self, query, offset=0):
+        """
+        按 ImageQuery 查询图像，返回 (当前页, 匹配总数, 下一页游标)
+
+        从游标（query.after）之后再跳过 offset 项取一页。当前页每项为 {id, filename,
+        annotation_count, classes, modified, annotated}，没有下一页时游标为None。
+        """
+        self.refresh_images()
+        with self.lock:
+            keys = self._matching(query)
+            total = len(keys)
+            after = tuple(query.after) if query.after is not None else None
+            if query.reverse:
+                end = (bisect_left(keys, after) if after is not None else total) - offset
+                page = keys[max(end - query.limit, 0):max(end, 0)][::-1]
+                has_more = end > query.limit
+            else:
+                start = (bisect_right(keys, after) if after is not None else 0) + offset
+                page = keys[start:start + query.limit]
+                has_more = start + query.limit < total
+            rows = [self._row(image_id) for _, image_id in page]
+
+        next_cursor = query.cursor_after(page[-1]) if has_more and page else None
+        return rows, total, next_cursor
+
+
+# 图像查询的排序字段（也可以按某个类别的数量排序）
+QUERY_SORTS = ('name', 'count', 'modified', 'annotated')
+QUERY_STATUSES = ('annotated', 'unannotated')
+DEFAULT_QUERY_LIMIT = 50
+MAX_QUERY_LIMIT = 1000
+
+
+def _sort_value(sort, negate, filename, mtime_ns, count, classes, annotated_ns):
+    """排序值，与 image_id 组成升序比较的排序键；negate 时数值取负（降序）"""
+    if sort == 'name':
+        return filename
+    if sort == 'count':
+        value = count
+    elif sort == 'modified':
+        value = mtime_ns
+    elif sort == 'annotated':
+        # 未标注的图像排在最前（降序时最后）
+        value = annotated_ns or 0
+    else:
+        value = classes.get(sort, 0) if classes else 0
+    return -value if negate else value
+
+
+def _format_ns(value):
+    return datetime.fromtimestamp(value / 1e9).isoformat() if value else None
+
+
+def _parse_int(args, name, minimum=0):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"无效的{name}参数: {value}")
+    if number < minimum:
+        raise ValueError(f"无效的{name}参数: {value}")
+    return number
+
+
+def _parse_time(args, name, end=False):
+    """解析 ISO 日期或时间为 ns；只有日期的结束时间包含当天"""
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"无效的{name}参数: {value}")
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return int(moment.timestamp() * 1e9)
+
+
+class ImageQuery:
+    """
+    图像查询条件
+
+    class_ranges 为 {类别: (最少, 最多)}，count_range 为标注总数范围（均含端点，
+    None 表示不限）；status 为 annotated / unannotated；prefix 为文件名前缀，search 为
+    文件名中包含的文字（不区分大小写）；modified、annotated 为图像修改时间和标注保存
+    时间的 [起始, 结束) 范围（ns）；sort 为 QUERY_SORTS 之一或类别键。
+    after 为上一页最后一项的排序键，由游标解析得到。
+    """
+
+    def __init__(self, class_ranges=None, count_range=(None, None), status=None, prefix='', search='',
+                 modified=(None, None), annotated=(None, None), sort='name', descending=False,
+                 after=None, limit=DEFAULT_QUERY_LIMIT):
+        self.class_ranges = class_ranges or {}
+        self.count_range = count_range
+        self.status = status
+        self.prefix = prefix
+        self.search = search.lower()
+        self.modified = modified
+        self.annotated = annotated
+        self.sort = sort
+        self.descending = descending
+        self.after = after
+        self.limit = limit
+        # 数值排序的降序通过取负实现，数量相同的图像仍按ID升序；文件名不会重复，直接反向读取
+        self.reverse = descending and sort == 'name'
+
+    def filters(self):
+        """筛选条件（用作缓存键），没有筛选时返回None"""
+        filters = (tuple(sorted(self.class_ranges.items())), self.count_range, self.status,
+                   self.prefix, self.search, self.modified, self.annotated)
+        return None if filters == ((), (None, None), None, '', '', (None, None), (None, None)) else filters
+
+    def matches(self, filename, mtime_ns, count, classes, annotated_ns):
+        if self.prefix and not filename.startswith(self.prefix):
+            return False
+        if self.search and self.search not in filename.lower():
+            return False
+        if self.status and (count > 0) != (self.status == 'annotated'):
+            return False
+        low, high = self.count_range
+        if (low is not None and count < low) or (high is not None and count > high):
+            return False
+        for cls, (low, high) in self.class_ranges.items():
+            n = classes.get(cls, 0) if classes else 0
+            if (low is not None and n < low) or (high is not None and n > high):
+                return False
+        for value, (start, end) in ((mtime_ns, self.modified), (annotated_ns, self.annotated)):
+            if start is None and end is None:
+                continue
+            if value is None or (start is not None and value < start) or (end is not None and value >= end):
+                return False
+        return True
+
+    def cursor_after(self, key):
+        """编码下一页游标（包含排序方式，换了排序的游标无效）"""
+        value, image_id = key
+        token = codec.dumps([self.sort, self.descending, value, image_id])
+        return base64.urlsafe_b64encode(token).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """解析游标为上一页最后一项的排序键"""
+        try:
+            sort, descending, value, image_id = codec.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (ValueError, TypeError):
+            raise ValueError(f"无效的cursor参数: {cursor}")
+        if sort != self.sort or descending != self.descending:
+            raise ValueError("cursor与排序方式不一致")
+        # 排序值的类型必须与排序键一致（文件名为字符串，其余为整数），否则无法比较
+        value_type = str if self.sort == 'name' else int
+        if type(value) is not value_type or type(image_id) is not str:
+            raise ValueError(f"无效的cursor参数: {cursor}")
+        return value, image_id
+
+
+def parse_image_query(args, class_keys):
+    """
+    解析图像查询参数（request.args），参数无效时抛出 ValueError
+
+    min.<类别>、max.<类别>：类别数量范围；class：包含该类别（可重复）；
+    min_count、max_count：标注总数范围；status；prefix：文件名前缀；search：文件名包含；
+    modified_from/modified_to、annotated_from/annotated_to：ISO 日期或时间；
+    sort、order（asc / desc）；cursor；limit。
+    """
+    class_keys = set(class_keys)
+    class_ranges = {}
+    for name in args:
+        bound, _, cls = name.partition('.')
+        if bound not in ('min', 'max') or not cls:
+            continue
+        if cls not in class_keys:
+            raise ValueError(f"未知的类别: {cls}")
+        low, high = class_ranges.get(cls, (None, None))
+        value = _parse_int(args, name)
+        class_ranges[cls] = (value, high) if bound == 'min' else (low, value)
+    for cls in args.getlist('class'):
+        if not cls:
+            continue
+        if cls not in class_keys:
+            raise ValueError(f"未知的类别: {cls}")
+        low, high = class_ranges.get(cls, (None, None))
+        class_ranges[cls] = (max(low or 0, 1), high)
+
+    status = args.get('status') or None
+    if status is not None and status not in QUERY_STATUSES:
+        raise ValueError(f"无效的status参数: {status}")
+    sort = args.get('sort') or 'name'
+    if sort not in QUERY_SORTS and sort not in class_keys:
+        raise ValueError(f"无效的sort参数: {sort}")
+    order = args.get('order') or ('asc' if sort == 'name' else 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"无效的order参数: {order}")
+    limit = _parse_int(args, 'limit', minimum=1)
+
+    query = ImageQuery(
+        class_ranges=class_ranges,
+        count_range=(_parse_int(args, 'min_count'), _parse_int(args, 'max_count')),
+        status=status,
+        prefix=args.get('prefix', ''),
+        search=args.get('search', '').strip(),
+        modified=(_parse_time(args, 'modified_from'), _parse_time(args, 'modified_to', end=True)),
+        annotated=(_parse_time(args, 'annotated_from'), _parse_time(args, 'annotated_to', end=True)),
+        sort=sort,
+        descending=order == 'desc',
+        limit=min(limit or DEFAULT_QUERY_LIMIT, MAX_QUERY_LIMIT)
+    )
+    cursor = args.get('cursor')
+    if cursor:
+        query.after = query.decode_cursor(cursor)
+    return query
+
+def get_catalog(storage, annotations_dir, is_image, idle_seconds=None):
+    """获取（按需构建）图像存储和标注目录对应的统计索引，超过 idle_seconds 未使用的索引会被释放"""
+    key = (storage.location, os.path.abspath(annotations_dir))
+    return _catalogs.get(key, lambda: Catalog(storage, annotations_dir, is_image), idle_seconds)
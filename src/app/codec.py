@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+JSON 编解码
+
+安装了 orjson 时使用 orjson，否则使用标准库 json。默认输出紧凑格式（标注文件、
+索引、导出片段、API 响应），只有面向用户查看的下载才使用缩进格式。
+大型导出文件可用 iter_object_items / iter_export_annotations 按图像逐个解析，
+不需要把整个文件读入内存。
+"""
+
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _reject_constant(name):
+    raise ValueError(f"JSON 不支持的数值: {name}")
+
+
+# 标准库默认接受 NaN / Infinity / -Infinity，orjson 拒绝；两条路径统一拒绝
+_decoder = json.JSONDecoder(parse_constant=_reject_constant)
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+def codec_name():
+    """当前使用的 JSON 库"""
+    return 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj, pretty=False, sort_keys=False, default=None):
+    """
+    序列化为 UTF-8 字节；pretty 为 True 时使用两个空格缩进
+
+    NaN / Infinity 不是合法的 JSON：orjson 输出 null，标准库抛出 ValueError，
+    都不会写出 loads 无法读回的文件（标注坐标在校验时已要求为有限数）。
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            # orjson 不支持的值（如超过64位的整数）交给标准库处理
+            pass
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=default,
+                          allow_nan=False)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys, default=default,
+                          allow_nan=False)
+    return text.encode('utf-8')
+
+
+def dumps_text(obj, pretty=False, sort_keys=False):
+    """序列化为字符串"""
+    return dumps(obj, pretty, sort_keys).decode('utf-8')
+
+
+def loads(data):
+    """解析 bytes 或 str；格式错误（包括 NaN / Infinity）时抛出 ValueError（json.JSONDecodeError）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data, parse_constant=_reject_constant)
+
+
+def load(f):
+    """解析已打开的文件"""
+    return loads(f.read())
+
+
+class _StreamReader:
+    """按块读取文本，供逐个解析 JSON 值"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.largest = 0
+
+    def fill(self, size=None):
+        """读入下一块，文件结束时返回False"""
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符（文件结束时为空字符串）"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"JSON 格式错误：期望 {chars!r}，实际为 {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        解析下一个完整的 JSON 值
+
+        缓冲区不足时继续读取后重新解析。读取前先按已解析过的最大值预读，
+        导出文件中各图像的标注大小相近，通常一次即可解析成功。
+        """
+        self.peek()
+        if len(self.buffer) - self.pos < self.largest:
+            self.fill(self.largest)
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buffer, self.pos)
+                # 数字等值可能恰好在块边界被截断，其后必须还有字符或已到文件末尾
+                if end < len(self.buffer) or self.eof:
+                    self.largest = max(self.largest, end - self.pos)
+                    self.pos = end
+                    return obj
+            except ValueError:
+                if self.eof:
+                    raise
+            # 每次重试读取量加倍，避免大值被反复从头解析
+            self.fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def iter_object_items(f, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    流式读取顶层对象中 key 对应的对象，逐个产出 (成员名, 值)
+
+    f 为以文本方式打开的文件；同一时间只有一个成员的值在内存中，
+    其他顶层字段被解析后丢弃。
+    """
+    reader = _StreamReader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '{':
+            reader.expect('{')
+            if reader.peek() != '}':
+                while True:
+                    member = reader.value()
+                    reader.expect(':')
+                    yield member, reader.value()
+                    if reader.expect(',}') == '}':
+                        break
+            else:
+                reader.expect('}')
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+def iter_export_annotations(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """流式读取导出文件，逐个产出 (图像ID, 标注列表)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_object_items(f, 'annotations', chunk_size)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask 的 JSON 序列化（jsonify 等）使用同一编解码器"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+协同标注：同一图像的多人实时编辑
+
+每个正在编辑的图像在内存中保存一份权威状态（按标注ID索引，每个标注带修订号），
+客户端提交细粒度操作（add / update / delete），服务器合并后通过事件总线的
+图像频道广播给其他标注者。状态按固定间隔快照写入标注文件，而不是每次编辑都写盘。
+"""
+
+import uuid
+import copy
+import threading
+import logging
+from datetime import datetime
+from flask import current_app
+
+from app.events import bus
+from app.models import load_annotations, save_annotations, get_annotations_dir
+from app.projects import current_project, use_project
+from app.validation import MAX_ID_LENGTH
+
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def new_annotation_id():
+    """生成标注ID"""
+    return uuid.uuid4().hex[:16]
+
+
+def frame_channel(image_id, project=None):
+    """图像对应的事件总线频道（不同项目的同名图像互不影响）"""
+    return f"frame:{(project or current_project()).name}:{image_id}"
+
+
+class FrameSession:
+    """单个图像的协同编辑状态"""
+
+    def __init__(self, app, project, key, image_id, annotations, snapshot_interval):
+        self.app = app
+        self.project = project
+        self.key = key
+        self.image_id = image_id
+        self.channel = frame_channel(image_id, project)
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()   # 保证快照按顺序写入
+        self.order = []        # 标注ID，保持列表顺序
+        self.items = {}        # 标注ID -> 标注
+        self.revs = {}         # 标注ID -> 修订号
+        self.version = 0       # 每个已应用的操作递增
+        self.dirty = False
+        self.timer = None
+        self.clients = 0
+        self.released = False  # 已从 _sessions 移除，不再接受操作
+        self._load(annotations)
+
+    def _load(self, annotations):
+        """载入标注列表，为缺少ID的旧标注分配ID（调用方持有锁或在初始化中）"""
+        self.order = []
+        self.items = {}
+        self.revs = {}
+        for annotation in annotations:
+            annotation = dict(annotation)
+            annotation_id = annotation.get('id')
+            if not isinstance(annotation_id, str) or not annotation_id or annotation_id in self.items:
+                annotation_id = annotation['id'] = new_annotation_id()
+                self.dirty = True
+            self.order.append(annotation_id)
+            self.items[annotation_id] = annotation
+            self.revs[annotation_id] = 1
+
+    def _annotations(self):
+        return [self.items[annotation_id] for annotation_id in self.order]
+
+    def state(self):
+        """当前完整状态（新连接的客户端以此为准）"""
+        with self.lock:
+            return {
+                'image_id': self.image_id,
+                'version': self.version,
+                'annotations': copy.deepcopy(self._annotations()),
+                'revs': dict(self.revs)
+            }
+
+    def apply(self, ops, client_id=None, validator=None):
+        """
+        应用一批操作并广播，返回每个操作的结果
+
+        update 只提交变化的字段（值为 null 表示删除该字段），服务器在当前状态上
+        合并：并发修改不同字段时双方的修改都保留，修改同一字段时后到者生效。base_rev 与当前修订号
+        不一致时结果状态为 merged。给出 validator（app.validation.AnnotationValidator）时，
+        新增和合并后的标注未通过校验的操作被拒绝，状态保持不变。
+        会话已被释放时返回 None，调用方应重新获取会话（见 apply_ops）。
+        """
+        results = []
+        broadcasts = []
+        with self.lock:
+            if self.released:
+                return None
+            for op in ops:
+                result = self._apply_op(op, validator)
+                results.append(result)
+                if result['status'] in ('applied', 'merged'):
+                    self.version += 1
+                    result['version'] = self.version
+                    broadcasts.append(dict(result, op=op.get('op'), client_id=client_id))
+            if broadcasts:
+                self.dirty = True
+                self._schedule_snapshot()
+            version = self.version
+
+        for message in broadcasts:
+            bus.publish('op', message, channel=self.channel)
+        return version, results
+
+    def _apply_op(self, op, validator=None):
+        """应用单个操作（调用方持有锁）"""
+        kind = op.get('op')
+        annotation_id = op.get('id')
+        if annotation_id is not None and (not isinstance(annotation_id, str) or len(annotation_id) > MAX_ID_LENGTH):
+            return {'status': 'rejected', 'id': annotation_id, 'error': 'invalid id'}
+
+        if kind == 'add':
+            annotation = op.get('annotation')
+            if not isinstance(annotation, dict):
+                return {'status': 'rejected', 'id': annotation_id, 'error': 'missing annotation'}
+            annotation_id = annotation_id or annotation.get('id') or new_annotation_id()
+            if annotation_id in self.items:
+                # 重发的 add（如请求超时后重试）按更新处理
+                return self._update(annotation_id, annotation, op.get('base_rev'), validator)
+
+            annotation = dict(annotation, id=annotation_id, timestamp=datetime.now().isoformat())
+            if validator is not None:
+                if len(self.order) >= validator.max_annotations:
+                    return {'status': 'rejected', 'id': annotation_id, 'error': 'too many annotations',
+                            'errors': [{'index': None, 'field': 'annotations', 'code': 'too_many_annotations',
+                                        'limit': validator.max_annotations, 'actual': len(self.order) + 1}]}
+                errors = validator.validate_one(annotation)
+                if errors:
+                    return {'status': 'rejected', 'id': annotation_id, 'error': 'invalid annotation', 'errors': errors}
+            index = op.get('index')
+            if not isinstance(index, int) or not 0 <= index <= len(self.order):
+                index = len(self.order)
+            self.order.insert(index, annotation_id)
+            self.items[annotation_id] = annotation
+            self.revs[annotation_id] = 1
+            return {'status': 'applied', 'id': annotation_id, 'rev': 1, 'index': index,
+                    'annotation': copy.deepcopy(annotation)}
+
+        if kind == 'update':
+            if annotation_id not in self.items:
+                return {'status': 'gone', 'id': annotation_id}
+            changes = op.get('changes')
+            if not isinstance(changes, dict):
+                return {'status': 'rejected', 'id': annotation_id, 'error': 'missing changes'}
+            return self._update(annotation_id, changes, op.get('base_rev'), validator)
+
+        if kind == 'delete':
+            if annotation_id not in self.items:
+                # 已被其他人删除
+                return {'status': 'gone', 'id': annotation_id}
+            index = self.order.index(annotation_id)
+            del self.order[index]
+            del self.items[annotation_id]
+            rev = self.revs.pop(annotation_id) + 1
+            return {'status': 'applied', 'id': annotation_id, 'rev': rev, 'index': index}
+
+        return {'status': 'rejected', 'id': annotation_id, 'error': f'unknown op: {kind}'}
+
+    def _update(self, annotation_id, changes, base_rev, validator=None):
+        current_rev = self.revs[annotation_id]
+        annotation = dict(self.items[annotation_id])
+        for key, value in changes.items():
+            if key in ('id', 'timestamp'):
+                continue
+            if value is None:
+                annotation.pop(key, None)
+            else:
+                annotation[key] = value
+        annotation['timestamp'] = datetime.now().isoformat()
+        if validator is not None:
+            errors = validator.validate_one(annotation)
+            if errors:
+                return {'status': 'rejected', 'id': annotation_id, 'error': 'invalid annotation', 'errors': errors}
+        self.items[annotation_id] = annotation
+
+        rev = current_rev + 1
+        self.revs[annotation_id] = rev
+        status = 'applied' if base_rev in (None, current_rev) else 'merged'
+        return {'status': status, 'id': annotation_id, 'rev': rev,
+                'index': self.order.index(annotation_id), 'annotation': copy.deepcopy(annotation)}
+
+    def replace(self, annotations, client_id=None, source='save'):
+        """
+        整体替换（非协同客户端的整文档保存、恢复历史修订）
+
+        立即写入文件并向其他标注者广播 reset，使其与新状态同步。source 记入修订历史。
+        """
+        with self.lock:
+            self._load(annotations)
+            self.version += 1
+            self.dirty = True
+        count = self.snapshot(source)
+        self._publish_reset(client_id)
+        return count
+
+    def clear(self):
+        """标注文件被删除时清空状态（不写入文件）并广播 reset"""
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                self._load([])
+                self.version += 1
+                self.dirty = False
+        self._publish_reset()
+
+    def _publish_reset(self, client_id=None):
+        message = self.state()
+        message['client_id'] = client_id
+        bus.publish('reset', message, channel=self.channel)
+
+    def _schedule_snapshot(self):
+        """安排下一次快照（调用方持有锁）"""
+        if self.timer is not None:
+            return
+        self.timer = threading.Timer(self.snapshot_interval, self.snapshot)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def snapshot(self, source='collab'):
+        """将当前状态写入标注文件，返回标注数量；没有客户端时随后释放会话"""
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                if not self.dirty:
+                    count = len(self.order)
+                    annotations = None
+                else:
+                    annotations = copy.deepcopy(self._annotations())
+                    version = self.version
+                    self.dirty = False
+
+            if annotations is not None:
+                try:
+                    with self.app.app_context():
+                        # 快照可能在定时器线程中写入，需指定会话所属的项目
+                        use_project(self.project)
+                        count = save_annotations(self.image_id, annotations, touch=False, source=source)
+                except Exception as e:
+                    logger.error(f"协同标注快照失败 {self.image_id}: {e}")
+                    with self.lock:
+                        self.dirty = True
+                        self._schedule_snapshot()
+                    raise
+                logger.info(f"协同标注快照: {self.image_id} (版本 {version})")
+        self._release_if_idle()
+        return count
+
+    def _release_if_idle(self):
+        """没有客户端且状态已写入时从 _sessions 移除会话（仅由 POST 操作创建的会话也由此释放）"""
+        with _sessions_lock:
+            with self.lock:
+                if self.released or self.clients > 0 or self.dirty or self.timer is not None:
+                    return
+                self.released = True
+                if _sessions.get(self.key) is self:
+                    del _sessions[self.key]
+
+    def leave(self):
+        """客户端断开；最后一个客户端离开时写入快照并释放会话"""
+        with self.lock:
+            self.clients -= 1
+            idle = self.clients <= 0
+        if not idle:
+            return
+        try:
+            self.snapshot()
+        except Exception:
+            pass
+
+
+def _session_key(image_id):
+    return (get_annotations_dir(), image_id)
+
+
+def find_session(image_id):
+    """返回图像当前的协同会话（没有则为None）"""
+    with _sessions_lock:
+        return _sessions.get(_session_key(image_id))
+
+
+def get_session(image_id, join=False):
+    """获取（按需创建）图像的协同会话；join 为真时在同一把锁内登记一个客户端"""
+    key = _session_key(image_id)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = FrameSession(current_app._get_current_object(), current_project(), key, image_id,
+                                   load_annotations(image_id),
+                                   current_app.config.get('COLLAB_SNAPSHOT_SECONDS', 5))
+            _sessions[key] = session
+        if join:
+            # 与 _release_if_idle 同在 _sessions_lock 内，登记后的会话不会被释放
+            with session.lock:
+                session.clients += 1
+    return session
+
+
+def apply_ops(image_id, ops, client_id=None, validator=None):
+    """将操作应用到图像的协同会话；会话恰好在此期间被释放时换用新会话重试"""
+    while True:
+        session = get_session(image_id)
+        applied = session.apply(ops, client_id, validator)
+        if applied is not None:
+            # 全部被拒绝时没有待写入的快照，无客户端的会话在此释放
+            session._release_if_idle()
+            return applied
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+蜂格标注列式导出（Parquet / Arrow IPC）
+"""
+
+import os
+import math
+from datetime import datetime, timezone
+import logging
+
+from app.models import get_annotations_dir, get_exports_dir
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COLUMNAR_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+
+def columnar_available():
+    """检查是否安装了pyarrow"""
+    return pa is not None
+
+
+def get_schema():
+    """列式导出的表结构"""
+    return pa.schema([
+        ('image_id', pa.dictionary(pa.int32(), pa.string())),
+        ('annotation_index', pa.int32()),
+        ('class', pa.dictionary(pa.int8(), pa.string())),
+        ('type', pa.dictionary(pa.int8(), pa.string())),
+        ('center_x', pa.float64()),
+        ('center_y', pa.float64()),
+        ('radius', pa.float64()),
+        ('area', pa.float64()),
+        ('vertex_count', pa.int32()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _parse_timestamp(value):
+    """
+    解析ISO时间戳并换算为UTC，无法解析时返回None
+
+    带时区的时间按其偏移换算；不带时区的时间（本应用保存时写入的服务器本地时间）按本地时区换算。
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).astimezone(timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def annotation_geometry(annotation):
+    """计算标注的中心、半径、面积和顶点数"""
+    if annotation.get('type') == 'polygon':
+        points = annotation.get('points') or []
+        n = len(points)
+        if n == 0:
+            return None, None, None, 0.0, 0
+        xs = [float(p.get('x', 0)) for p in points]
+        ys = [float(p.get('y', 0)) for p in points]
+        # 与前端一致，中心取顶点均值
+        center_x = sum(xs) / n
+        center_y = sum(ys) / n
+        area = 0.0
+        for i in range(n):
+            j = (i + 1) % n
+            area += xs[i] * ys[j] - xs[j] * ys[i]
+        return center_x, center_y, None, abs(area) / 2.0, n
+
+    radius = annotation.get('radius')
+    radius = float(radius) if radius is not None else None
+    area = math.pi * radius * radius if radius is not None else 0.0
+    return float(annotation.get('x', 0)), float(annotation.get('y', 0)), radius, area, 0
+
+
+def iter_image_rows(annotations_dir):
+    """按图像分组逐个产出 (image_id, 行列表)，按image_id排序以利于谓词下推"""
+    if not os.path.exists(annotations_dir):
+        return
+
+    for filename in sorted(os.listdir(annotations_dir)):
+        if not filename.endswith('.json'):
+            continue
+        image_id = os.path.splitext(filename)[0]
+        annotation_path = os.path.join(annotations_dir, filename)
+        try:
+            with open(annotation_path, 'rb') as f:
+                annotations = codec.load(f)
+        except (OSError, ValueError):
+            logger.error(f"读取标注文件失败: {annotation_path}")
+            continue
+
+        rows = []
+        for index, annotation in enumerate(annotations):
+            center_x, center_y, radius, area, vertex_count = annotation_geometry(annotation)
+            rows.append({
+                'image_id': image_id,
+                'annotation_index': index,
+                'class': annotation.get('class', 'other'),
+                'type': annotation.get('type', 'circle'),
+                'center_x': center_x,
+                'center_y': center_y,
+                'radius': radius,
+                'area': area,
+                'vertex_count': vertex_count,
+                'timestamp': _parse_timestamp(annotation.get('timestamp')),
+            })
+        if rows:
+            yield image_id, rows
+
+
+def _rows_to_batch(rows, schema):
+    """将行列表转换为RecordBatch"""
+    columns = {name: [row[name] for row in rows] for name in schema.names}
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def export_columnar(fmt='parquet', row_group_size=None):
+    """
+    将所有标注展平为一张列式表并写入导出目录
+
+    按图像分组流式写入，每个行组只包含完整的图像分组，
+    内存占用受行组大小限制而非数据集大小。
+    """
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"不支持的列式格式: {fmt}")
+    if not columnar_available():
+        raise RuntimeError("列式导出需要安装 pyarrow")
+
+    row_group_size = row_group_size or DEFAULT_ROW_GROUP_SIZE
+    schema = get_schema()
+
+    exports_dir = get_exports_dir()
+    os.makedirs(exports_dir, exist_ok=True)
+    export_filename = f"bee_dataset_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{COLUMNAR_FORMATS[fmt]}"
+    export_path = os.path.join(exports_dir, export_filename)
+
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(export_path, schema, compression='zstd')
+        # 每批次作为一个行组写入，保证行组边界与图像分组对齐
+        write_batch = lambda batch: writer.write_table(pa.Table.from_batches([batch]),
+                                                       row_group_size=batch.num_rows)
+    else:
+        writer = pa.ipc.new_file(export_path, schema)
+        write_batch = writer.write_batch
+
+    total_rows = 0
+    buffered = []
+    try:
+        for _, rows in iter_image_rows(get_annotations_dir()):
+            buffered.extend(rows)
+            if len(buffered) >= row_group_size:
+                write_batch(_rows_to_batch(buffered, schema))
+                total_rows += len(buffered)
+                buffered = []
+        if buffered:
+            write_batch(_rows_to_batch(buffered, schema))
+            total_rows += len(buffered)
+    finally:
+        writer.close()
+
+    if total_rows == 0:
+        os.remove(export_path)
+        return None
+
+    logger.info(f"列式数据集已导出: {export_path} ({total_rows} 行)")
+    return export_path
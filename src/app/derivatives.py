@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+浏览副本：为标注页面生成的网页友好图像
+
+TIFF/BMP 等浏览器解码慢或无法显示的格式，以及长边超过限制的大图，转码为
+渐进式 JPEG 或 WebP 的缩小副本供标注页面显示；原图保留用于导出。
+副本已按 EXIF 方向旋转，前端按原图显示尺寸拉伸绘制，因此标注坐标
+始终是原图像素坐标，无需换算。原图通过存储后端（app.storage）读取。需要安装 Pillow。
+"""
+
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+DERIVATIVE_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp')
+}
+
+# 浏览器可直接高效显示的格式，未超过尺寸限制时不生成副本
+WEB_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}
+
+
+def derivatives_available():
+    """检查是否安装了Pillow"""
+    return Image is not None
+
+
+def derivative_path(derivatives_dir, filename, derivative_format='jpeg'):
+    """副本路径：<副本目录>/<原文件名>.<jpg|webp>（保留原扩展名避免同名冲突）"""
+    return os.path.join(derivatives_dir, filename + DERIVATIVE_FORMATS[derivative_format][0])
+
+
+def find_derivative(derivatives_dir, storage, filename, derivative_format='jpeg'):
+    """返回不早于原图的副本路径，不存在或已过期时返回None"""
+    path = derivative_path(derivatives_dir, filename, derivative_format)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    source = storage.stat(filename)
+    if source is not None and mtime_ns >= source.mtime_ns:
+        return path
+    return None
+
+
+def needs_derivative(metadata, max_edge):
+    """根据图像元数据判断是否需要浏览副本"""
+    if not metadata:
+        return False
+    return (metadata.get('format') not in WEB_FORMATS or
+            max(metadata['width'], metadata['height']) > max_edge)
+
+
+def build_derivative(source_path, target_path, max_edge, derivative_format='jpeg', quality=85):
+    """
+    生成单个副本，返回副本尺寸 (width, height)
+
+    先按EXIF方向旋转，再等比缩小到长边不超过 max_edge；写入临时文件后替换。
+    """
+    with Image.open(source_path) as image:
+        # 大图JPEG解码时直接按2的幂缩小，减少内存和时间
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.tmp"
+        if derivative_format == 'webp':
+            image.save(tmp_path, 'WEBP', quality=quality, method=4)
+        else:
+            image.save(tmp_path, 'JPEG', quality=quality, progressive=True, optimize=True)
+        os.replace(tmp_path, target_path)
+        return image.size
+
+
+def _build(storage, derivatives_dir, filename, max_edge, derivative_format, quality):
+    target_path = derivative_path(derivatives_dir, filename, derivative_format)
+    try:
+        source_path = storage.local_path(filename)
+        if source_path is None:
+            raise FileNotFoundError(filename)
+        size = build_derivative(source_path, target_path, max_edge, derivative_format, quality)
+        logger.info(f"已生成浏览副本: {target_path} {size[0]}x{size[1]}")
+        return target_path
+    except Exception as e:
+        logger.error(f"生成浏览副本失败 {filename}: {e}")
+        return None
+
+
+def _get_executor(max_workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='derivatives')
+        return _executor
+
+
+def schedule_derivatives(storage, derivatives_dir, metadata, max_edge,
+                         derivative_format='jpeg', quality=85, max_workers=2):
+    """
+    在后台线程池中为需要的图像生成副本
+
+    metadata 为 {文件名: 元数据}；已有最新副本或正在生成的图像会跳过。
+    返回新提交的任务 {文件名: Future}。
+    """
+    if not derivatives_available():
+        return {}
+
+    submitted = {}
+    executor = _get_executor(max_workers)
+    for filename, image_metadata in metadata.items():
+        if not needs_derivative(image_metadata, max_edge):
+            continue
+        if find_derivative(derivatives_dir, storage, filename, derivative_format):
+            continue
+        key = (os.path.abspath(derivatives_dir), filename)
+        with _executor_lock:
+            if key in _pending:
+                continue
+            future = executor.submit(_build, storage, derivatives_dir, filename,
+                                     max_edge, derivative_format, quality)
+            _pending[key] = future
+        future.add_done_callback(lambda _, key=key: _pending.pop(key, None))
+        submitted[filename] = future
+    return submitted
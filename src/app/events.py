@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+进程内事件总线与 Server-Sent Events 格式化
+"""
+
+import queue
+import threading
+import itertools
+import logging
+
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+# 每个订阅者最多积压的事件数，超出后丢弃最旧的事件
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class EventBus:
+    """发布/订阅：发布方不阻塞，每个订阅者一个有界队列"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel=None):
+        """订阅事件，channel 为 None 时接收全部频道"""
+        subscriber = (channel, queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data, channel=None):
+        """发布事件到指定频道（以及订阅了全部频道的订阅者）"""
+        message = (next(self._ids), event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscribed_channel, q in subscribers:
+            if subscribed_channel is not None and subscribed_channel != channel:
+                continue
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait(message)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+bus = EventBus()
+
+
+def format_sse(event, data, event_id=None):
+    """格式化为 text/event-stream 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {codec.dumps_text(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def iter_sse(subscriber, initial=(), keepalive=15):
+    """
+    逐条产出订阅者收到的事件
+
+    initial 为连接建立时先发送的 (event, data) 列表；空闲超过 keepalive 秒时
+    发送注释行保持连接。调用方关闭生成器时自动取消订阅。
+    """
+    try:
+        for event, data in initial:
+            yield format_sse(event, data)
+        while True:
+            try:
+                event_id, event, data = subscriber[1].get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(event, data, event_id)
+    finally:
+        bus.unsubscribe(subscriber)
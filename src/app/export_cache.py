@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+导出结果缓存：导出索引与逐图像序列化片段
+"""
+
+import os
+import tempfile
+import threading
+import logging
+
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+EXPORT_INDEX_FILENAME = 'export_index.json'
+FRAGMENTS_DIRNAME = '.fragments'
+
+_index_lock = threading.Lock()
+
+
+def _index_path(exports_dir):
+    return os.path.join(exports_dir, EXPORT_INDEX_FILENAME)
+
+
+def _write_atomic(path, content):
+    """
+    先写临时文件再替换，避免并发读取到半截文件
+
+    每次写入使用独立的临时文件（*.tmp），并发导出写同一文件时互不干扰。
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp',
+                                    dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_json_atomic(path, data):
+    _write_atomic(path, codec.dumps(data))
+
+
+def load_export_index(exports_dir):
+    """读取导出索引，返回导出记录列表（按创建时间升序）"""
+    index_path = _index_path(exports_dir)
+    if not os.path.exists(index_path):
+        return []
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return codec.load(f).get('exports', [])
+    except (OSError, ValueError):
+        logger.error(f"导出索引损坏，已忽略: {index_path}")
+        return []
+
+
+def record_export(exports_dir, record):
+    """追加一条导出记录"""
+    with _index_lock:
+        exports = load_export_index(exports_dir)
+        exports.append(record)
+        _write_json_atomic(_index_path(exports_dir), {'exports': exports})
+
+
+def find_cached_export(exports_dir, fingerprint, export_format, since=None):
+    """查找指纹、格式和增量基准都相同且文件仍存在的导出记录"""
+    for record in reversed(load_export_index(exports_dir)):
+        if record.get('fingerprint') != fingerprint or record.get('format') != export_format:
+            continue
+        if record.get('since') != since:
+            continue
+        if os.path.exists(os.path.join(exports_dir, record['filename'])):
+            return record
+    return None
+
+
+def find_export_record(exports_dir, export_id):
+    """按导出ID查找导出记录"""
+    for record in load_export_index(exports_dir):
+        if record.get('id') == export_id:
+            return record
+    return None
+
+
+def export_manifest_path(exports_dir, export_id):
+    return os.path.join(exports_dir, f"{export_id}.manifest.json")
+
+
+def save_export_manifest(exports_dir, export_id, manifest):
+    """保存导出清单（包含各图像修订号）"""
+    _write_json_atomic(export_manifest_path(exports_dir, export_id), manifest)
+
+
+def load_export_manifest(exports_dir, export_id):
+    """读取导出清单，不存在时返回None"""
+    path = export_manifest_path(exports_dir, export_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return codec.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _fragment_path(exports_dir, image_id, revision):
+    return os.path.join(exports_dir, FRAGMENTS_DIRNAME, f"{image_id}.{revision}.json")
+
+
+def load_fragment(exports_dir, image_id, revision):
+    """
+    读取已缓存的图像片段
+
+    片段文件第一行为元数据（标注数量、类别计数），其余为序列化后的标注列表。
+    """
+    path = _fragment_path(exports_dir, image_id, revision)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = codec.loads(f.readline())
+            body = f.read()
+        return meta, body
+    except (OSError, ValueError):
+        return None
+
+
+def save_fragment(exports_dir, image_id, revision, meta, body):
+    """缓存图像片段"""
+    fragments_dir = os.path.join(exports_dir, FRAGMENTS_DIRNAME)
+    os.makedirs(fragments_dir, exist_ok=True)
+
+    _write_atomic(_fragment_path(exports_dir, image_id, revision),
+                  codec.dumps(meta) + b'\n' + body.encode('utf-8'))
+
+
+def prune_fragments(exports_dir, revisions):
+    """删除不再对应当前修订号的片段（其他导出正在写入的临时文件除外）"""
+    fragments_dir = os.path.join(exports_dir, FRAGMENTS_DIRNAME)
+    if not os.path.exists(fragments_dir):
+        return
+
+    keep = {f"{image_id}.{revision}.json" for image_id, revision in revisions.items()}
+    for filename in os.listdir(fragments_dir):
+        if filename not in keep and not filename.endswith('.tmp'):
+            try:
+                os.remove(os.path.join(fragments_dir, filename))
+            except OSError:
+                pass
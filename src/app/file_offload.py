@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+文件发送卸载：由前端代理（nginx / lighttpd / Apache）直接发送文件
+
+FILE_OFFLOAD 为空时由 Flask 发送文件（支持 Range 请求）；为 x-sendfile 时响应中
+只包含 X-Sendfile 头（文件绝对路径），为 x-accel-redirect 时只包含
+X-Accel-Redirect 头（按 X_ACCEL_MAPPINGS 映射成 nginx internal location 的URI）。
+卸载模式下 Range、If-Modified-Since 等由代理处理，Python 进程不再读取文件内容。
+"""
+
+import os
+import mimetypes
+from urllib.parse import quote
+from flask import current_app, send_file
+import logging
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+
+
+def parse_accel_mappings(value):
+    """
+    解析 X_ACCEL_MAPPINGS："本地目录=/内部前缀,本地目录=/内部前缀"
+
+    返回按目录长度降序的 [(绝对目录, 前缀)]，较具体的目录优先匹配。
+    """
+    mappings = []
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        directory, prefix = item.split('=', 1)
+        directory, prefix = directory.strip(), prefix.strip()
+        if directory and prefix:
+            mappings.append((os.path.abspath(directory), '/' + prefix.strip('/')))
+    return sorted(mappings, key=lambda mapping: len(mapping[0]), reverse=True)
+
+
+def accel_redirect_uri(path, mappings):
+    """将文件路径映射为 internal location 的URI，没有匹配的目录时返回None"""
+    path = os.path.abspath(path)
+    for directory, prefix in mappings:
+        if path == directory or not path.startswith(directory + os.sep):
+            continue
+        rel_path = os.path.relpath(path, directory).replace(os.sep, '/')
+        return f"{prefix}/{quote(rel_path)}"
+    return None
+
+
+def send_file_offloaded(path, mimetype=None, as_attachment=False, download_name=None):
+    """按 FILE_OFFLOAD 配置发送文件"""
+    mode = (current_app.config.get('FILE_OFFLOAD') or '').lower()
+    path = os.path.abspath(path)
+
+    if mode == 'x-sendfile':
+        return _offload_response(path, 'X-Sendfile', path, mimetype, as_attachment, download_name)
+
+    if mode == 'x-accel-redirect':
+        mappings = parse_accel_mappings(current_app.config.get('X_ACCEL_MAPPINGS'))
+        uri = accel_redirect_uri(path, mappings)
+        if uri:
+            return _offload_response(path, 'X-Accel-Redirect', uri, mimetype, as_attachment, download_name)
+        logger.warning(f"X_ACCEL_MAPPINGS 中没有包含该文件的目录，改由应用发送: {path}")
+
+    return send_file(path, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name)
+
+
+def _offload_response(path, header, value, mimetype, as_attachment, download_name):
+    """只带内部重定向头的空响应，文件内容、长度和 Range 由代理处理"""
+    stat = os.stat(path)
+    filename = download_name or os.path.basename(path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    response = current_app.response_class(mimetype=mimetype)
+    response.headers[header] = value
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.last_modified = stat.st_mtime
+    if as_attachment:
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+标注修订历史
+
+每次保存（包括删除、协同快照和恢复）都记录为图像的一个修订，保存在标注目录的
+.history/<图像ID>/ 下：
+    index.jsonl          每个修订一行元数据（修订号、时间、来源、标注数、各类别数量、内容摘要）
+    <起始修订号>.jsonl    一个分段：第一行为完整快照，其后为相对上一修订的增量
+
+增量是标注列表的编辑序列：正整数表示保留上一修订中的若干个标注，负整数表示删除
+若干个，列表表示插入这些标注。整体保存会把所有标注的时间戳改为同一时间，此时
+比较时忽略时间戳，并在增量中单独记录统一的时间戳。
+
+每个分段最多 snapshot_interval 个修订，读取任意修订只需要读一个分段并应用不超过
+snapshot_interval - 1 个增量。超过 max_revisions 个修订或早于 max_days 天的旧分段
+整段删除（最新分段始终保留）。
+"""
+
+import os
+import time
+import hashlib
+import threading
+import logging
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIRNAME = '.history'
+INDEX_FILENAME = 'index.jsonl'
+
+DEFAULT_SNAPSHOT_INTERVAL = 20
+DEFAULT_MAX_REVISIONS = 200
+DEFAULT_MAX_DAYS = 90
+
+# 同一图像的写入串行进行（按图像ID分配锁）
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def content_revision(content):
+    """标注文件内容的摘要（与批量读取接口返回的 revision 一致）"""
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def _count_classes(annotations):
+    counts = {}
+    for annotation in annotations:
+        cls = annotation.get('class', 'other')
+        counts[cls] = counts.get(cls, 0) + 1
+    return counts
+
+
+def _uniform_timestamp(annotations):
+    """所有标注的时间戳相同时返回该时间戳，否则返回None"""
+    if not annotations or 'timestamp' not in annotations[0]:
+        return None
+    timestamp = annotations[0]['timestamp']
+    for annotation in annotations:
+        if annotation.get('timestamp', None) != timestamp or 'timestamp' not in annotation:
+            return None
+    return timestamp
+
+
+def _strip_timestamp(annotation):
+    return {key: value for key, value in annotation.items() if key != 'timestamp'}
+
+
+def make_delta(before, after):
+    """计算从 before 到 after 的增量记录（不含修订号）"""
+    timestamp = _uniform_timestamp(after)
+    if timestamp is not None:
+        before_keys = [codec.dumps(_strip_timestamp(a), sort_keys=True) for a in before]
+        after_items = [_strip_timestamp(a) for a in after]
+    else:
+        before_keys = [codec.dumps(a, sort_keys=True) for a in before]
+        after_items = after
+    after_keys = [codec.dumps(a, sort_keys=True) for a in after_items]
+
+    ops = []
+    matcher = SequenceMatcher(None, before_keys, after_keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append(after_items[j1:j2])
+
+    record = {'delta': ops}
+    if timestamp is not None:
+        record['ts'] = timestamp
+    return record
+
+
+def apply_delta(before, record):
+    """把增量记录应用到 before 上，返回新的标注列表"""
+    result = []
+    position = 0
+    for op in record['delta']:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(before[position:position + op])
+            position += op
+        else:
+            position -= op
+    timestamp = record.get('ts')
+    if timestamp is not None:
+        result = [dict(annotation, timestamp=timestamp) for annotation in result]
+    return result
+
+
+def diff_annotations(before, after):
+    """
+    比较两组标注，返回新增、删除和修改的标注
+
+    有ID的标注按ID对应，没有ID的标注按内容对应；只有时间戳不同的标注不算修改。
+    """
+    def keyed(annotations):
+        items = {}
+        for annotation in annotations:
+            key = annotation.get('id') or codec.dumps(_strip_timestamp(annotation), sort_keys=True).decode('utf-8')
+            items.setdefault(key, annotation)
+        return items
+
+    old, new = keyed(before), keyed(after)
+    added = [annotation for key, annotation in new.items() if key not in old]
+    removed = [annotation for key, annotation in old.items() if key not in new]
+    changed = [{'id': key, 'before': old[key], 'after': annotation}
+               for key, annotation in new.items()
+               if key in old and _strip_timestamp(old[key]) != _strip_timestamp(annotation)]
+
+    before_counts, after_counts = _count_classes(before), _count_classes(after)
+    class_changes = {cls: after_counts.get(cls, 0) - before_counts.get(cls, 0)
+                     for cls in sorted(set(before_counts) | set(after_counts))
+                     if after_counts.get(cls, 0) != before_counts.get(cls, 0)}
+    return {'added': added, 'removed': removed, 'changed': changed, 'class_changes': class_changes}
+
+
+class AnnotationHistory:
+    """一个标注目录下所有图像的修订历史"""
+
+    def __init__(self, root, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 max_revisions=DEFAULT_MAX_REVISIONS, max_days=DEFAULT_MAX_DAYS):
+        self.root = root
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.max_revisions = max_revisions
+        self.max_days = max_days
+
+    def _image_dir(self, image_id):
+        return os.path.join(self.root, image_id)
+
+    def _lock(self, image_id):
+        return _locks[hash((self.root, image_id)) % len(_locks)]
+
+    def _segments(self, image_dir):
+        """分段起始修订号（升序）"""
+        try:
+            names = os.listdir(image_dir)
+        except OSError:
+            return []
+        return sorted(int(name[:-6]) for name in names if name.endswith('.jsonl') and name[:-6].isdigit())
+
+    def _read_lines(self, path):
+        try:
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            if line.strip():
+                try:
+                    records.append(codec.loads(line))
+                except ValueError:
+                    # 写入中断留下的不完整行
+                    logger.error(f"修订历史记录损坏: {path}")
+        return records
+
+    def list(self, image_id):
+        """返回保留的修订元数据（按修订号升序）"""
+        return self._read_lines(os.path.join(self._image_dir(image_id), INDEX_FILENAME))
+
+    def record(self, image_id, previous, annotations, content, source='save'):
+        """
+        记录一个新修订，返回其元数据
+
+        previous 为保存前的文件内容（不存在时为None），content 为新写入的内容。
+        previous 与上一修订一致且增量小于完整内容时写增量，否则开始新的分段。
+        """
+        image_dir = self._image_dir(image_id)
+        with self._lock(image_id):
+            os.makedirs(image_dir, exist_ok=True)
+            index = self.list(image_id)
+            head = index[-1] if index else None
+            rev = head['rev'] + 1 if head else 1
+
+            entry = None
+            if previous is None:
+                previous = codec.dumps([])
+            if head and head['revision'] == content_revision(previous) \
+                    and rev - head['segment'] < self.snapshot_interval:
+                try:
+                    delta = make_delta(codec.loads(previous), annotations)
+                    encoded = codec.dumps(dict(delta, rev=rev))
+                    if len(encoded) < len(content):
+                        entry = (head['segment'], encoded)
+                except ValueError:
+                    pass
+            if entry is None:
+                entry = (rev, codec.dumps({'rev': rev, 'snapshot': annotations}))
+
+            segment, line = entry
+            with open(os.path.join(image_dir, f"{segment}.jsonl"), 'ab') as f:
+                f.write(line + b'\n')
+
+            meta = {
+                'rev': rev,
+                'at': datetime.now().isoformat(),
+                'source': source,
+                'count': len(annotations),
+                'classes': _count_classes(annotations),
+                'revision': content_revision(content),
+                'segment': segment,
+                'bytes': len(line)
+            }
+            with open(os.path.join(image_dir, INDEX_FILENAME), 'ab') as f:
+                f.write(codec.dumps(meta) + b'\n')
+
+            self._prune(image_dir, index + [meta])
+        return meta
+
+    def load(self, image_id, rev):
+        """重建指定修订的标注列表，修订不存在（或已超出保留范围）时返回None"""
+        image_dir = self._image_dir(image_id)
+        segments = [segment for segment in self._segments(image_dir) if segment <= rev]
+        if not segments:
+            return None
+
+        annotations = None
+        previous_rev = None
+        for record in self._read_lines(os.path.join(image_dir, f"{segments[-1]}.jsonl")):
+            if record['rev'] > rev:
+                break
+            if 'snapshot' in record:
+                annotations = record['snapshot']
+            elif annotations is not None and record['rev'] == previous_rev + 1:
+                annotations = apply_delta(annotations, record)
+            else:
+                # 增量链中断（记录损坏），之后的修订无法重建
+                annotations = None
+            previous_rev = record['rev']
+            if record['rev'] == rev:
+                return annotations
+        return None
+
+    def diff(self, image_id, from_rev, to_rev):
+        """比较两个修订，任一修订不存在时返回None"""
+        before = self.load(image_id, from_rev)
+        after = self.load(image_id, to_rev)
+        if before is None or after is None:
+            return None
+        return dict(diff_annotations(before, after), **{'from': from_rev, 'to': to_rev})
+
+    def _prune(self, image_dir, index):
+        """删除超出保留范围的旧分段（调用方持有锁）"""
+        segments = sorted({meta['segment'] for meta in index})
+        if len(segments) < 2:
+            return
+        head_rev = index[-1]['rev']
+        cutoff = time.time() - self.max_days * 86400 if self.max_days else None
+
+        removed = []
+        for segment, next_segment in zip(segments, segments[1:]):
+            # 删除后剩余修订仍不少于 max_revisions，或整个分段都早于保留期限
+            too_many = self.max_revisions and head_rev - next_segment + 1 >= self.max_revisions
+            path = os.path.join(image_dir, f"{segment}.jsonl")
+            too_old = cutoff is not None and os.path.getmtime(path) < cutoff
+            if not (too_many or too_old):
+                break
+            os.remove(path)
+            removed.append(segment)
+
+        if removed:
+            oldest = segments[len(removed)]
+            kept = [meta for meta in index if meta['rev'] >= oldest]
+            tmp_path = os.path.join(image_dir, f"{INDEX_FILENAME}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(codec.dumps(meta) + b'\n' for meta in kept))
+            os.replace(tmp_path, os.path.join(image_dir, INDEX_FILENAME))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+按访问时间淘汰的对象缓存（项目目录、统计索引、元数据缓存等按需载入的对象）
+"""
+
+import time
+import threading
+
+
+class IdleCache:
+    """
+    按键缓存对象
+
+    每次访问时释放超过 idle_seconds 未被访问的其他条目；idle_seconds 为
+    None 或 0 时不淘汰。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}   # key -> [value, last_used]
+        self.building = {}  # key -> 创建锁，同一键只创建一次
+
+    def get(self, key, factory, idle_seconds=None):
+        """
+        返回键对应的对象，不存在时调用 factory() 创建
+
+        factory() 在全局锁之外执行（如重建统计索引要读取所有标注文件），
+        创建期间只有请求同一键的线程等待，其他键的访问不受影响。
+        """
+        now = time.monotonic()
+        with self.lock:
+            if idle_seconds:
+                for stale in [k for k, (_, used) in self.entries.items()
+                              if k != key and now - used > idle_seconds]:
+                    del self.entries[stale]
+
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[1] = now
+                return entry[0]
+            build_lock = self.building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # 等待期间可能已由其他线程创建
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry[1] = time.monotonic()
+                    return entry[0]
+            try:
+                value = factory()
+                with self.lock:
+                    self.entries[key] = [value, time.monotonic()]
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+            return value
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+图像元数据：尺寸、EXIF方向、拍摄时间和相机型号
+
+只读取文件头（JPEG/TIFF 的 EXIF、PNG 的 IHDR、BMP 的信息头），不解码像素。
+其他格式在安装了 Pillow 时由 Pillow 读取（同样只解析文件头）。
+结果按 (mtime_ns, size) 缓存在元数据文件中，图像未变化时不再重复读取；
+新条目追加到日志文件，上传时不重写整个缓存。图像通过存储后端（app.storage）
+访问，远程存储中未缓存的图像按 Range 请求只读取用到的文件头部分。
+"""
+
+import io
+import os
+import struct
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.idle_cache import IdleCache
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# EXIF 标签
+TAG_WIDTH = 0x0100
+TAG_HEIGHT = 0x0101
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+
+# TIFF 字段类型 -> 每个值的字节数
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8}
+
+# 方向 5-8 表示旋转90°，显示尺寸与存储尺寸宽高互换
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+# 日志行数超过条目数且不少于此值时合并回缓存文件
+COMPACT_MIN_LINES = 1000
+
+_stores = IdleCache()
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-metadata')
+
+
+def _read_ifd(f, base, offset, endian):
+    """读取一个 IFD，返回 {标签: 值}（只保留需要的标签）"""
+    f.seek(base + offset)
+    count_data = f.read(2)
+    if len(count_data) < 2:
+        return {}
+    entries = struct.unpack(f'{endian}H', count_data)[0]
+    table = f.read(entries * 12)
+
+    tags = {}
+    wanted = (TAG_WIDTH, TAG_HEIGHT, TAG_MAKE, TAG_MODEL, TAG_ORIENTATION,
+              TAG_DATETIME, TAG_EXIF_IFD, TAG_DATETIME_ORIGINAL)
+    for i in range(len(table) // 12):
+        tag, field_type, count = struct.unpack(f'{endian}HHI', table[i * 12:i * 12 + 8])
+        if tag not in wanted or field_type not in TIFF_TYPE_SIZES:
+            continue
+        raw = table[i * 12 + 8:i * 12 + 12]
+        size = TIFF_TYPE_SIZES[field_type] * count
+        if size > 4:
+            position = f.tell()
+            f.seek(base + struct.unpack(f'{endian}I', raw)[0])
+            raw = f.read(min(size, 256))
+            f.seek(position)
+
+        if field_type == 2:
+            tags[tag] = raw[:count].split(b'\0', 1)[0].decode('ascii', 'replace').strip()
+        elif field_type == 3:
+            tags[tag] = struct.unpack(f'{endian}H', raw[:2])[0]
+        elif field_type == 4:
+            tags[tag] = struct.unpack(f'{endian}I', raw[:4])[0]
+    return tags
+
+
+def _parse_tiff(f, base=0):
+    """解析 TIFF 结构（TIFF文件本身或 JPEG 中的 EXIF 段）"""
+    f.seek(base)
+    header = f.read(8)
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        return None
+    magic, ifd_offset = struct.unpack(f'{endian}HI', header[2:8])
+    if magic != 42:
+        return None
+
+    tags = _read_ifd(f, base, ifd_offset, endian)
+    if TAG_EXIF_IFD in tags:
+        exif_tags = _read_ifd(f, base, tags[TAG_EXIF_IFD], endian)
+        if TAG_DATETIME_ORIGINAL in exif_tags:
+            tags[TAG_DATETIME_ORIGINAL] = exif_tags[TAG_DATETIME_ORIGINAL]
+    return tags
+
+
+def _parse_jpeg(f):
+    """逐段扫描 JPEG 标记，直到图像数据开始（SOS）"""
+    width = height = None
+    tags = {}
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            break
+        length_data = f.read(2)
+        if len(length_data) < 2:
+            break
+        length = struct.unpack('>H', length_data)[0]
+        segment_start = f.tell()
+
+        if code == 0xE1 and not tags:
+            data = f.read(length - 2)
+            if data.startswith(b'Exif\0\0'):
+                tags = _parse_tiff(io.BytesIO(data[6:])) or {}
+        elif 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', f.read(5)[1:5])
+        f.seek(segment_start + length - 2)
+
+    if width is None:
+        return None
+    return width, height, tags
+
+
+def _from_header(f):
+    """按文件头识别格式并读取，返回 (format, width, height, tags) 或 None"""
+    signature = f.read(26)
+    if signature.startswith(b'\xff\xd8'):
+        parsed = _parse_jpeg(f)
+        if parsed:
+            return ('JPEG',) + parsed
+    elif signature.startswith(b'\x89PNG\r\n\x1a\n') and signature[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', signature[16:24])
+        return 'PNG', width, height, {}
+    elif signature.startswith(b'BM'):
+        header_size = struct.unpack('<I', signature[14:18])[0]
+        if header_size == 12:
+            width, height = struct.unpack('<HH', signature[18:22])
+        else:
+            width, height = struct.unpack('<ii', signature[18:26])
+        return 'BMP', width, abs(height), {}
+    elif signature[:4] in (b'II*\0', b'MM\0*'):
+        tags = _parse_tiff(f)
+        if tags and TAG_WIDTH in tags and TAG_HEIGHT in tags:
+            return 'TIFF', tags[TAG_WIDTH], tags[TAG_HEIGHT], tags
+    return None
+
+
+def _from_pillow(f):
+    """使用 Pillow 读取（Image.open 只解析文件头）"""
+    if Image is None:
+        return None
+    f.seek(0)
+    with Image.open(f) as image:
+        exif = image.getexif()
+        tags = dict(exif)
+        original = exif.get_ifd(TAG_EXIF_IFD).get(TAG_DATETIME_ORIGINAL)
+        if original:
+            tags[TAG_DATETIME_ORIGINAL] = original
+        return image.format, image.width, image.height, tags
+
+
+def _format_datetime(value):
+    """EXIF 时间 'YYYY:MM:DD HH:MM:SS' -> ISO 8601"""
+    if not isinstance(value, str) or len(value) < 19:
+        return None
+    date, _, time = value[:19].partition(' ')
+    if len(date) != 10:
+        return None
+    return f"{date.replace(':', '-')}T{time}"
+
+
+def _format_camera(tags):
+    make = str(tags.get(TAG_MAKE) or '').strip()
+    model = str(tags.get(TAG_MODEL) or '').strip()
+    if make and model.lower().startswith(make.lower()):
+        return model
+    return ' '.join(part for part in (make, model) if part) or None
+
+
+def read_image_metadata(source):
+    """
+    读取单个图像的元数据，source 为文件路径或可随机访问的二进制文件对象
+
+    width/height 为显示尺寸（已按EXIF方向旋转，与浏览器显示及标注坐标一致），
+    stored_width/stored_height 为文件中存储的像素尺寸。无法识别时返回None。
+    """
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                parsed = _from_header(f) or _from_pillow(f)
+        else:
+            parsed = _from_header(source) or _from_pillow(source)
+    except Exception as e:
+        logger.warning(f"读取图像元数据失败 {getattr(source, 'name', source)}: {e}")
+        return None
+    if not parsed:
+        return None
+
+    image_format, width, height, tags = parsed
+    orientation = tags.get(TAG_ORIENTATION) if isinstance(tags.get(TAG_ORIENTATION), int) else 1
+    if not 1 <= orientation <= 8:
+        orientation = 1
+    rotated = orientation in ROTATED_ORIENTATIONS
+
+    return {
+        'format': image_format,
+        'width': height if rotated else width,
+        'height': width if rotated else height,
+        'stored_width': width,
+        'stored_height': height,
+        'orientation': orientation,
+        'captured_at': _format_datetime(tags.get(TAG_DATETIME_ORIGINAL) or tags.get(TAG_DATETIME)),
+        'camera': _format_camera(tags)
+    }
+
+
+class MetadataStore:
+    """
+    元数据缓存文件 {文件名: 元数据}，按 (mtime_ns, size) 判断是否过期
+
+    新条目追加到日志文件（path + '.log'，每行一个条目），写入量只与新条目数有关；
+    日志行数超过条目数（且不少于 COMPACT_MIN_LINES）时合并回缓存文件并清空日志。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.log_lines = 0
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.entries = codec.load(f)
+            except (OSError, ValueError):
+                logger.error(f"图像元数据缓存损坏，将重新生成: {path}")
+        if self._replay_log():
+            # 上次追加被中断（最后一行不完整），合并后从空日志继续追加
+            with self.lock:
+                self._compact()
+
+    def _replay_log(self):
+        """按顺序应用日志中的条目，返回是否有无法解析的行"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return False
+        damaged = False
+        for line in lines:
+            try:
+                record = codec.loads(line)
+                self.entries[record.pop('filename')] = record
+                self.log_lines += 1
+            except (ValueError, KeyError, AttributeError):
+                damaged = True
+        return damaged
+
+    def lookup(self, filename, stat):
+        """返回未过期的缓存条目（元数据在 'metadata' 中），没有或已过期时返回None；stat 为 StorageObject"""
+        with self.lock:
+            entry = self.entries.get(filename)
+        if entry and entry.get('mtime_ns') == stat.mtime_ns and entry.get('size') == stat.size:
+            return entry
+        return None
+
+    def update(self, results):
+        """写入 {文件名: (stat, 元数据)}：追加到日志，日志过长时合并"""
+        with self.lock:
+            lines = []
+            for filename, (stat, metadata) in results.items():
+                entry = {
+                    'mtime_ns': stat.mtime_ns,
+                    'size': stat.size,
+                    'metadata': metadata
+                }
+                self.entries[filename] = entry
+                lines.append(codec.dumps(dict(entry, filename=filename)) + b'\n')
+            self.log_lines += len(lines)
+            if self.log_lines > max(COMPACT_MIN_LINES, len(self.entries)):
+                self._compact()
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.log_path, 'ab') as f:
+                f.write(b''.join(lines))
+
+    def _compact(self):
+        """将全部条目写入缓存文件（写临时文件后替换）并删除日志（调用方持有锁）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(self.path)}.", suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(codec.dumps(self.entries))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self.log_lines = 0
+
+
+def get_metadata_store(path, idle_seconds=None):
+    """获取（按需载入）元数据缓存，超过 idle_seconds 未使用的缓存会被释放"""
+    return _stores.get(os.path.abspath(path), lambda: MetadataStore(path), idle_seconds)
+
+
+def _read_stored(storage, filename):
+    """只读取文件头：本地文件直接打开，远程对象按 Range 读取（不下载整个对象）"""
+    try:
+        with storage.open(filename) as f:
+            return read_image_metadata(f)
+    except OSError as e:
+        logger.warning(f"读取图像元数据失败 {filename}: {e}")
+        return None
+
+
+def extract_metadata(storage, filenames, store, max_workers=8):
+    """
+    返回 {文件名: 元数据}，缓存中缺失或过期的条目并行读取后写回缓存
+
+    文件不存在时跳过；无法识别的图像对应值为None。
+    """
+    metadata = {}
+    missing = []
+    for filename in filenames:
+        stat = storage.stat(filename)
+        if stat is None:
+            continue
+        cached = store.lookup(filename, stat)
+        if cached is not None:
+            metadata[filename] = cached['metadata']
+        else:
+            missing.append((filename, stat))
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+            results = list(executor.map(lambda item: _read_stored(storage, item[0]), missing))
+        store.update({filename: (stat, result) for (filename, stat), result in zip(missing, results)})
+        metadata.update({filename: result for (filename, _), result in zip(missing, results)})
+        logger.info(f"已提取 {len(missing)} 个图像的元数据")
+
+    return metadata
+
+
+def extract_metadata_async(storage, filenames, store, max_workers=8):
+    """在后台线程中提取（上传后调用，不阻塞请求）"""
+    return _background.submit(extract_metadata, storage, filenames, store, max_workers)
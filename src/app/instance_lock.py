@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+单进程运行检查
+
+事件总线、协同会话、数据集目录（catalog）和首页统计都保存在进程内存中，
+多个工作进程（如 gunicorn --workers 2）各自维护一份，相互之间看不到对方的修改：
+协同操作只广播给同一进程的连接，两个进程的会话会互相覆盖快照。因此同一数据目录
+只能由一个进程提供服务（进程内多线程不受限制）。
+
+服务请求的进程在处理第一个请求时对锁文件加排他锁，锁被其他进程持有时拒绝服务。
+命令行脚本（不处理请求）不受影响。没有 fcntl 的平台（Windows）不做检查。
+"""
+
+import os
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_held = {}    # 锁文件绝对路径 -> (进程号, 文件对象)
+_lock = threading.Lock()
+
+
+class InstanceLockError(RuntimeError):
+    """锁文件已被另一个进程持有"""
+
+
+def acquire(path):
+    """
+    对 path 加排他锁（同一进程只加一次）
+
+    锁在进程退出时由操作系统释放。其他进程持有锁时抛出 InstanceLockError。
+    """
+    if fcntl is None or not path:
+        return
+    path = os.path.abspath(path)
+    pid = os.getpid()
+    with _lock:
+        held = _held.get(path)
+        if held is not None and held[0] == pid:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'a+')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.seek(0)
+            owner = handle.read().strip() or '?'
+            handle.close()
+            raise InstanceLockError(f"{path} 已被进程 {owner} 持有：同一数据目录只能由一个进程提供服务")
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(pid))
+        handle.flush()
+        _held[path] = (pid, handle)
+    logger.info(f"已获取实例锁 {path} (进程 {pid})")
+
+
+def init_instance_lock(app):
+    """注册请求钩子：处理请求的进程须持有 INSTANCE_LOCK_FILE（为空时不检查）"""
+    path = app.config.get('INSTANCE_LOCK_FILE')
+    if not path:
+        return
+
+    def check_instance_lock():
+        try:
+            acquire(path)
+        except InstanceLockError as e:
+            logger.error(f"拒绝服务: {e}")
+            return 'This data directory is served by another process; run a single worker (threads are fine).', 503
+
+    app.before_request(check_instance_lock)
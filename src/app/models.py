@@ -4,27 +4,126 @@
 """
 
 import os
-import json
+import io
 import csv
-import shutil
+import hashlib
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from flask import current_app
 import logging
 
+from app.revisions import get_annotation_revision, collect_revisions, dataset_fingerprint
+from app.spatial_index import save_index, load_index, query_index, remove_index
+from app.catalog import get_catalog, ImageQuery
+from app.image_metadata import get_metadata_store, extract_metadata, extract_metadata_async
+from app.derivatives import schedule_derivatives, find_derivative
+from app.events import bus
+from app.storage import get_storage
+from app.validation import AnnotationValidator
+from app.simplify import normalize_annotations
+from app.history import AnnotationHistory, HISTORY_DIRNAME
+from app import codec
+from app.projects import current_project, project_channel, get_idle_seconds
+from app.export_cache import (find_cached_export, find_export_record, record_export,
+                              load_fragment, save_fragment, prune_fragments, save_export_manifest,
+                              load_export_manifest)
+
 logger = logging.getLogger(__name__)
 
 # Configuration helpers
 def get_images_dir():
-    """Get images directory from Flask config"""
-    return current_app.config.get('IMAGES_DIR', 'data/images')
+    """Get images directory of the current project"""
+    return current_project().images_dir
 
 def get_annotations_dir():
-    """Get annotations directory from Flask config"""
-    return current_app.config.get('ANNOTATIONS_DIR', 'data/annotations')
+    """Get annotations directory of the current project"""
+    return current_project().annotations_dir
 
 def get_exports_dir():
-    """Get exports directory from Flask config"""
-    return current_app.config.get('EXPORTS_DIR', 'data/exports')
+    """Get exports directory of the current project"""
+    return current_project().exports_dir
+
+def get_cell_classes():
+    """Get cell classes of the current project (default: CELL_CLASSES)"""
+    from app.config import CELL_CLASSES  # Import here to avoid circular imports
+    return current_project().classes or CELL_CLASSES
+
+def get_spatial_cell_size():
+    """Get spatial index grid cell size (image pixels)"""
+    return current_app.config.get('SPATIAL_INDEX_CELL_SIZE', 128)
+
+def get_image_metadata_store():
+    """Get image metadata cache"""
+    return get_metadata_store(current_project().metadata_file, get_idle_seconds())
+
+def get_metadata_workers():
+    """Get number of parallel metadata readers"""
+    return current_app.config.get('IMAGE_METADATA_WORKERS', 8)
+
+def get_derivative_settings():
+    """Get web-optimized derivative (view copy) settings"""
+    config = current_app.config
+    return {
+        'derivatives_dir': current_project().derivatives_dir,
+        'max_edge': config.get('DERIVATIVE_MAX_EDGE', 4096),
+        'derivative_format': config.get('DERIVATIVE_FORMAT', 'jpeg'),
+        'quality': config.get('DERIVATIVE_QUALITY', 85),
+        'max_workers': config.get('DERIVATIVE_WORKERS', 2)
+    }
+
+def get_normalize_settings():
+    """Get save-time polygon simplification / coordinate quantization settings (None when disabled)"""
+    config = current_app.config
+    if not config.get('ANNOTATION_NORMALIZE', False):
+        return None
+    return {
+        'tolerance': config.get('ANNOTATION_SIMPLIFY_TOLERANCE', 0.5),
+        'precision': config.get('ANNOTATION_COORD_PRECISION', 2)
+    }
+
+def get_annotation_history():
+    """Get annotation revision history of the current project (None when disabled)"""
+    config = current_app.config
+    if not config.get('HISTORY_ENABLED', True):
+        return None
+    return AnnotationHistory(os.path.join(get_annotations_dir(), HISTORY_DIRNAME),
+                             snapshot_interval=config.get('HISTORY_SNAPSHOT_INTERVAL', 20),
+                             max_revisions=config.get('HISTORY_MAX_REVISIONS', 200),
+                             max_days=config.get('HISTORY_MAX_DAYS', 90))
+
+def get_storage_settings():
+    """Get image storage backend settings"""
+    config = current_app.config
+    return {
+        'backend': config.get('STORAGE_BACKEND', 'local'),
+        'endpoint': config.get('S3_ENDPOINT'),
+        'bucket': config.get('S3_BUCKET'),
+        'prefix': config.get('S3_PREFIX', ''),
+        'access_key': config.get('S3_ACCESS_KEY'),
+        'secret_key': config.get('S3_SECRET_KEY'),
+        'region': config.get('S3_REGION', 'us-east-1'),
+        'pool_size': config.get('S3_POOL_SIZE', 8),
+        'multipart_threshold': config.get('S3_MULTIPART_THRESHOLD_MB', 16) * 1024 * 1024,
+        'part_size': config.get('S3_PART_SIZE_MB', 8) * 1024 * 1024,
+        'max_workers': config.get('S3_MAX_WORKERS', 4),
+        'cache_dir': config.get('STORAGE_CACHE_DIR', 'data/storage_cache'),
+        'cache_max_bytes': config.get('STORAGE_CACHE_MB', 1024) * 1024 * 1024,
+        'list_ttl': config.get('STORAGE_LIST_TTL', 30)
+    }
+
+def get_image_storage():
+    """Get storage holding the current project's images (local upload dir or object store)"""
+    return get_storage(get_storage_settings(), get_upload_dir(), f"{current_project().name}/images/",
+                       get_idle_seconds())
+
+def get_annotation_storage():
+    """Get storage for annotation files (always local: spatial index, revisions and exports read them as files)"""
+    return get_storage({'backend': 'local'}, get_annotations_dir(), None, get_idle_seconds())
+
+def list_image_files():
+    """按文件名排序返回所有图像文件名"""
+    return sorted(obj.key for obj in get_image_storage().list() if allowed_file(obj.key))
 
 def get_allowed_extensions():
     """Get allowed file extensions"""
@@ -36,6 +135,10 @@ def get_upload_dir():
     images_dir = get_images_dir()
     legacy_uploads = 'data/uploads'
 
+    # Legacy folder only applies to the default project
+    if not current_project().is_default:
+        return images_dir
+
     # If legacy uploads directory exists and has files, use it
     if os.path.exists(legacy_uploads) and os.listdir(legacy_uploads):
         return legacy_uploads
@@ -54,23 +157,20 @@ def normalize_path(path):
 def copy_existing_images():
     """复制现有的蜂巢图像到上传文件夹"""
     source_imgs_dir = 'imgs'  # Legacy source directory
-    upload_dir = get_upload_dir()
+    storage = get_image_storage()
 
     if os.path.exists(source_imgs_dir):
         logger.info("复制现有蜂巢图像...")
         copied_count = 0
 
-        # 确保上传目录存在
-        os.makedirs(upload_dir, exist_ok=True)
-
         for filename in os.listdir(source_imgs_dir):
             if filename.endswith('.JPG') or filename.endswith('.jpg'):
                 src_path = os.path.join(source_imgs_dir, filename)
-                dst_path = os.path.join(upload_dir, filename)
                 
-                if not os.path.exists(dst_path):
+                if storage.stat(filename) is None:
                     try:
-                        shutil.copy2(src_path, dst_path)
+                        with open(src_path, 'rb') as f:
+                            storage.put(filename, f)
                         copied_count += 1
                     except Exception as e:
                         logger.error(f"复制文件失败 {filename}: {e}")
@@ -81,64 +181,64 @@ def copy_existing_images():
         logger.warning("未找到imgs文件夹")
         return 0
 
-def get_image_list(page=1, per_page=20):
-    """获取图像列表和统计信息（支持分页）"""
-    images = []
-    total_annotations = 0
-
+def _image_entries(rows):
+    """统计索引的查询结果转换为页面使用的图像条目，并附加元数据"""
+    project = current_project()
     upload_dir = get_upload_dir()
-    annotations_dir = get_annotations_dir()
-
-    if not os.path.exists(upload_dir):
-        return images, {'total_images': 0, 'annotated_images': 0, 'total_annotations': 0}, {}
-
-    for filename in os.listdir(upload_dir):
-        if allowed_file(filename):
-            # Use relative path based on actual directory
-            if 'uploads' in upload_dir:
-                image_path = normalize_path(os.path.join('uploads', filename))
-            else:
-                image_path = normalize_path(os.path.join('images', filename))
-            image_id = os.path.splitext(filename)[0]
-
-            # 检查是否有对应的标注
-            annotation_path = os.path.join(annotations_dir, f"{image_id}.json")
-            annotation_count = 0
-            
-            if os.path.exists(annotation_path):
-                try:
-                    with open(annotation_path, 'r', encoding='utf-8') as f:
-                        annotations = json.load(f)
-                        annotation_count = len(annotations)
-                        total_annotations += annotation_count
-                except:
-                    pass
-            
-            images.append({
-                'id': image_id,
-                'path': image_path,
-                'filename': filename,
-                'annotation_count': annotation_count,
-                'has_annotation': annotation_count > 0
-            })
-    
-    # 按标注数量排序（已标注的在前）
-    images.sort(key=lambda x: (-x['annotation_count'], x['filename']))
-    
-    # 计算分页信息
-    total_images = len(images)
-    total_pages = (total_images + per_page - 1) // per_page  # 向上取整
+    images = []
+    for row in rows:
+        filename = row['filename']
+        # Use relative path based on actual directory
+        if 'uploads' in upload_dir:
+            image_path = normalize_path(os.path.join('uploads', filename))
+        else:
+            image_path = normalize_path(os.path.join('images', filename))
+        if not project.is_default:
+            # 图像URL带上项目，避免不同项目的同名图像共用浏览器缓存
+            image_path = f"{image_path}?project={project.name}"
+
+        images.append({
+            'id': row['id'],
+            'path': image_path,
+            'filename': filename,
+            'annotation_count': row['annotation_count'],
+            'has_annotation': row['annotation_count'] > 0
+        })
+
+    # 附加图像元数据（尺寸、方向、拍摄时间、相机），缓存缺失时并行读取文件头
+    metadata = get_image_metadata([image['filename'] for image in images])
+    for image in images:
+        image['metadata'] = metadata.get(image['filename'])
+        image['width'] = image['metadata']['width'] if image['metadata'] else None
+        image['height'] = image['metadata']['height'] if image['metadata'] else None
+    return images
+
+def get_image_list(page=1, per_page=20, query=None):
+    """
+    获取图像列表和统计信息（支持筛选、排序和分页）
+
+    query 为 ImageQuery（默认按标注数量降序）；当前页直接从统计索引的有序列表中
+    切片得到，不读取标注文件。
+    """
+    catalog = get_dataset_catalog()
+
+    if query is None:
+        query = ImageQuery(sort='count', descending=True)
+    query.limit = per_page
+    rows, total_items, _ = catalog.query(query, offset=(page - 1) * per_page)
+    paginated_images = _image_entries(rows)
+
+    # 计算分页信息（按筛选后的数量）
+    total_pages = (total_items + per_page - 1) // per_page  # 向上取整
     start_idx = (page - 1) * per_page
     end_idx = start_idx + per_page
     
-    # 获取当前页的图像
-    paginated_images = images[start_idx:end_idx]
-    
-    # 统计信息
+    # 统计信息（整个数据集）
+    dataset_stats = catalog.stats(get_cell_classes().keys())
     stats = {
-        'total_images': total_images,
-        'annotated_images': len([img for img in images if img['has_annotation']]),
-        'total_annotations': total_annotations
+        'total_images': dataset_stats['total_images'],
+        'annotated_images': dataset_stats['annotated_images'],
+        'total_annotations': dataset_stats['total_annotations']
     }
     
     # 分页信息
@@ -146,119 +246,529 @@ def get_image_list(page=1, per_page=20):
         'page': page,
         'per_page': per_page,
         'total_pages': total_pages,
-        'total_items': total_images,
+        'total_items': total_items,
         'has_prev': page > 1,
         'has_next': page < total_pages,
         'prev_page': page - 1 if page > 1 else None,
         'next_page': page + 1 if page < total_pages else None,
-        'start_index': start_idx + 1,
-        'end_index': min(end_idx, total_images)
+        'start_index': start_idx + 1 if total_items else 0,
+        'end_index': min(end_idx, total_items)
     }
     
     return paginated_images, stats, pagination
 
+def get_image_navigation(image_id, query=None):
+    """
+    标注页面的图像及前后图像，返回 (当前图像, 导航信息)，图像不存在时返回 (None, None)
+
+    顺序与首页相同（默认按标注数量降序），在统计索引的有序列表中定位，
+    只读取这三张图像的元数据。
+    """
+    located = get_dataset_catalog().locate(query or ImageQuery(sort='count', descending=True), image_id)
+    if located is None:
+        return None, None
+    position, total, *rows = located
+    entries = iter(_image_entries([row for row in rows if row]))
+    prev_image, image_info, next_image = [next(entries) if row else None for row in rows]
+    return image_info, {
+        'total_images': total,
+        'current_position': position,
+        'prev_image': prev_image,
+        'next_image': next_image
+    }
+
+
+def get_image_metadata(filenames):
+    """返回 {文件名: 元数据}（见 app.image_metadata.read_image_metadata）"""
+    return extract_metadata(get_image_storage(), filenames, get_image_metadata_store(), get_metadata_workers())
+
+def schedule_image_processing(filenames):
+    """上传后在后台提取元数据，完成后为需要的图像生成浏览副本"""
+    storage = get_image_storage()
+    settings = get_derivative_settings()
+    future = extract_metadata_async(storage, filenames, get_image_metadata_store(), get_metadata_workers())
+
+    def on_metadata(done):
+        if done.exception() is None:
+            schedule_derivatives(storage, metadata=done.result(), **settings)
+
+    future.add_done_callback(on_metadata)
+    return future
+
+def schedule_image_derivatives(images):
+    """为图像列表条目（带 metadata）中需要的图像在后台生成浏览副本"""
+    return schedule_derivatives(get_image_storage(),
+                                metadata={image['filename']: image.get('metadata') for image in images},
+                                **get_derivative_settings())
+
+def find_image_derivative(filename):
+    """返回图像的最新浏览副本路径，没有时返回None"""
+    settings = get_derivative_settings()
+    return find_derivative(settings['derivatives_dir'], get_image_storage(), filename, settings['derivative_format'])
+
 def load_annotations(image_id):
     """加载指定图像的标注数据"""
+    try:
+        return codec.loads(get_annotation_storage().get(f"{image_id}.json"))
+    except FileNotFoundError:
+        return []
+    except ValueError:
+        logger.error(f"JSON解析错误: {image_id}.json")
+        return []
+
+def save_annotations(image_id, annotations, touch=True, normalize=True, source='save'):
+    """
+    保存标注数据，touch 为 False 时保留各标注已有的时间戳
+
+    启用 ANNOTATION_NORMALIZE 时先简化多边形并量化坐标（normalize 为 False 时跳过，
+    如调用方已自行处理）。每次保存记为一个修订，source 为修订来源
+    （save / collab / restore 等）。
+    """
     annotations_dir = get_annotations_dir()
-    annotation_path = os.path.join(annotations_dir, f"{image_id}.json")
-    
-    if os.path.exists(annotation_path):
-        try:
-            with open(annotation_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logger.error(f"JSON解析错误: {annotation_path}")
-            return []
-    
-    return []
+    storage = get_annotation_storage()
 
-def save_annotations(image_id, annotations):
-    """保存标注数据"""
-    annotations_dir = get_annotations_dir()
+    settings = get_normalize_settings() if normalize else None
+    if settings:
+        annotations, reduction = normalize_annotations(annotations, **settings)
+        if reduction['vertices_after'] < reduction['vertices_before']:
+            logger.debug(f"多边形简化 {image_id}: {reduction['vertices_before']} -> {reduction['vertices_after']} 个顶点")
 
-    # 确保annotations目录存在
-    os.makedirs(annotations_dir, exist_ok=True)
-
-    # 添加时间戳
+    # 添加时间戳（同一次保存使用同一时间）
+    now = datetime.now().isoformat()
     for annotation in annotations:
-        annotation['timestamp'] = datetime.now().isoformat()
+        if touch or 'timestamp' not in annotation:
+            annotation['timestamp'] = now
 
-    # 保存为JSON
-    json_path = os.path.join(annotations_dir, f"{image_id}.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(annotations, f, ensure_ascii=False, indent=2)
+    # 保存为JSON（紧凑格式），覆盖前取出旧内容作为修订增量的基准
+    history = get_annotation_history()
+    previous = _read_previous(storage, image_id) if history else None
+    content = codec.dumps(annotations)
+    storage.put(f"{image_id}.json", content)
+    if history:
+        _record_revision(history, image_id, previous, annotations, content, source)
 
     # 保存为CSV（扩展格式包含类别）
-    csv_path = os.path.join(annotations_dir, f"{image_id}.csv")
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['class', 'x', 'y', 'timestamp'])
-        for annotation in annotations:
-            writer.writerow([
-                annotation.get('class', 'other'),
-                annotation.get('x', 0),
-                annotation.get('y', 0),
-                annotation.get('timestamp', '')
-            ])
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(['class', 'x', 'y', 'timestamp'])
+    for annotation in annotations:
+        writer.writerow([
+            annotation.get('class', 'other'),
+            annotation.get('x', 0),
+            annotation.get('y', 0),
+            annotation.get('timestamp', '')
+        ])
+    storage.put(f"{image_id}.csv", buffer.getvalue().encode('utf-8'))
     
-    logger.info(f"标注已保存: {json_path}")
+    # 更新空间索引，供按视口查询
+    save_index(annotations_dir, image_id, annotations, get_spatial_cell_size())
+
+    # 增量更新统计索引并通知订阅者
+    before = get_dataset_stats()
+    counts = get_dataset_catalog().update_annotations(image_id, annotations)
+    _publish_annotation_change(image_id, before, counts)
+
+    logger.info(f"标注已保存: {image_id}.json")
     return len(annotations)
 
-def export_all_annotations():
-    """导出所有标注数据"""
-    from app.config import CELL_CLASSES  # Import here to avoid circular imports
+def _read_previous(storage, image_id):
+    try:
+        return storage.get(f"{image_id}.json")
+    except FileNotFoundError:
+        return None
 
+def _record_revision(history, image_id, previous, annotations, content, source):
+    """记录修订；失败时只记录日志，不影响保存"""
+    try:
+        history.record(image_id, previous, annotations, content, source)
+    except Exception as e:
+        logger.error(f"记录修订历史失败 {image_id}: {e}")
+
+def get_dataset_catalog():
+    """当前数据目录对应的统计索引"""
+    return get_catalog(get_image_storage(), get_annotations_dir(), allowed_file, get_idle_seconds())
+
+def get_dataset_stats():
+    """从统计索引读取统计信息（不扫描标注文件）"""
+    return get_dataset_catalog().stats(get_cell_classes().keys())
+
+def publish_stats(before=None):
+    """推送最新统计信息，before 为变更前的统计，用于计算增量"""
+    stats = get_dataset_stats()
+    if before:
+        stats['delta'] = {key: stats[key] - before[key]
+                          for key in ('total_images', 'annotated_images', 'total_annotations')}
+    bus.publish('stats', stats, channel=project_channel())
+
+def _publish_annotation_change(image_id, before, counts):
+    """推送单个图像标注数量变化及统计增量"""
+    previous_count, annotation_count = counts
+    bus.publish('annotations', {
+        'image_id': image_id,
+        'annotation_count': annotation_count,
+        'previous_count': previous_count
+    }, channel=project_channel())
+    publish_stats(before)
+
+def query_annotations(image_id, bbox=None):
+    """
+    按视口查询标注
+
+    返回 (下标列表, 标注列表, 标注总数, 修订号)；bbox为None时返回全部标注。
+    """
     annotations_dir = get_annotations_dir()
-    all_annotations = {}
-    total_count = 0
-    class_counts = {class_key: 0 for class_key in CELL_CLASSES.keys()}
+    annotations = load_annotations(image_id)
+    revision = get_annotation_revision(os.path.join(annotations_dir, f"{image_id}.json"))
+
+    if bbox is None:
+        indices = list(range(len(annotations)))
+    else:
+        index = load_index(annotations_dir, image_id, annotations, get_spatial_cell_size())
+        indices = query_index(index, bbox)
+
+    return indices, [annotations[i] for i in indices], len(annotations), revision
+
+def find_image_filename(image_id):
+    """按图像ID查找图像文件名（从统计索引，不列出存储），不存在时返回None"""
+    image = get_dataset_catalog().find_image(image_id)
+    return image.key if image else None
+
+def get_image_dimensions(image_id):
+    """
+    图像显示尺寸的元数据，图像不存在或无法识别时返回None
+
+    文件名、大小和修改时间取自统计索引，元数据缓存命中时不访问存储；
+    只有缓存缺失或过期（如刚上传）时才读取文件头。
+    """
+    image = get_dataset_catalog().find_image(image_id)
+    if image is None:
+        return None
+    cached = get_image_metadata_store().lookup(image.key, image) if image.size is not None else None
+    if cached is not None:
+        return cached['metadata']
+    return get_image_metadata([image.key]).get(image.key)
+
+def get_annotation_validator(image_id):
+    """保存前使用的标注校验器：类别为当前项目的类别，图像尺寸已知时检查坐标范围"""
+    config = current_app.config
+    metadata = get_image_dimensions(image_id)
+    return AnnotationValidator(
+        get_cell_classes().keys(),
+        width=metadata['width'] if metadata else None,
+        height=metadata['height'] if metadata else None,
+        max_annotations=config.get('ANNOTATION_MAX_COUNT', 20000),
+        max_vertices=config.get('ANNOTATION_MAX_VERTICES', 10000),
+        max_total_vertices=config.get('ANNOTATION_MAX_TOTAL_VERTICES', 200000)
+    )
+
+def list_image_ids():
+    """按ID排序返回所有图像ID"""
+    return sorted(os.path.splitext(filename)[0] for filename in list_image_files())
+
+def read_annotation_document(storage, image_id):
+    """
+    读取单个图像的标注文档
+
+    只读取一次文件，修订号由同一份内容计算（与 get_annotation_revision 一致）。
+    """
+    document = {'image_id': image_id, 'revision': None, 'annotation_count': 0, 'annotations': []}
+    if not image_id or os.path.basename(image_id) != image_id:
+        document['error'] = f"无效的图像ID: {image_id}"
+        return document
+
+    try:
+        content = storage.get(f"{image_id}.json")
+    except FileNotFoundError:
+        return document
+    except OSError as e:
+        document['error'] = str(e)
+        return document
+
+    try:
+        annotations = codec.loads(content)
+    except ValueError:
+        logger.error(f"JSON解析错误: {image_id}.json")
+        document['error'] = 'JSON解析错误'
+        return document
+
+    document['revision'] = hashlib.sha256(content).hexdigest()[:16]
+    document['annotation_count'] = len(annotations)
+    document['annotations'] = annotations
+    return document
+
+def iter_annotation_batch(image_ids, max_workers=8):
+    """用线程池并发读取多个图像的标注文档，按请求顺序逐个产出"""
+    storage = get_annotation_storage()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        yield from pool.map(partial(read_annotation_document, storage), image_ids)
+
+TOMBSTONES_FILENAME = '.tombstones.jsonl'
+
+def load_tombstones(annotations_dir):
+    """读取删除记录（墓碑）列表"""
+    tombstone_path = os.path.join(annotations_dir, TOMBSTONES_FILENAME)
+    tombstones = []
+    if not os.path.exists(tombstone_path):
+        return tombstones
+
+    with open(tombstone_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    tombstones.append(codec.loads(line))
+                except ValueError:
+                    logger.error(f"墓碑记录解析失败: {line}")
+    return tombstones
 
+def delete_annotations(image_id):
+    """删除指定图像的标注文件并记录墓碑，返回已删除的文件类型列表"""
+    annotations_dir = get_annotations_dir()
+    storage = get_annotation_storage()
+    history = get_annotation_history()
+    previous = _read_previous(storage, image_id) if history else None
+    deleted = storage.delete([f"{image_id}.json", f"{image_id}.csv"])
+    deleted_files = [os.path.splitext(key)[1][1:].upper() for key in deleted]
+
+    # 删除也记为一个（空的）修订，可从历史中恢复
+    if history and previous is not None:
+        _record_revision(history, image_id, previous, [], codec.dumps([]), 'delete')
+
+    remove_index(annotations_dir, image_id)
+
+    if deleted_files:
+        with open(os.path.join(annotations_dir, TOMBSTONES_FILENAME), 'a', encoding='utf-8') as f:
+            f.write(codec.dumps_text({'image_id': image_id, 'deleted_at': datetime.now().isoformat()}) + '\n')
+
+        before = get_dataset_stats()
+        counts = get_dataset_catalog().remove_annotations(image_id)
+        _publish_annotation_change(image_id, before, counts)
+        logger.info(f"标注已删除: {image_id}")
+
+    return deleted_files
+
+def _load_fragment_body(exports_dir, image_id, revisions):
+    """
+    第二遍读取片段；片段在两遍之间被并发导出清理时重新生成
+
+    重新生成时文件可能已被修改，此时写入当前内容并把 revisions 更新为实际的修订号
+    （清单记录的是导出文件中的内容）；文件已删除时写入空列表。
+    """
+    fragment = load_fragment(exports_dir, image_id, revisions[image_id])
+    if fragment is not None:
+        return fragment[1]
+
+    built = _build_fragment(get_annotation_storage(), image_id)
+    if built is None:
+        return '[]'
+    revision, meta, body = built
+    if revision != revisions[image_id]:
+        logger.warning(f"图像 {image_id} 在导出期间被修改，导出其当前内容")
+        revisions[image_id] = revision
+    save_fragment(exports_dir, image_id, revision, meta, body)
+    return body
+
+def _build_fragment(storage, image_id):
+    """读取单个标注文件并生成导出片段 (修订号, 元数据, 序列化文本)"""
+    try:
+        raw = storage.get(f"{image_id}.json")
+        annotations = codec.loads(raw)
+    except (OSError, ValueError):
+        logger.error(f"读取标注文件失败: {image_id}.json")
+        return None
+
+    class_counts = {}
+    for annotation in annotations:
+        class_key = annotation.get('class', 'other')
+        class_counts[class_key] = class_counts.get(class_key, 0) + 1
+
+    revision = hashlib.sha256(raw).hexdigest()[:16]
+    meta = {'count': len(annotations), 'class_counts': class_counts}
+    return revision, meta, codec.dumps_text(annotations)
+
+def _to_local_naive(moment):
+    """将带时区的时间转换为本地无时区时间，便于与文件时间比较"""
+    if moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def _resolve_delta(exports_dir, annotations_dir, since, revisions):
+    """
+    解析增量导出的起点
+
+    since 可以是导出ID（按修订号精确比较）或ISO时间戳（按文件修改时间和墓碑时间比较）。
+    返回 (基准导出记录或None, 变化的图像ID列表, 墓碑列表)。
+    """
+    tombstones = load_tombstones(annotations_dir)
+    base = find_export_record(exports_dir, since)
+
+    if base is not None:
+        manifest = load_export_manifest(exports_dir, since)
+        if manifest is None:
+            raise ValueError(f"导出清单不存在: {since}")
+        base_revisions = manifest.get('revisions', {})
+        changed = [image_id for image_id in sorted(revisions)
+                   if base_revisions.get(image_id) != revisions[image_id]]
+        deleted_at = {t['image_id']: t['deleted_at'] for t in tombstones}
+        deleted = [{'image_id': image_id, 'deleted_at': deleted_at.get(image_id)}
+                   for image_id in sorted(set(base_revisions) - set(revisions))]
+        return base, changed, deleted
+
+    try:
+        since_time = _to_local_naive(datetime.fromisoformat(since.replace('Z', '+00:00')))
+    except ValueError:
+        raise ValueError(f"无效的导出ID或时间戳: {since}")
+
+    since_ts = since_time.timestamp()
+    changed = [image_id for image_id in sorted(revisions)
+               if os.path.getmtime(os.path.join(annotations_dir, f"{image_id}.json")) > since_ts]
+
+    latest_deletions = {}
+    for tombstone in tombstones:
+        if tombstone['image_id'] in revisions:
+            continue
+        if _to_local_naive(datetime.fromisoformat(tombstone['deleted_at'])) > since_time:
+            latest_deletions[tombstone['image_id']] = tombstone
+    deleted = [latest_deletions[image_id] for image_id in sorted(latest_deletions)]
+
+    # 按时间戳导出时没有确定的基准快照，导出链从本次导出开始
+    return None, changed, deleted
+
+def export_all_annotations(since=None):
+    """
+    导出所有标注数据
+
+    导出文件携带数据集指纹；指纹相同的导出已存在时直接复用，
+    否则只重新序列化修订号发生变化的图像，其余图像复用缓存片段。
+
+    指定 since（导出ID或ISO时间戳）时生成增量导出：只包含此后新建或修改的图像，
+    删除的图像以墓碑形式列出，并附带从基准快照开始的导出链。
+    """
+    cell_classes = get_cell_classes()
+
+    annotations_dir = get_annotations_dir()
     if not os.path.exists(annotations_dir):
         return None
 
-    for filename in os.listdir(annotations_dir):
-        if filename.endswith('.json'):
-            image_id = os.path.splitext(filename)[0]
-            annotation_path = os.path.join(annotations_dir, filename)
-            
-            try:
-                with open(annotation_path, 'r', encoding='utf-8') as f:
-                    annotations = json.load(f)
-                    all_annotations[image_id] = annotations
-                    total_count += len(annotations)
-                    
-                    # 统计各类别数量
-                    for annotation in annotations:
-                        class_key = annotation.get('class', 'other')
-                        if class_key in class_counts:
-                            class_counts[class_key] += 1
-            except:
-                logger.error(f"读取标注文件失败: {annotation_path}")
-    
-    # 创建导出数据
-    export_data = {
-        'dataset_info': {
-            'export_time': datetime.now().isoformat(),
-            'total_images': len(all_annotations),
-            'total_annotations': total_count,
-            'class_distribution': class_counts,
-            'cell_classes': CELL_CLASSES
-        },
-        'annotations': all_annotations
-    }
-    
-    # 确保导出目录存在
     exports_dir = get_exports_dir()
     os.makedirs(exports_dir, exist_ok=True)
 
-    # 保存导出文件
-    export_filename = f"bee_dataset_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    export_path = os.path.join(exports_dir, export_filename)
-    
+    revisions = collect_revisions(annotations_dir)
+    fingerprint = dataset_fingerprint(revisions, salt=cell_classes)
+
+    cached = find_cached_export(exports_dir, fingerprint, 'json', since=since)
+    if cached:
+        logger.info(f"数据集未变化，复用已有导出: {cached['filename']}")
+        return os.path.join(exports_dir, cached['filename'])
+
+    base = None
+    tombstones = []
+    selected_ids = sorted(revisions)
+    if since:
+        base, selected_ids, tombstones = _resolve_delta(exports_dir, annotations_dir, since, revisions)
+
+    # 第一遍：确保每个图像都有对应当前修订号的片段，并汇总统计
+    image_ids = []
+    total_count = 0
+    reused_count = 0
+    class_counts = {class_key: 0 for class_key in cell_classes.keys()}
+
+    for image_id in selected_ids:
+        fragment = load_fragment(exports_dir, image_id, revisions[image_id])
+        if fragment is not None:
+            meta = fragment[0]
+            reused_count += 1
+        else:
+            built = _build_fragment(get_annotation_storage(), image_id)
+            if built is None:
+                continue
+            # 文件可能在计算修订号后被修改，以实际读取的内容为准
+            revisions[image_id], meta, body = built
+            save_fragment(exports_dir, image_id, revisions[image_id], meta, body)
+
+        image_ids.append(image_id)
+        total_count += meta['count']
+        for class_key, count in meta['class_counts'].items():
+            if class_key in class_counts:
+                class_counts[class_key] += count
+
+    # 未读取成功的图像不计入指纹
+    unreadable = set(selected_ids) - set(image_ids)
+    revisions = {image_id: revision for image_id, revision in revisions.items() if image_id not in unreadable}
+    fingerprint = dataset_fingerprint(revisions, salt=cell_classes)
+    export_time = datetime.now()
+    kind = 'delta' if since else 'full'
+    base_id = f"bee_dataset_{kind if since else 'export'}_{export_time.strftime('%Y%m%d_%H%M%S')}_{fingerprint[:8]}"
+    export_id = base_id
+    suffix = 1
+    # 同一秒内内容相同但增量基准不同的导出需要区分
+    while os.path.exists(os.path.join(exports_dir, f"{export_id}.json")):
+        export_id = f"{base_id}_{suffix}"
+        suffix += 1
+    export_path = os.path.join(exports_dir, f"{export_id}.json")
+
+    chain = [export_id]
+    if base is not None:
+        chain = (base.get('chain') or [base['id']]) + chain
+
+    dataset_info = {
+        'export_id': export_id,
+        'export_time': export_time.isoformat(),
+        'kind': kind,
+        'fingerprint': fingerprint,
+        'total_images': len(image_ids),
+        'total_annotations': total_count,
+        'class_distribution': class_counts,
+        'cell_classes': cell_classes
+    }
+    if since:
+        dataset_info.update({
+            'since': since,
+            'base_export_id': base['id'] if base else None,
+            'chain': chain,
+            'deleted_images': len(tombstones)
+        })
+
+    # 第二遍：按图像逐个拼接片段，每个图像占一行
     with open(export_path, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, ensure_ascii=False, indent=2)
-    
-    logger.info(f"数据集已导出: {export_path}")
+        f.write('{"dataset_info": ')
+        f.write(codec.dumps_text(dataset_info, pretty=True))
+        f.write(',\n"annotations": {')
+        for position, image_id in enumerate(image_ids):
+            body = _load_fragment_body(exports_dir, image_id, revisions)
+            f.write(',\n' if position else '\n')
+            f.write(codec.dumps_text(image_id))
+            f.write(': ')
+            f.write(body)
+        f.write('\n}')
+        if since:
+            f.write(',\n"tombstones": ')
+            f.write(codec.dumps_text(tombstones))
+        f.write('}\n')
+
+    # 清单始终记录完整数据集的修订号，后续增量可以以任意导出为基准
+    save_export_manifest(exports_dir, export_id, {
+        'export_id': export_id,
+        'kind': kind,
+        'chain': chain,
+        'revisions': revisions
+    })
+    record_export(exports_dir, {
+        'id': export_id,
+        'filename': os.path.basename(export_path),
+        'format': 'json',
+        'kind': kind,
+        'since': since,
+        'base_export_id': base['id'] if base else None,
+        'chain': chain,
+        'fingerprint': fingerprint,
+        'created': export_time.isoformat(),
+        'total_images': len(image_ids),
+        'total_annotations': total_count
+    })
+    prune_fragments(exports_dir, revisions)
+
+    logger.info(f"数据集已导出: {export_path}（复用 {reused_count}/{len(image_ids)} 个图像片段）")
     return export_path
 
 def get_annotation_file_path(image_id, file_type='csv'):
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+项目命名空间：每个项目有独立的图像目录、标注目录、导出目录、统计索引和类别集合
+
+默认项目使用配置中的 IMAGES_DIR / ANNOTATIONS_DIR / EXPORTS_DIR（兼容原有的单数据集部署）；
+其他项目位于 PROJECTS_DIR/<项目名>/ 下：
+
+    images/         图像
+    annotations/    标注
+    exports/        导出
+    derivatives/    浏览副本
+    project.json    可选：{"title": "...", "classes": {...}}（类别格式同 CELL_CLASSES）
+
+请求通过 ?project=<项目名> 或会话中保存的项目选择项目。项目只在首次访问时载入，
+长时间未访问的项目（及其统计索引等缓存）会被释放。
+"""
+
+import os
+import re
+import json
+import logging
+from flask import current_app, g, request, session, has_request_context
+
+from app.idle_cache import IdleCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROJECT = 'default'
+PROJECT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+PROJECT_FILE = 'project.json'
+
+_projects = IdleCache()
+
+
+class Project:
+    """一个项目的目录与类别设置"""
+
+    def __init__(self, name, images_dir, annotations_dir, exports_dir, derivatives_dir,
+                 metadata_file, title=None, classes=None, config_mtime=None):
+        self.name = name
+        self.images_dir = images_dir
+        self.annotations_dir = annotations_dir
+        self.exports_dir = exports_dir
+        self.derivatives_dir = derivatives_dir
+        self.metadata_file = metadata_file
+        self.title = title or name
+        self.classes = classes          # None 表示使用默认类别 CELL_CLASSES
+        self.config_mtime = config_mtime
+
+    @property
+    def is_default(self):
+        return self.name == DEFAULT_PROJECT
+
+    def to_dict(self):
+        return {'name': self.name, 'title': self.title, 'custom_classes': self.classes is not None}
+
+
+def get_projects_dir():
+    """Get projects root directory from Flask config"""
+    return current_app.config.get('PROJECTS_DIR', 'data/projects')
+
+
+def get_idle_seconds():
+    """Get idle time after which project caches are released"""
+    return current_app.config.get('PROJECT_IDLE_SECONDS', 1800)
+
+
+def _default_project():
+    config = current_app.config
+    return Project(DEFAULT_PROJECT,
+                   images_dir=config.get('IMAGES_DIR', 'data/images'),
+                   annotations_dir=config.get('ANNOTATIONS_DIR', 'data/annotations'),
+                   exports_dir=config.get('EXPORTS_DIR', 'data/exports'),
+                   derivatives_dir=config.get('DERIVATIVES_DIR', 'data/derivatives'),
+                   metadata_file=config.get('IMAGE_METADATA_FILE', 'data/image_metadata.json'))
+
+
+def _config_mtime(root):
+    try:
+        return os.stat(os.path.join(root, PROJECT_FILE)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_project(name, root):
+    """读取项目目录及 project.json"""
+    settings = {}
+    config_path = os.path.join(root, PROJECT_FILE)
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"项目配置无效，使用默认设置 {config_path}: {e}")
+
+    project = Project(name,
+                      images_dir=os.path.join(root, 'images'),
+                      annotations_dir=os.path.join(root, 'annotations'),
+                      exports_dir=os.path.join(root, 'exports'),
+                      derivatives_dir=os.path.join(root, 'derivatives'),
+                      metadata_file=os.path.join(root, 'image_metadata.json'),
+                      title=settings.get('title'),
+                      classes=settings.get('classes') or None,
+                      config_mtime=_config_mtime(root))
+    for directory in (project.images_dir, project.annotations_dir, project.exports_dir):
+        os.makedirs(directory, exist_ok=True)
+    logger.info(f"已载入项目: {name}")
+    return project
+
+
+def list_projects():
+    """列出所有项目（只列目录，不载入项目）"""
+    names = [DEFAULT_PROJECT]
+    projects_dir = get_projects_dir()
+    if os.path.isdir(projects_dir):
+        names.extend(sorted(name for name in os.listdir(projects_dir)
+                            if name != DEFAULT_PROJECT and PROJECT_NAME_PATTERN.match(name)
+                            and os.path.isdir(os.path.join(projects_dir, name))))
+    return names
+
+
+def load_project(name):
+    """按名称载入项目，不存在时返回None"""
+    if not name or name == DEFAULT_PROJECT:
+        return _default_project()
+    if not PROJECT_NAME_PATTERN.match(name):
+        return None
+
+    root = os.path.join(get_projects_dir(), name)
+    key = os.path.abspath(root)
+    if not os.path.isdir(root):
+        _projects.discard(key)
+        return None
+
+    project = _projects.get(key, lambda: _read_project(name, root), get_idle_seconds())
+    if project.config_mtime != _config_mtime(root):
+        # project.json 已修改
+        _projects.discard(key)
+        project = _projects.get(key, lambda: _read_project(name, root), get_idle_seconds())
+    return project
+
+
+def use_project(project):
+    """设置当前应用上下文使用的项目（后台线程中写入时使用）"""
+    g.project = project
+
+
+def current_project():
+    """当前请求的项目：?project= 参数优先，其次是会话中选择的项目，否则为默认项目"""
+    if 'project' in g:
+        return g.project
+
+    project = None
+    if has_request_context():
+        name = request.args.get('project') or session.get('project')
+        project = load_project(name)
+    if project is None:
+        project = _default_project()
+    g.project = project
+    return project
+
+
+def project_channel(project=None):
+    """项目的事件总线频道"""
+    return f"project:{(project or current_project()).name}"
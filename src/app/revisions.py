@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+标注文件修订号与数据集指纹
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+# 按 (mtime_ns, size) 缓存的文件摘要，避免重复读取未变化的标注文件
+_revision_cache = {}
+_revision_lock = threading.Lock()
+
+
+def get_annotation_revision(annotation_path):
+    """获取标注文件的修订号（内容sha256前16位），文件不存在时返回None"""
+    try:
+        stat = os.stat(annotation_path)
+    except OSError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _revision_lock:
+        cached = _revision_cache.get(annotation_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(annotation_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    revision = digest.hexdigest()[:16]
+
+    with _revision_lock:
+        _revision_cache[annotation_path] = (key, revision)
+    return revision
+
+
+def collect_revisions(annotations_dir):
+    """收集目录下所有标注文件的修订号 {image_id: revision}"""
+    revisions = {}
+    if not os.path.exists(annotations_dir):
+        return revisions
+
+    for filename in os.listdir(annotations_dir):
+        if filename.endswith('.json'):
+            image_id = os.path.splitext(filename)[0]
+            revision = get_annotation_revision(os.path.join(annotations_dir, filename))
+            if revision:
+                revisions[image_id] = revision
+    return revisions
+
+
+def merkle_root(leaves):
+    """计算叶子哈希列表的Merkle根"""
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def dataset_fingerprint(revisions, salt=None):
+    """
+    基于各图像修订号计算数据集指纹
+
+    salt 用于混入影响导出结果的其他配置（如类别定义）。
+    """
+    leaves = [
+        hashlib.sha256(f"{image_id}:{revision}".encode('utf-8')).hexdigest()
+        for image_id, revision in sorted(revisions.items())
+    ]
+    if salt is not None:
+        leaves.append(hashlib.sha256(json.dumps(salt, sort_keys=True).encode('utf-8')).hexdigest())
+    return merkle_root(leaves)
@@ -4,11 +4,25 @@
 """
 
 import os
-import json
-from flask import Blueprint, render_template, request, jsonify, send_file, flash, redirect, url_for, send_from_directory
+import bisect
+from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, Response, stream_with_context, abort
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.datastructures import MultiDict
 from app.config import *
-from app.models import get_image_list, load_annotations, save_annotations, export_all_annotations, get_upload_dir, get_images_dir, allowed_file, get_annotation_file_path
+from app.models import get_image_list, get_image_navigation, load_annotations, save_annotations, delete_annotations, query_annotations, export_all_annotations, get_upload_dir, get_images_dir, allowed_file, get_annotation_file_path, list_image_ids, iter_annotation_batch, get_dataset_catalog, get_dataset_stats, publish_stats, schedule_image_processing, schedule_image_derivatives, find_image_derivative, get_image_metadata, find_image_filename, get_cell_classes, get_image_storage, get_annotation_validator, get_annotation_history
+from app.projects import list_projects, load_project, use_project, current_project, project_channel
+from app.archive import iter_dataset_archive, ARCHIVE_ANNOTATION_FORMATS
+from app.spatial_index import parse_bbox
+from app.catalog import parse_image_query, ImageQuery
+from app.columnar import export_columnar, COLUMNAR_FORMATS
+from app.revisions import get_annotation_revision
+from app.service_worker import static_asset_manifest
+from app.file_offload import send_file_offloaded
+from app.events import bus, iter_sse
+from app import collab
+from app import codec
 from app.i18n import _, i18n
 import logging
 
@@ -17,17 +31,55 @@ logger = logging.getLogger(__name__)
 # 创建蓝图
 bp = Blueprint('main', __name__)
 
+@bp.before_request
+def select_project():
+    """按 ?project= 参数切换项目（并记入会话），未知项目返回404"""
+    from flask import session
+
+    name = request.args.get('project')
+    if name is None:
+        return
+    project = load_project(name)
+    if project is None:
+        abort(404)
+    session['project'] = project.name
+    use_project(project)
+
+@bp.app_context_processor
+def inject_projects():
+    """导航栏的项目切换菜单"""
+    return {'projects': list_projects(), 'current_project': current_project()}
+
 def get_localized_cell_classes():
     """Get cell classes with localized names"""
-    from app.config import CELL_CLASSES
     localized_classes = {}
-    for key, class_info in CELL_CLASSES.items():
+    for key, class_info in get_cell_classes().items():
         localized_info = class_info.copy()
-        localized_info['name'] = i18n.gettext(class_info['name_key'])
-        localized_info['description'] = i18n.gettext(class_info['description_key'])
+        # 项目自定义类别可直接给出名称和描述
+        if 'name_key' in class_info:
+            localized_info['name'] = i18n.gettext(class_info['name_key'])
+        if 'description_key' in class_info:
+            localized_info['description'] = i18n.gettext(class_info['description_key'])
+        localized_info.setdefault('name', key)
+        localized_info.setdefault('description', '')
         localized_classes[key] = localized_info
     return localized_classes
 
+def annotation_payload_error():
+    """请求体超过 ANNOTATION_MAX_PAYLOAD_MB 时返回结构化错误（在解析JSON之前检查）"""
+    limit = int(current_app.config.get('ANNOTATION_MAX_PAYLOAD_MB', 4) * 1024 * 1024)
+    if request.content_length is not None and request.content_length > limit:
+        return {
+            'success': False,
+            'error': _('validation.payload_too_large'),
+            'errors': [{'index': None, 'field': None, 'code': 'payload_too_large',
+                        'limit': limit, 'actual': request.content_length}]
+        }
+    return None
+
+# 首页支持的筛选和排序参数（见 parse_image_query）
+INDEX_FILTERS = ('search', 'class', 'status', 'sort', 'order')
+
 @bp.route('/')
 def index():
     """Home page: display image list with pagination"""
@@ -44,15 +96,25 @@ def index():
     
     # 限制每页数量
     per_page = min(per_page, 50)  # 最多50张/页
+
+    # 文件名搜索、类别和状态筛选、排序（默认按标注数量降序），翻页链接带上这些参数
+    filters = {key: request.args.get(key) for key in INDEX_FILTERS if request.args.get(key)}
+    try:
+        query = parse_image_query(MultiDict(dict({'sort': 'count'}, **filters)), get_cell_classes().keys())
+    except ValueError as e:
+        flash(str(e), 'warning')
+        filters = {}
+        query = ImageQuery(sort='count', descending=True)
     
     # 获取图像列表和统计信息
-    images, stats, pagination = get_image_list(page=page, per_page=per_page)
+    images, stats, pagination = get_image_list(page=page, per_page=per_page, query=query)
     
     return render_template('index.html', 
                          images=images, 
                          stats=stats,
                          pagination=pagination,
                          per_page=per_page,
+                         filters=filters,
                          annotated_count=stats['annotated_images'],
                          copied_count=copied_count,
                          cell_classes=get_localized_cell_classes())
@@ -60,40 +122,23 @@ def index():
 @bp.route('/annotate/<image_id>')
 def annotate(image_id):
     """Annotation page"""
-    # 获取图像信息（不分页，获取所有）
-    images, _, _ = get_image_list(page=1, per_page=9999)
-    image_info = None
-    current_index = -1
-    
-    # 找到当前图像和其在列表中的位置
-    for i, img in enumerate(images):
-        if img['id'] == image_id:
-            image_info = img
-            current_index = i
-            break
-    
+    # 当前图像及前后图像（从统计索引定位，只读取这三张图像的元数据）
+    image_info, navigation_info = get_image_navigation(image_id)
     if not image_info:
         flash(_('messages.image_not_found'), 'error')
         return redirect(url_for('main.index'))
+    prev_image = navigation_info['prev_image']
+    next_image = navigation_info['next_image']
     
-    # 确定上一张和下一张图像
-    prev_image = images[current_index - 1] if current_index > 0 else None
-    next_image = images[current_index + 1] if current_index < len(images) - 1 else None
-    
-    # 加载现有标注
-    annotations = load_annotations(image_id)
-    
-    # 导航信息
-    navigation_info = {
-        'total_images': len(images),
-        'current_position': current_index + 1,
-        'prev_image': prev_image,
-        'next_image': next_image
-    }
+    # 当前及相邻图像缺少浏览副本时在后台生成（下次打开时使用）
+    schedule_image_derivatives([img for img in (image_info, prev_image, next_image) if img])
+    derivative = find_image_derivative(image_info['filename'])
     
+    # 标注不再内联到页面，由前端按视口通过 /api/annotations 渐进加载
     return render_template('annotate.html',
                          image=image_info,
-                         annotations=annotations,
+                         annotation_revision=get_annotation_revision(get_annotation_file_path(image_id, 'json')),
+                         has_derivative=derivative is not None,
                          cell_classes=get_localized_cell_classes(),
                          navigation=navigation_info)
 
@@ -101,6 +146,10 @@ def annotate(image_id):
 def save_annotation():
     """Save annotation API"""
     try:
+        payload_error = annotation_payload_error()
+        if payload_error:
+            return jsonify(payload_error)
+
         data = request.get_json()
         
         if not data or 'image_id' not in data or 'annotations' not in data:
@@ -108,9 +157,19 @@ def save_annotation():
         
         image_id = data['image_id']
         annotations = data['annotations']
+
+        # 写入前校验结构、类别、坐标和数量上限，拒绝时返回每个问题标注的错误
+        errors = get_annotation_validator(image_id).validate(annotations)
+        if errors:
+            logger.warning(f"拒绝保存 {image_id}: {len(errors)} 个标注未通过校验，首个错误 {errors[0]}")
+            return jsonify({'success': False, 'error': _('validation.invalid_annotations'), 'errors': errors})
         
-        # 保存标注
-        count = save_annotations(image_id, annotations)
+        # 保存标注；有协同会话时替换会话状态并通知其他标注者
+        session = collab.find_session(image_id)
+        if session:
+            count = session.replace(annotations, data.get('client_id'))
+        else:
+            count = save_annotations(image_id, annotations)
         
         return jsonify({
             'success': True,
@@ -135,6 +194,181 @@ def load_annotation(image_id):
         logger.error(f"加载标注失败: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@bp.route('/api/annotations/<image_id>')
+def get_annotations(image_id):
+    """按视口加载标注API，bbox=x0,y0,x1,y1（图像坐标）"""
+    try:
+        bbox = request.args.get('bbox')
+        bbox = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        indices, annotations, total, revision = query_annotations(image_id, bbox)
+        return jsonify({
+            'success': True,
+            'image_id': image_id,
+            'indices': indices,
+            'annotations': annotations,
+            'total': total,
+            'revision': revision
+        })
+    except Exception as e:
+        logger.error(f"加载标注失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/annotations/<image_id>/revisions')
+def list_annotation_revisions(image_id):
+    """列出图像的标注修订（最新在前）"""
+    try:
+        history = get_annotation_history()
+        revisions = history.list(image_id) if history else []
+        return jsonify({'success': True, 'image_id': image_id, 'revisions': revisions[::-1]})
+    except Exception as e:
+        logger.error(f"加载修订历史失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/annotations/<image_id>/revisions/<int:rev>')
+def get_annotation_revision_api(image_id, rev):
+    """获取指定修订的标注"""
+    try:
+        history = get_annotation_history()
+        annotations = history.load(image_id, rev) if history else None
+        if annotations is None:
+            return jsonify({'success': False, 'error': _('messages.revision_not_found')}), 404
+        return jsonify({'success': True, 'image_id': image_id, 'rev': rev, 'annotations': annotations})
+    except Exception as e:
+        logger.error(f"加载修订失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/annotations/<image_id>/revisions/diff')
+def diff_annotation_revisions(image_id):
+    """比较两个修订，from 必填，to 默认为最新修订"""
+    try:
+        history = get_annotation_history()
+        revisions = history.list(image_id) if history else []
+        from_rev = request.args.get('from', type=int)
+        to_rev = request.args.get('to', type=int)
+        if to_rev is None and revisions:
+            to_rev = revisions[-1]['rev']
+        diff = history.diff(image_id, from_rev, to_rev) if from_rev is not None and to_rev is not None else None
+        if diff is None:
+            return jsonify({'success': False, 'error': _('messages.revision_not_found')}), 404
+        return jsonify(dict(diff, success=True, image_id=image_id))
+    except Exception as e:
+        logger.error(f"比较修订失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/annotations/<image_id>/revisions/<int:rev>/restore', methods=['POST'])
+def restore_annotation_revision(image_id, rev):
+    """恢复指定修订（作为一个新修订保存，不丢弃之后的修订）"""
+    try:
+        history = get_annotation_history()
+        annotations = history.load(image_id, rev) if history else None
+        if annotations is None:
+            return jsonify({'success': False, 'error': _('messages.revision_not_found')}), 404
+
+        # 类别或图像尺寸可能已变化，按当前规则校验
+        errors = get_annotation_validator(image_id).validate(annotations)
+        if errors:
+            return jsonify({'success': False, 'error': _('validation.invalid_annotations'), 'errors': errors})
+
+        data = request.get_json(silent=True) or {}
+        session = collab.find_session(image_id)
+        if session:
+            count = session.replace(annotations, data.get('client_id'), source='restore')
+        else:
+            count = save_annotations(image_id, annotations, touch=False, normalize=False, source='restore')
+        revisions = history.list(image_id)
+        return jsonify({
+            'success': True,
+            'count': count,
+            'restored': rev,
+            'rev': revisions[-1]['rev'] if revisions else None
+        })
+    except Exception as e:
+        logger.error(f"恢复修订失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/images/query')
+def query_images():
+    """
+    按索引查询图像：类别数量范围、标注状态、文件名前缀、时间范围、排序和游标分页
+
+    例：?min.capped_brood=51&max.larvae=0&sort=capped_brood（参数见 parse_image_query）
+    """
+    try:
+        query = parse_image_query(request.args, get_cell_classes().keys())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        images, total, next_cursor = get_dataset_catalog().query(query)
+        return jsonify({
+            'success': True,
+            'images': images,
+            'total': total,
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        logger.error(f"查询图像失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/images/<image_id>/metadata')
+def get_image_metadata_api(image_id):
+    """图像元数据（尺寸、EXIF方向、拍摄时间、相机）"""
+    try:
+        filename = find_image_filename(image_id)
+        if not filename:
+            return jsonify({'success': False, 'error': _('messages.image_not_found')}), 404
+        return jsonify({
+            'success': True,
+            'image_id': image_id,
+            'filename': filename,
+            'metadata': get_image_metadata([filename]).get(filename)
+        })
+    except Exception as e:
+        logger.error(f"获取图像元数据失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/annotations/batch', methods=['POST'])
+def get_annotations_batch():
+    """
+    批量加载标注API
+
+    请求体为 {"image_ids": [...]} 或 {"cursor": "<上一页最后的图像ID>", "limit": n}，
+    响应为JSON Lines：每行一个图像的标注文档，最后一行为 {"next_cursor", "count"}。
+    """
+    data = request.get_json(silent=True) or {}
+    max_size = current_app.config.get('ANNOTATION_BATCH_MAX_SIZE', 500)
+    next_cursor = None
+
+    image_ids = data.get('image_ids')
+    if image_ids is None:
+        try:
+            limit = min(int(data.get('limit', max_size)), max_size)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': _('validation.invalid_format')}), 400
+        all_ids = list_image_ids()
+        cursor = data.get('cursor')
+        start = bisect.bisect_right(all_ids, cursor) if cursor else 0
+        image_ids = all_ids[start:start + max(limit, 0)]
+        if image_ids and start + len(image_ids) < len(all_ids):
+            next_cursor = image_ids[-1]
+    elif not isinstance(image_ids, list) or not all(isinstance(i, str) for i in image_ids):
+        return jsonify({'success': False, 'error': _('validation.invalid_format')}), 400
+    elif len(image_ids) > max_size:
+        return jsonify({'success': False, 'error': f'最多一次请求 {max_size} 个图像'}), 400
+
+    workers = current_app.config.get('ANNOTATION_BATCH_WORKERS', 8)
+
+    def generate():
+        for document in iter_annotation_batch(image_ids, workers):
+            yield codec.dumps(document) + b'\n'
+        yield codec.dumps({'next_cursor': next_cursor, 'count': len(image_ids)}) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @bp.route('/upload', methods=['POST'])
 def upload_file():
     """文件上传"""
@@ -149,11 +383,13 @@ def upload_file():
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        upload_dir = get_upload_dir()
-        file_path = os.path.join(upload_dir, filename)
         
         try:
-            file.save(file_path)
+            before = get_dataset_stats()
+            get_image_storage().put(filename, file.stream)
+            get_dataset_catalog().add_image(filename)
+            schedule_image_processing([filename])
+            publish_stats(before)
             flash(f'文件 {filename} 上传成功', 'success')
         except Exception as e:
             flash(f'文件上传失败: {e}', 'error')
@@ -164,11 +400,15 @@ def upload_file():
 
 @bp.route('/download/<image_id>/<file_type>')
 def download_annotation(image_id, file_type):
-    """下载标注文件"""
+    """下载标注文件（JSON 加 ?pretty=1 时以缩进格式下载，便于查看）"""
     file_path = get_annotation_file_path(image_id, file_type)
     
-    if file_path and os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True)
+    if file_path and os.path.exists(file_path) and file_type == 'json' and request.args.get('pretty') == '1':
+        response = Response(codec.dumps(load_annotations(image_id), pretty=True), mimetype='application/json')
+        response.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(file_path))
+        return response
+    elif file_path and os.path.exists(file_path):
+        return send_file_offloaded(file_path, as_attachment=True)
     else:
         flash('标注文件不存在', 'error')
         return redirect(url_for('main.index'))
@@ -176,11 +416,16 @@ def download_annotation(image_id, file_type):
 @bp.route('/export')
 def export_dataset():
     """导出整个数据集"""
+    export_format = request.args.get('format', 'json')
     try:
-        export_path = export_all_annotations()
+        if export_format in COLUMNAR_FORMATS:
+            export_path = export_columnar(export_format,
+                                          row_group_size=current_app.config.get('EXPORT_ROW_GROUP_SIZE'))
+        else:
+            export_path = export_all_annotations(since=request.args.get('since') or None)
         
         if export_path and os.path.exists(export_path):
-            return send_file(export_path, as_attachment=True)
+            return send_file_offloaded(export_path, as_attachment=True)
         else:
             flash('没有可导出的标注数据', 'error')
             return redirect(url_for('main.index'))
@@ -189,58 +434,129 @@ def export_dataset():
         flash(f'导出失败: {e}', 'error')
         return redirect(url_for('main.index'))
 
+@bp.route('/export/archive')
+def export_archive():
+    """流式导出图像与标注的ZIP压缩包"""
+    annotated_only = request.args.get('annotated_only', 'false').lower() in ('1', 'true', 'yes')
+    annotation_format = request.args.get('format', 'json')
+
+    if annotation_format not in ARCHIVE_ANNOTATION_FORMATS:
+        flash(f'不支持的标注格式: {annotation_format}', 'error')
+        return redirect(url_for('main.index'))
+
+    archive_name = f"bee_dataset_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    chunks = iter_dataset_archive(annotated_only=annotated_only,
+                                  annotation_format=annotation_format,
+                                  chunk_size=current_app.config.get('ARCHIVE_CHUNK_SIZE'))
+
+    return Response(stream_with_context(chunks),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={archive_name}'})
+
 @bp.route('/api/stats')
 def get_stats():
-    """获取统计信息API"""
+    """获取统计信息API（读取增量维护的统计索引）"""
     try:
-        _, stats, _ = get_image_list(page=1, per_page=9999)
-        
-        # 统计各类别数量
-        from app.config import CELL_CLASSES
-        from app.models import get_annotations_dir
-        class_counts = {class_key: 0 for class_key in CELL_CLASSES.keys()}
-
-        annotations_dir = get_annotations_dir()
-        if os.path.exists(annotations_dir):
-            for filename in os.listdir(annotations_dir):
-                if filename.endswith('.json'):
-                    annotation_path = os.path.join(annotations_dir, filename)
-                    try:
-                        with open(annotation_path, 'r', encoding='utf-8') as f:
-                            annotations = json.load(f)
-                            for annotation in annotations:
-                                class_key = annotation.get('class', 'other')
-                                if class_key in class_counts:
-                                    class_counts[class_key] += 1
-                    except:
-                        pass
-        
-        stats['class_distribution'] = class_counts
-        
         return jsonify({
             'success': True,
-            'stats': stats
+            'stats': get_dataset_stats()
         })
         
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@bp.route('/api/events')
+def event_stream():
+    """
+    统计信息与标注变化的 Server-Sent Events 流
+
+    连接时先推送一次完整统计（stats），之后在保存/删除标注时推送
+    annotations（单图数量变化）和 stats（最新统计及增量）事件。只推送当前项目的事件。
+    """
+    subscriber = bus.subscribe(project_channel())
+    response = Response(iter_sse(subscriber, initial=[('stats', get_dataset_stats())]),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/frames/<image_id>/events')
+def frame_events(image_id):
+    """
+    单个图像的协同编辑事件流
+
+    连接时先推送完整状态（state），之后推送其他标注者的操作（op）
+    和整体替换（reset）。
+    """
+    if not get_dataset_catalog().has_image(image_id):
+        return jsonify({'success': False, 'error': _('messages.image_not_found')}), 404
+
+    def generate():
+        # 在生成器内登记客户端：响应未开始即被中止时不会留下无法释放的会话
+        session = collab.get_session(image_id, join=True)
+        try:
+            subscriber = bus.subscribe(collab.frame_channel(image_id))
+            yield from iter_sse(subscriber, initial=[('state', session.state())])
+        finally:
+            session.leave()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/frames/<image_id>/ops', methods=['POST'])
+def frame_ops(image_id):
+    """
+    提交协同编辑操作
+
+    请求体: {"client_id": "...", "ops": [{"op": "add"|"update"|"delete", "id": ..., ...}]}
+    返回每个操作的结果（applied / merged / gone / rejected）及修订号。
+    新增和修改后的标注按保存接口的规则校验，未通过的操作被拒绝并附带 errors。
+    """
+    try:
+        payload_error = annotation_payload_error()
+        if payload_error:
+            return jsonify(payload_error), 413
+
+        data = request.get_json(silent=True) or {}
+        ops = data.get('ops')
+        if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+            return jsonify({'success': False, 'error': _('validation.required_field')}), 400
+        if not get_dataset_catalog().has_image(image_id):
+            return jsonify({'success': False, 'error': _('messages.image_not_found')}), 404
+
+        version, results = collab.apply_ops(image_id, ops, data.get('client_id'),
+                                            get_annotation_validator(image_id))
+        return jsonify({'success': True, 'version': version, 'results': results})
+    except Exception as e:
+        logger.error(f"协同操作失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/api/frames/<image_id>/snapshot', methods=['POST'])
+def frame_snapshot(image_id):
+    """立即将协同会话状态写入标注文件"""
+    try:
+        session = collab.find_session(image_id)
+        count = session.snapshot() if session else len(load_annotations(image_id))
+        return jsonify({
+            'success': True,
+            'message': f'成功保存 {count} 个标注点',
+            'count': count
+        })
+    except Exception as e:
+        logger.error(f"协同快照失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 @bp.route('/delete_annotation/<image_id>', methods=['POST'])
 def delete_annotation(image_id):
     """删除标注"""
     try:
-        json_path = os.path.join(ANNOTATIONS_DIR, f"{image_id}.json")
-        csv_path = os.path.join(ANNOTATIONS_DIR, f"{image_id}.csv")
-        
-        deleted_files = []
-        if os.path.exists(json_path):
-            os.remove(json_path)
-            deleted_files.append('JSON')
-        
-        if os.path.exists(csv_path):
-            os.remove(csv_path)
-            deleted_files.append('CSV')
+        session = collab.find_session(image_id)
+        if session:
+            session.clear()
+        deleted_files = delete_annotations(image_id)
         
         if deleted_files:
             flash(f'已删除标注文件 ({", ".join(deleted_files)})', 'success')
@@ -255,16 +571,80 @@ def delete_annotation(image_id):
 @bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serve uploaded images"""
-    upload_dir = get_upload_dir()
-    abs_upload_dir = os.path.abspath(upload_dir)
-    return send_from_directory(abs_upload_dir, filename)
+    return _send_image(filename)
 
 @bp.route('/images/<filename>')
 def image_file(filename):
     """Serve images from images directory"""
-    images_dir = get_images_dir()
-    abs_images_dir = os.path.abspath(images_dir)
-    return send_from_directory(abs_images_dir, filename)
+    if os.path.abspath(get_images_dir()) != os.path.abspath(get_upload_dir()):
+        # 使用旧版 uploads 目录时，images 目录中的图像直接发送（没有浏览副本）
+        path = safe_join(os.path.abspath(get_images_dir()), filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        return send_file_offloaded(path)
+    return _send_image(filename)
+
+def _send_image(filename):
+    """
+    发送当前图像存储中的图像；存在浏览副本时发送副本（?original=1 时发送原图）
+
+    远程存储的图像从本地读穿缓存发送。
+    """
+    if not request.args.get('original'):
+        derivative = find_image_derivative(filename)
+        if derivative:
+            return send_file_offloaded(derivative)
+
+    try:
+        path = get_image_storage().local_path(filename)
+    except ValueError:
+        abort(404)
+    if path is None:
+        abort(404)
+    return send_file_offloaded(path)
+
+@bp.route('/sw.js')
+def service_worker():
+    """Service Worker脚本（需从根路径提供以覆盖整个站点）"""
+    version, precache_urls = static_asset_manifest(current_app.static_folder, current_app.static_url_path)
+    script = render_template('sw.js',
+                             version=version,
+                             precache_urls=precache_urls,
+                             image_prefixes=['/images/', '/uploads/'],
+                             image_cache_max_bytes=current_app.config.get('IMAGE_CACHE_MAX_MB', 200) * 1024 * 1024,
+                             revalidate_after=current_app.config.get('IMAGE_CACHE_REVALIDATE_SECONDS', 600))
+    response = Response(script, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/api/projects')
+def get_projects():
+    """列出所有项目"""
+    try:
+        projects = [load_project(name) for name in list_projects()]
+        return jsonify({
+            'success': True,
+            'current': current_project().name,
+            'projects': [project.to_dict() for project in projects if project]
+        })
+    except Exception as e:
+        logger.error(f"获取项目列表失败: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/set_project/<name>')
+def set_project(name):
+    """切换当前项目"""
+    from flask import session
+
+    project = load_project(name)
+    if project is None:
+        flash(_('messages.project_not_found'), 'error')
+    else:
+        session['project'] = project.name
+        flash(_('messages.project_changed', project=project.title), 'success')
+
+    # 切换项目后返回首页（原页面的图像可能不属于新项目）
+    return redirect(url_for('main.index'))
 
 @bp.route('/set_language/<language>')
 def set_language(language):
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Service Worker 预缓存清单（静态资源列表与版本号）
+"""
+
+import os
+import hashlib
+
+PRECACHE_EXTENSIONS = ('.css', '.js', '.woff', '.woff2')
+
+
+def static_asset_manifest(static_folder, static_url_path='/static'):
+    """
+    收集需要预缓存的静态资源
+
+    版本号由各文件的相对路径、修改时间和大小计算，任一静态文件变化时
+    Service Worker 脚本内容随之变化，浏览器据此安装新版本并替换旧缓存。
+    返回 (version, urls)。
+    """
+    digest = hashlib.sha256()
+    urls = []
+
+    for root, dirs, files in os.walk(static_folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(PRECACHE_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            rel_path = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            stat = os.stat(path)
+            digest.update(f"{rel_path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode('utf-8'))
+            urls.append(f"{static_url_path}/{rel_path}")
+
+    return digest.hexdigest()[:12], urls
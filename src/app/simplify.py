@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+多边形简化与坐标量化
+
+自由绘制的多边形带有数百个浮点顶点，保存前可选地做一次规范化：
+坐标按指定小数位数量化，去掉重复顶点（含与首顶点相同的闭合顶点），
+再用 Douglas-Peucker 算法按像素容差简化。整个图像的顶点拼成一个数组
+统一量化和去重，简化时每段的距离计算也是向量化的（需要 NumPy，
+未安装时逐点计算）。圆形标注的圆心和半径同样量化。
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 简化后至少保留的顶点数
+MIN_VERTICES = 3
+
+
+def _quantize(value, precision):
+    return round(value) if precision <= 0 else round(value, precision)
+
+
+def _douglas_peucker_numpy(x, y, starts, ends, tolerance):
+    """
+    同时简化多条折线，返回保留顶点的布尔掩码
+
+    x、y 为所有折线拼接的坐标，第 i 条折线为 [starts[i], ends[i]]（含两端）。
+    每一轮对所有待处理的线段一起计算内部顶点到线段的距离，距离最大且超过
+    tolerance 的顶点保留并把线段一分为二，轮数约为递归深度。
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    seg_start, seg_end = np.asarray(starts), np.asarray(ends)
+    while len(seg_start):
+        lengths = seg_end - seg_start - 1
+        pending = lengths > 0
+        seg_start, seg_end, lengths = seg_start[pending], seg_end[pending], lengths[pending]
+        if not len(seg_start):
+            break
+
+        # 各线段内部顶点的序号及所属线段
+        segment = np.repeat(np.arange(len(seg_start)), lengths)
+        group_start = np.cumsum(lengths) - lengths
+        index = np.arange(int(lengths.sum())) - group_start[segment] + seg_start[segment] + 1
+
+        ax, ay = x[seg_start][segment], y[seg_start][segment]
+        dx, dy = (x[seg_end] - x[seg_start])[segment], (y[seg_end] - y[seg_start])[segment]
+        px, py = x[index] - ax, y[index] - ay
+        length = np.hypot(dx, dy)
+        # 首尾重合（闭合折线的第一段）时取到端点的距离
+        closed = length == 0
+        distances = np.abs(dx * py - dy * px) / np.where(closed, 1.0, length)
+        distances[closed] = np.hypot(px[closed], py[closed])
+
+        # 每条线段中距离最大的第一个顶点
+        farthest_distance = np.maximum.reduceat(distances, group_start)
+        candidates = np.flatnonzero(distances == farthest_distance[segment])
+        _, first = np.unique(segment[candidates], return_index=True)
+        farthest = index[candidates[first]]
+
+        split = farthest_distance > tolerance
+        farthest = farthest[split]
+        keep[farthest] = True
+        seg_start, seg_end = (np.concatenate((seg_start[split], farthest)),
+                              np.concatenate((farthest, seg_end[split])))
+    return keep
+
+
+def _douglas_peucker_python(xs, ys, tolerance):
+    """单条折线的 Douglas-Peucker（未安装 NumPy 时使用），返回保留顶点的布尔列表"""
+    keep = [False] * len(xs)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        ax, ay = xs[start], ys[start]
+        dx, dy = xs[end] - ax, ys[end] - ay
+        length = math.hypot(dx, dy)
+        farthest, max_distance = None, -1.0
+        for i in range(start + 1, end):
+            if length == 0:
+                distance = math.hypot(xs[i] - ax, ys[i] - ay)
+            else:
+                distance = abs(dx * (ys[i] - ay) - dy * (xs[i] - ax)) / length
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if max_distance > tolerance:
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return keep
+
+
+def simplify_polygon(xs, ys, tolerance):
+    """
+    简化闭合多边形（不含重复的闭合顶点），返回保留顶点的序号
+
+    在首顶点处切开成首尾相同的折线后做 Douglas-Peucker，偏离不超过 tolerance 像素的顶点被去掉。
+    结果少于 MIN_VERTICES 个顶点时保留全部顶点。
+    """
+    count = len(xs)
+    if tolerance <= 0 or count <= MIN_VERTICES:
+        return list(range(count))
+    if np is not None:
+        x = np.append(np.asarray(xs, dtype=np.float64), xs[0])
+        y = np.append(np.asarray(ys, dtype=np.float64), ys[0])
+        keep = np.flatnonzero(_douglas_peucker_numpy(x, y, [0], [count], tolerance)[:count]).tolist()
+    else:
+        mask = _douglas_peucker_python(list(xs) + [xs[0]], list(ys) + [ys[0]], tolerance)
+        keep = [i for i in range(count) if mask[i]]
+    return keep if len(keep) >= MIN_VERTICES else list(range(count))
+
+
+def normalize_annotations(annotations, tolerance=0.5, precision=2):
+    """
+    规范化一个图像的标注，返回 (新标注列表, 统计)
+
+    坐标量化到 precision 位小数（0 表示取整），多边形去重并按 tolerance 像素简化
+    （tolerance 为 0 时不简化）。不修改传入的标注；统计为
+    {'polygons': 多边形数, 'vertices_before': 原顶点数, 'vertices_after': 处理后顶点数}。
+    """
+    polygons = [i for i, annotation in enumerate(annotations)
+                if annotation.get('type') == 'polygon' and len(annotation.get('points') or []) >= MIN_VERTICES]
+    vertices_before = sum(len(annotations[i]['points']) for i in polygons)
+    stats = {'polygons': len(polygons), 'vertices_before': vertices_before, 'vertices_after': vertices_before}
+
+    result = []
+    for annotation in annotations:
+        if annotation.get('type', 'circle') == 'circle':
+            annotation = dict(annotation)
+            for field in ('x', 'y', 'radius'):
+                if isinstance(annotation.get(field), float):
+                    annotation[field] = _quantize(annotation[field], precision)
+        result.append(annotation)
+    if not polygons:
+        return result, stats
+
+    if np is not None:
+        vertices = _normalize_polygons_numpy([annotations[i]['points'] for i in polygons], tolerance, precision)
+    else:
+        vertices = [_normalize_polygon_python(annotations[i]['points'], tolerance, precision) for i in polygons]
+
+    vertices_after = 0
+    for i, (xs, ys) in zip(polygons, vertices):
+        result[i] = dict(annotations[i], points=[{'x': x, 'y': y} for x, y in zip(xs, ys)])
+        vertices_after += len(xs)
+    stats['vertices_after'] = vertices_after
+    return result, stats
+
+
+def _normalize_polygons_numpy(polygons, tolerance, precision):
+    """所有多边形的顶点拼成一个数组，统一量化、去重和简化，返回 [(xs, ys), ...]"""
+    counts = np.array([len(points) for points in polygons], dtype=np.int64)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    total = int(ends[-1])
+    raw_x = np.fromiter((point['x'] for points in polygons for point in points), dtype=np.float64, count=total)
+    raw_y = np.fromiter((point['y'] for points in polygons for point in points), dtype=np.float64, count=total)
+    xs = np.round(raw_x, max(precision, 0))
+    ys = np.round(raw_y, max(precision, 0))
+
+    # 与同一多边形的下一个顶点（最后一个顶点与首顶点）相同的顶点去掉
+    following = np.arange(1, total + 1)
+    following[ends - 1] = starts
+    unique = (xs != xs[following]) | (ys != ys[following])
+    polygon = np.repeat(np.arange(len(counts)), counts)
+    unique_counts = np.bincount(polygon[unique], minlength=len(counts))
+    # 去重后少于 MIN_VERTICES 个顶点的多边形保持原样（不量化）
+    active = unique_counts >= MIN_VERTICES
+    unique &= active[polygon]
+    kept = np.flatnonzero(unique)
+    vertex_counts = unique_counts[active]
+
+    # 每个多边形在首顶点处切开，末尾追加首顶点，组成首尾相同的折线
+    closed_ends = np.cumsum(vertex_counts + 1) - 1
+    closed_starts = closed_ends - vertex_counts
+    positions = np.arange(len(kept)) + (np.cumsum(active) - 1)[polygon[kept]]
+    x = np.empty(len(kept) + len(vertex_counts))
+    y = np.empty_like(x)
+    x[positions], y[positions] = xs[kept], ys[kept]
+    x[closed_ends], y[closed_ends] = x[closed_starts], y[closed_starts]
+
+    keep = np.ones(len(x), dtype=bool)
+    simplify = vertex_counts > MIN_VERTICES
+    if tolerance > 0 and simplify.any():
+        mask = _douglas_peucker_numpy(x, y, closed_starts[simplify], closed_ends[simplify], tolerance)
+        selected = simplify[np.repeat(np.arange(len(vertex_counts)), vertex_counts + 1)]
+        keep[selected] = mask[selected]
+    keep[closed_ends] = False
+    if len(vertex_counts):
+        # 整体小于容差、只剩首顶点等情况保留全部顶点
+        for i in np.flatnonzero(np.add.reduceat(keep, closed_starts) < MIN_VERTICES).tolist():
+            keep[closed_starts[i]:closed_ends[i]] = True
+
+    convert = (lambda values: values.astype(np.int64).tolist()) if precision <= 0 else (lambda values: values.tolist())
+    result = []
+    closed = iter(zip(closed_starts.tolist(), closed_ends.tolist()))
+    for i in range(len(counts)):
+        if not active[i]:
+            result.append((raw_x[starts[i]:ends[i]].tolist(), raw_y[starts[i]:ends[i]].tolist()))
+            continue
+        start, end = next(closed)
+        mask = keep[start:end]
+        result.append((convert(x[start:end][mask]), convert(y[start:end][mask])))
+    return result
+
+
+def _normalize_polygon_python(points, tolerance, precision):
+    xs = [_quantize(point['x'], precision) for point in points]
+    ys = [_quantize(point['y'], precision) for point in points]
+    count = len(xs)
+    unique = [i for i in range(count) if (xs[i], ys[i]) != (xs[(i + 1) % count], ys[(i + 1) % count])]
+    if len(unique) < MIN_VERTICES:
+        return [point['x'] for point in points], [point['y'] for point in points]
+    xs = [xs[i] for i in unique]
+    ys = [ys[i] for i in unique]
+    keep = simplify_polygon(xs, ys, tolerance)
+    return [xs[i] for i in keep], [ys[i] for i in keep]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+标注空间索引（均匀网格），用于按视口查询标注
+"""
+
+import os
+import math
+import logging
+
+from app.revisions import get_annotation_revision
+from app import codec
+
+logger = logging.getLogger(__name__)
+
+INDEX_EXTENSION = 'sidx'
+INDEX_VERSION = 1
+DEFAULT_CELL_SIZE = 128
+
+
+def annotation_bbox(annotation):
+    """计算标注的外接矩形 (x0, y0, x1, y1)，无效标注返回None"""
+    try:
+        if annotation.get('type') == 'polygon':
+            points = annotation.get('points') or []
+            if not points:
+                return None
+            xs = [float(p['x']) for p in points]
+            ys = [float(p['y']) for p in points]
+            return min(xs), min(ys), max(xs), max(ys)
+
+        x = float(annotation.get('x', 0))
+        y = float(annotation.get('y', 0))
+        radius = float(annotation.get('radius', 0) or 0)
+        return x - radius, y - radius, x + radius, y + radius
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _cell_range(x0, y0, x1, y1, cell_size):
+    """外接矩形覆盖的网格单元坐标"""
+    for cx in range(math.floor(x0 / cell_size), math.floor(x1 / cell_size) + 1):
+        for cy in range(math.floor(y0 / cell_size), math.floor(y1 / cell_size) + 1):
+            yield cx, cy
+
+
+def build_index(annotations, cell_size=DEFAULT_CELL_SIZE, revision=None):
+    """为标注列表构建网格索引"""
+    bboxes = []
+    cells = {}
+    for index, annotation in enumerate(annotations):
+        bbox = annotation_bbox(annotation)
+        bboxes.append(list(bbox) if bbox else None)
+        if bbox is None:
+            continue
+        for cx, cy in _cell_range(*bbox, cell_size):
+            cells.setdefault(f"{cx},{cy}", []).append(index)
+
+    return {
+        'version': INDEX_VERSION,
+        'revision': revision,
+        'cell_size': cell_size,
+        'bboxes': bboxes,
+        'cells': cells
+    }
+
+
+def get_index_path(annotations_dir, image_id):
+    """索引文件与标注文件放在同一目录"""
+    return os.path.join(annotations_dir, f"{image_id}.{INDEX_EXTENSION}")
+
+
+def save_index(annotations_dir, image_id, annotations, cell_size=DEFAULT_CELL_SIZE):
+    """构建并持久化索引，修订号取自当前标注文件"""
+    revision = get_annotation_revision(os.path.join(annotations_dir, f"{image_id}.json"))
+    index = build_index(annotations, cell_size, revision)
+
+    index_path = get_index_path(annotations_dir, image_id)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(codec.dumps(index))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def load_index(annotations_dir, image_id, annotations, cell_size=DEFAULT_CELL_SIZE):
+    """读取索引；索引缺失、版本不符或与标注文件修订号不一致时重建"""
+    index_path = get_index_path(annotations_dir, image_id)
+    revision = get_annotation_revision(os.path.join(annotations_dir, f"{image_id}.json"))
+
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'rb') as f:
+                index = codec.load(f)
+            if (index.get('version') == INDEX_VERSION and index.get('revision') == revision
+                    and index.get('cell_size') == cell_size):
+                return index
+        except (OSError, ValueError):
+            logger.warning(f"空间索引损坏，重新构建: {index_path}")
+
+    if revision is None:
+        return build_index(annotations, cell_size)
+    return save_index(annotations_dir, image_id, annotations, cell_size)
+
+
+def query_index(index, bbox):
+    """返回与查询矩形相交的标注下标（升序）"""
+    x0, y0, x1, y1 = bbox
+    cell_size = index['cell_size']
+    cells = index['cells']
+    bboxes = index['bboxes']
+
+    candidates = set()
+    span = ((math.floor(x1 / cell_size) - math.floor(x0 / cell_size) + 1)
+            * (math.floor(y1 / cell_size) - math.floor(y0 / cell_size) + 1))
+    if span > len(cells):
+        # 查询范围覆盖的单元多于已占用单元时，直接遍历已占用单元
+        for members in cells.values():
+            candidates.update(members)
+    else:
+        for cx, cy in _cell_range(x0, y0, x1, y1, cell_size):
+            candidates.update(cells.get(f"{cx},{cy}", ()))
+
+    hits = []
+    for i in candidates:
+        b = bboxes[i]
+        if b and b[0] <= x1 and b[2] >= x0 and b[1] <= y1 and b[3] >= y0:
+            hits.append(i)
+    hits.sort()
+    return hits
+
+
+def remove_index(annotations_dir, image_id):
+    """删除图像的索引文件"""
+    index_path = get_index_path(annotations_dir, image_id)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+
+def parse_bbox(value):
+    """解析 'x0,y0,x1,y1' 格式的查询参数"""
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(v) for v in parts):
+        raise ValueError(f"无效的bbox参数: {value}")
+    x0, y0, x1, y1 = parts
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+"""
+存储后端：图像等文件的列出、读取、写入、查询和删除
+
+LocalStorage 对应本地目录；S3Storage 对应 S3 兼容对象存储（MinIO、Ceph RGW 等），
+使用连接池复用 HTTP 连接，大文件按分片并发上传、按 Range 并发下载；
+CachedStorage 为远程存储加一层本地读穿缓存（热点图像只下载一次），
+并缓存列表结果，需要本地文件的功能（元数据、浏览副本、文件发送）使用缓存中的副本。
+"""
+
+import io
+import os
+from abc import ABC, abstractmethod
+import time
+import queue
+import base64
+import hashlib
+import hmac
+import uuid
+import threading
+import http.client
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+from werkzeug.security import safe_join
+
+from app.idle_cache import IdleCache
+
+logger = logging.getLogger(__name__)
+
+# 单个对象的信息；mtime_ns 为修改时间（纳秒），etag 在本地存储中为None
+StorageObject = namedtuple('StorageObject', ['key', 'size', 'mtime_ns', 'etag'])
+
+STORAGE_BACKENDS = ('local', 's3')
+
+# DeleteObjects 单次请求最多删除的对象数
+DELETE_BATCH_SIZE = 1000
+
+# open() 远程对象时每次 Range 请求读取的字节数（文件头解析通常一次即可）
+RANGE_BLOCK_SIZE = 64 * 1024
+
+_storages = IdleCache()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class StorageError(OSError):
+    """存储后端返回错误"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class Storage(ABC):
+    """存储接口，键为相对路径（使用 / 分隔）"""
+
+    location = None
+
+    @abstractmethod
+    def list(self, prefix=''):
+        """列出以 prefix 开头的对象（不含子目录），返回 [StorageObject]"""
+
+    @abstractmethod
+    def stat(self, key):
+        """返回对象信息，不存在时返回None"""
+
+    @abstractmethod
+    def get(self, key):
+        """读取对象内容，不存在时抛出 FileNotFoundError"""
+
+    @abstractmethod
+    def put(self, key, data):
+        """写入对象，data 为 bytes 或可读的文件对象"""
+
+    @abstractmethod
+    def delete(self, keys):
+        """批量删除，返回实际删除的键列表"""
+
+    def open(self, key):
+        """以可随机访问的二进制文件对象打开，不存在时抛出 FileNotFoundError"""
+        return io.BytesIO(self.get(key))
+
+    def local_path(self, key):
+        """返回对象的本地文件路径（远程存储需包装为 CachedStorage），不存在时返回None"""
+        return None
+
+    def version(self):
+        """对象列表的版本标记，列表变化时改变（统计索引据此判断是否需要重新列出）"""
+        return None
+
+
+class LocalStorage(Storage):
+    """本地目录（不含子目录：键中不能有路径分隔符）"""
+
+    def __init__(self, root):
+        self.root = root
+        self.location = os.path.abspath(root)
+
+    def _path(self, key):
+        # list() 只列出根目录中的文件，带分隔符的键会写到列不出的子目录中
+        path = None if '/' in key or '\\' in key else safe_join(self.root, key)
+        if path is None or key in ('', '.', '..'):
+            raise ValueError(f"无效的存储键: {key}")
+        return path
+
+    def list(self, prefix=''):
+        if not os.path.isdir(self.root):
+            return []
+        objects = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.name.startswith(prefix) or entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        objects.append(StorageObject(entry.name, stat.st_size, stat.st_mtime_ns, None))
+                except OSError:
+                    continue
+        return objects
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return StorageObject(key, stat.st_size, stat.st_mtime_ns, None)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def put(self, key, data):
+        """
+        写入临时文件后替换，读取方不会看到写了一半的文件
+
+        每次写入使用独立的临时文件，同一键的并发写入（如自动保存与协同快照）后写者生效。
+        """
+        path = self._path(key)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:12]}.tmp"
+        try:
+            with open(tmp_path, 'xb') as f:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    for chunk in iter(lambda: data.read(1024 * 1024), b''):
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def delete(self, keys):
+        deleted = []
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+                deleted.append(key)
+            except FileNotFoundError:
+                continue
+        return deleted
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+    def version(self):
+        try:
+            return os.stat(self.root).st_mtime_ns
+        except OSError:
+            return None
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sign(key, message):
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _uri_encode(value, safe='-_.~'):
+    return quote(str(value), safe=safe)
+
+
+class S3Client:
+    """
+    S3 API 的 HTTP 客户端（路径风格寻址，AWS Signature V4 签名）
+
+    空闲连接放回连接池复用；同时使用的连接数不超过 pool_size。
+    未配置密钥时发送匿名请求。
+    """
+
+    def __init__(self, endpoint, access_key=None, secret_key=None, region='us-east-1',
+                 pool_size=8, timeout=60):
+        parsed = urlsplit(endpoint)
+        self.secure = parsed.scheme == 'https'
+        self.host = parsed.netloc
+        self.base_path = parsed.path.rstrip('/')
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+        return connection_class(self.host, timeout=self.timeout)
+
+    def _signed_headers(self, method, path, query, headers, body, now=None):
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        headers = dict(headers, **{
+            'Host': self.host,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': _sha256(body)
+        })
+        if not (self.access_key and self.secret_key):
+            return headers
+
+        date = amz_date[:8]
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        canonical_headers = {name.lower(): str(value).strip() for name, value in headers.items()}
+        signed_names = ';'.join(sorted(canonical_headers))
+        canonical_query = '&'.join(f"{_uri_encode(name)}={_uri_encode(value)}"
+                                   for name, value in sorted(query.items()))
+        canonical_request = '\n'.join([
+            method,
+            _uri_encode(path, safe='/-_.~'),
+            canonical_query,
+            ''.join(f"{name}:{canonical_headers[name]}\n" for name in sorted(canonical_headers)),
+            signed_names,
+            headers['x-amz-content-sha256']
+        ])
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, _sha256(canonical_request.encode('utf-8'))])
+
+        signing_key = _sign(_sign(_sign(_sign(f"AWS4{self.secret_key}".encode('utf-8'), date),
+                                        self.region), 's3'), 'aws4_request')
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed_names}, Signature={signature}")
+        return headers
+
+    def request(self, method, bucket, key='', query=None, headers=None, body=b''):
+        """发送请求，返回 (状态码, 响应头, 响应体)"""
+        query = {name: value for name, value in (query or {}).items() if value is not None}
+        path = f"{self.base_path}/{bucket}" + (f"/{key}" if key else '')
+        headers = self._signed_headers(method, path, query, headers or {}, body)
+        url = _uri_encode(path, safe='/-_.~')
+        if query:
+            url += '?' + '&'.join(f"{_uri_encode(name)}={_uri_encode(value)}" if value != '' else _uri_encode(name)
+                                  for name, value in sorted(query.items()))
+
+        with self.slots:
+            for attempt in range(2):
+                try:
+                    connection, reused = self.idle.get_nowait(), True
+                except queue.Empty:
+                    connection, reused = self._connect(), False
+                try:
+                    connection.request(method, url, body=body or None, headers=headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    # 复用的空闲连接可能已被服务器关闭，换新连接重试一次
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.idle.put(connection)
+                return response.status, response.headers, data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _xml_children(element, name):
+    """按本地名称查找子元素（忽略 XML 命名空间）"""
+    return [child for child in element if child.tag.rsplit('}', 1)[-1] == name]
+
+
+def _xml_text(element, name, default=None):
+    children = _xml_children(element, name)
+    return children[0].text if children else default
+
+
+def _to_ns(moment):
+    return int(moment.timestamp() * 1_000_000_000)
+
+
+class S3Storage(Storage):
+    """S3 兼容对象存储中某个前缀下的对象"""
+
+    def __init__(self, client, bucket, prefix='', multipart_threshold=16 * 1024 * 1024,
+                 part_size=8 * 1024 * 1024, max_workers=4):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.location = f"s3://{client.host}/{bucket}/{prefix}"
+
+    def _request(self, method, key='', query=None, headers=None, body=b'', missing_ok=False):
+        status, response_headers, data = self.client.request(
+            method, self.bucket, self.prefix + key if key is not None else '', query, headers, body)
+        if status == 404 and missing_ok:
+            return None, response_headers, data
+        if status == 404:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+        if status >= 300:
+            message = data.decode('utf-8', 'replace')[:500] if data else ''
+            raise StorageError(f"S3 请求失败 {method} {key}: HTTP {status} {message}", status)
+        return status, response_headers, data
+
+    def list(self, prefix=''):
+        objects = []
+        token = None
+        while True:
+            _, _, data = self._request('GET', None, {
+                'list-type': '2',
+                'prefix': self.prefix + prefix,
+                'delimiter': '/',
+                'continuation-token': token
+            })
+            root = ElementTree.fromstring(data)
+            for content in _xml_children(root, 'Contents'):
+                key = _xml_text(content, 'Key')[len(self.prefix):]
+                modified = datetime.fromisoformat(_xml_text(content, 'LastModified').replace('Z', '+00:00'))
+                objects.append(StorageObject(key, int(_xml_text(content, 'Size', 0)), _to_ns(modified),
+                                             (_xml_text(content, 'ETag') or '').strip('"') or None))
+            if _xml_text(root, 'IsTruncated') != 'true':
+                return objects
+            token = _xml_text(root, 'NextContinuationToken')
+
+    def stat(self, key):
+        status, headers, _ = self._request('HEAD', key, missing_ok=True)
+        if status is None:
+            return None
+        modified = headers.get('Last-Modified')
+        return StorageObject(key, int(headers.get('Content-Length', 0)),
+                             _to_ns(parsedate_to_datetime(modified)) if modified else 0,
+                             (headers.get('ETag') or '').strip('"') or None)
+
+    def _ranges(self, size):
+        return [(start, min(start + self.part_size, size) - 1) for start in range(0, size, self.part_size)]
+
+    def _get_range(self, key, byte_range, etag):
+        headers = {'Range': f"bytes={byte_range[0]}-{byte_range[1]}"}
+        if etag:
+            # 下载过程中对象被替换时失败，而不是拼接出新旧混合的内容
+            headers['If-Match'] = f'"{etag}"'
+        return self._request('GET', key, headers=headers)[2]
+
+    def get(self, key):
+        """小对象单次读取；大对象按 Range 分片并发读取"""
+        obj = self.stat(key)
+        if obj is None:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+        if obj.size <= self.multipart_threshold:
+            return self._request('GET', key)[2]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            parts = executor.map(lambda byte_range: self._get_range(key, byte_range, obj.etag), self._ranges(obj.size))
+            return b''.join(parts)
+
+    def open(self, key, obj=None):
+        """按需用 Range 请求读取（只下载实际读到的部分），obj 为已知的对象信息"""
+        obj = obj or self.stat(key)
+        if obj is None:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+        return io.BufferedReader(RangeReader(self, obj), RANGE_BLOCK_SIZE)
+
+    def download(self, key, path):
+        """下载到本地文件（大对象分片并发写入），返回对象信息"""
+        obj = self.stat(key)
+        if obj is None:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                if obj.size <= self.multipart_threshold:
+                    f.write(self._request('GET', key)[2])
+                else:
+                    write_lock = threading.Lock()
+
+                    def fetch(byte_range):
+                        data = self._get_range(key, byte_range, obj.etag)
+                        with write_lock:
+                            f.seek(byte_range[0])
+                            f.write(data)
+
+                    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                        list(executor.map(fetch, self._ranges(obj.size)))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return obj
+
+    def put(self, key, data):
+        """不超过 multipart_threshold 时单次上传，否则分片并发上传"""
+        stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        head = stream.read(self.multipart_threshold + 1)
+        if len(head) <= self.multipart_threshold:
+            self._request('PUT', key, body=bytes(head))
+            return
+        self._put_multipart(key, head, stream)
+
+    def _iter_parts(self, head, stream):
+        buffer = head
+        while True:
+            while len(buffer) < self.part_size:
+                chunk = stream.read(self.part_size - len(buffer))
+                if not chunk:
+                    break
+                buffer += chunk
+            if not buffer:
+                return
+            yield bytes(buffer[:self.part_size])
+            buffer = buffer[self.part_size:]
+
+    def _upload_part(self, key, upload_id, number, body):
+        _, headers, _ = self._request('PUT', key, {'partNumber': str(number), 'uploadId': upload_id}, body=body)
+        return number, headers.get('ETag')
+
+    def _put_multipart(self, key, head, stream):
+        _, _, data = self._request('POST', key, {'uploads': ''})
+        upload_id = _xml_text(ElementTree.fromstring(data), 'UploadId')
+        etags = {}
+        try:
+            # 同时在内存中的分片不超过 max_workers 个
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = set()
+                for number, body in enumerate(self._iter_parts(head, stream), 1):
+                    if len(pending) >= self.max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        etags.update(future.result() for future in done)
+                    pending.add(executor.submit(self._upload_part, key, upload_id, number, body))
+                etags.update(future.result() for future in pending)
+
+            parts = ''.join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etags[number]}</ETag></Part>"
+                            for number in sorted(etags))
+            self._request('POST', key, {'uploadId': upload_id},
+                          body=f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode('utf-8'))
+        except BaseException:
+            try:
+                self._request('DELETE', key, {'uploadId': upload_id})
+            except OSError as e:
+                logger.warning(f"取消分片上传失败 {key}: {e}")
+            raise
+        logger.info(f"分片上传完成: {self.location}{key} ({len(etags)} 个分片)")
+
+    def delete(self, keys):
+        """使用 DeleteObjects 批量删除"""
+        deleted = []
+        keys = list(keys)
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            objects = ''.join(f"<Object><Key>{_xml_escape(self.prefix + key)}</Key></Object>" for key in batch)
+            body = f"<Delete><Quiet>false</Quiet>{objects}</Delete>".encode('utf-8')
+            _, _, data = self._request('POST', None, {'delete': ''}, body=body, headers={
+                'Content-MD5': base64.b64encode(hashlib.md5(body).digest()).decode('ascii'),
+                'Content-Type': 'application/xml'
+            })
+            root = ElementTree.fromstring(data)
+            deleted.extend(_xml_text(item, 'Key')[len(self.prefix):] for item in _xml_children(root, 'Deleted'))
+            for error in _xml_children(root, 'Error'):
+                logger.error(f"删除对象失败 {_xml_text(error, 'Key')}: {_xml_text(error, 'Message')}")
+        return deleted
+
+
+class RangeReader(io.RawIOBase):
+    """S3 对象的只读文件接口，每次读取对应一个 Range 请求（由 BufferedReader 按块合并）"""
+
+    def __init__(self, storage, obj):
+        self.storage = storage
+        self.obj = obj
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.obj.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.obj.size)
+        if end <= self.position:
+            return 0
+        data = self.storage._get_range(self.obj.key, (self.position, end - 1), self.obj.etag)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def _xml_escape(value):
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class CachedStorage(Storage):
+    """
+    远程存储的本地读穿缓存
+
+    local_path() 首次访问某个对象时下载到缓存目录，之后直接使用缓存文件；
+    对象被替换（大小或 ETag 变化）后重新下载。缓存总大小超过 max_bytes 时
+    删除最久未访问的文件。列表结果缓存 list_ttl 秒，写入和删除后立即失效。
+    """
+
+    def __init__(self, backend, cache_dir, max_bytes=1024 * 1024 * 1024, list_ttl=30):
+        self.backend = backend
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha1(backend.location.encode('utf-8')).hexdigest()[:16])
+        self.max_bytes = max_bytes
+        self.list_ttl = list_ttl
+        self.location = backend.location
+        self.lock = threading.Lock()
+        self.listings = {}          # prefix -> (列出时间, {key: StorageObject}, 版本标记)
+        self.downloads = {}         # key -> 下载锁，同一对象只下载一次
+        self.cached_bytes = None    # 首次需要淘汰时扫描缓存目录得到
+
+    def _listing(self, prefix=''):
+        with self.lock:
+            cached = self.listings.get(prefix)
+        if cached and time.monotonic() - cached[0] < self.list_ttl:
+            return cached
+        objects = {obj.key: obj for obj in self.backend.list(prefix)}
+        token = hashlib.sha1('\n'.join(f"{obj.key}:{obj.etag}" for obj in
+                                       sorted(objects.values())).encode('utf-8')).hexdigest()
+        cached = (time.monotonic(), objects, token)
+        with self.lock:
+            self.listings[prefix] = cached
+        return cached
+
+    def _invalidate(self):
+        with self.lock:
+            self.listings.clear()
+
+    def list(self, prefix=''):
+        return list(self._listing(prefix)[1].values())
+
+    def stat(self, key):
+        obj = self._listing()[1].get(key)
+        return obj if obj is not None else self.backend.stat(key)
+
+    def get(self, key):
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def open(self, key):
+        """已缓存的对象打开缓存文件，否则按 Range 读取远程对象（不下载整个对象）"""
+        obj = self.stat(key)
+        if obj is None:
+            raise FileNotFoundError(f"对象不存在: {self.location}{key}")
+        path = self._cache_path(obj)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return self.backend.open(key, obj)
+
+    def put(self, key, data):
+        self.backend.put(key, data)
+        self._invalidate()
+
+    def delete(self, keys):
+        deleted = self.backend.delete(keys)
+        self._invalidate()
+        return deleted
+
+    def version(self):
+        return self._listing()[2]
+
+    def _cache_path(self, obj):
+        """缓存文件名包含对象大小和 ETag，对象被替换后自然失效；保留扩展名便于识别文件类型"""
+        digest = hashlib.sha1(f"{obj.key}:{obj.size}:{obj.etag or obj.mtime_ns}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + os.path.splitext(obj.key)[1].lower())
+
+    def local_path(self, key):
+        obj = self.stat(key)
+        if obj is None:
+            return None
+        path = self._cache_path(obj)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        with self.lock:
+            download_lock = self.downloads.setdefault(key, threading.Lock())
+        try:
+            with download_lock:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    self.backend.download(key, path)
+                    logger.info(f"已缓存对象: {self.location}{key}")
+                    self._evict(obj.size)
+        except FileNotFoundError:
+            # 列表缓存中的对象已被删除
+            self._invalidate()
+            return None
+        finally:
+            with self.lock:
+                self.downloads.pop(key, None)
+        return path
+
+    def _evict(self, added):
+        """缓存超过上限时按最近访问时间删除"""
+        with self.lock:
+            if self.cached_bytes is None:
+                self.cached_bytes = sum(entry[2] for entry in self._cache_files())
+            else:
+                self.cached_bytes += added
+            if self.cached_bytes <= self.max_bytes:
+                return
+            for path, _, size in sorted(self._cache_files(), key=lambda entry: entry[1]):
+                if self.cached_bytes <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self.cached_bytes -= size
+                except OSError:
+                    continue
+
+    def _cache_files(self):
+        files = []
+        for directory, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((path, stat.st_mtime, stat.st_size))
+        return files
+
+
+def get_s3_client(settings):
+    """按端点和密钥共享 S3 客户端（及其连接池）"""
+    key = (settings['endpoint'], settings['access_key'], settings['region'])
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = S3Client(settings['endpoint'], settings['access_key'], settings['secret_key'],
+                              settings['region'], settings['pool_size'])
+            _clients[key] = client
+    return client
+
+
+def get_storage(settings, local_root, remote_prefix, idle_seconds=None):
+    """
+    获取存储后端
+
+    settings['backend'] 为 local 时使用本地目录 local_root；为 s3 时使用
+    存储桶中 remote_prefix 下的对象，并包装本地读穿缓存。
+    """
+    backend = settings.get('backend', 'local')
+    if backend == 'local':
+        return _storages.get(('local', os.path.abspath(local_root)), lambda: LocalStorage(local_root), idle_seconds)
+    if backend != 's3':
+        raise ValueError(f"不支持的存储后端: {backend}")
+
+    def create():
+        remote = S3Storage(get_s3_client(settings), settings['bucket'], settings['prefix'] + remote_prefix,
+                           settings['multipart_threshold'], settings['part_size'], settings['max_workers'])
+        return CachedStorage(remote, settings['cache_dir'], settings['cache_max_bytes'], settings['list_ttl'])
+
+    key = ('s3', settings['endpoint'], settings['bucket'], settings['prefix'] + remote_prefix)
+    return _storages.get(key, create, idle_seconds)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+标注数据校验
+
+保存前检查标注结构（圆形 / 多边形的字段和类型）、类别、坐标是否为有限值且位于
+图像范围内，以及标注数量和多边形顶点数上限。各字段按列取出后整体检查（类型和
+取值用集合运算，ID长度、顶点数、坐标和半径用 NumPy 数组），只有发现问题时才逐个
+标注检查以定位错误（未安装 NumPy 时总是逐个检查）。
+
+错误为结构化列表，每项包含 index（标注序号，整体错误为None）、field、code，
+部分错误附带 limit / actual 等信息，供客户端定位具体标注。
+"""
+
+import math
+from itertools import repeat
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 单次最多返回的错误数
+MAX_ERRORS = 50
+
+# 客户端生成的标注ID最大长度
+MAX_ID_LENGTH = 64
+
+# 坐标允许超出图像边界的距离（像素，容许舍入误差）
+BOUNDS_TOLERANCE = 1.0
+
+DEFAULT_MAX_ANNOTATIONS = 20000
+DEFAULT_MAX_VERTICES = 10000
+DEFAULT_MAX_TOTAL_VERTICES = 200000
+
+COMMON_FIELDS = frozenset(('id', 'type', 'class', 'timestamp'))
+FIELDS = {
+    'circle': COMMON_FIELDS | {'x', 'y', 'radius'},
+    'polygon': COMMON_FIELDS | {'points'}
+}
+
+
+class AnnotationValidationError(ValueError):
+    """标注未通过校验，errors 为结构化错误列表"""
+
+    def __init__(self, errors):
+        super().__init__(f"标注校验失败（{len(errors)} 个错误）")
+        self.errors = errors
+
+
+def _error(index, field, code, **detail):
+    error = {'index': index, 'field': field, 'code': code}
+    error.update(detail)
+    return error
+
+
+# 按类型精确匹配：bool 是 int 的子类，不算数字
+NUMBER_TYPES = frozenset((int, float))
+OPTIONAL_STRING_TYPES = frozenset((str, type(None)))
+LIST_TYPES = frozenset((list,))
+KINDS = frozenset(FIELDS)
+
+
+def _column(annotations, field):
+    """取出一列字段值（缺失为None），map 在 C 层循环，比逐个 get 快"""
+    return list(map(dict.get, annotations, repeat(field)))
+
+
+def _is_finite(value):
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
+
+
+class AnnotationValidator:
+    """
+    单个图像的标注校验器
+
+    classes 为允许的类别键；width/height 为图像显示尺寸（与标注坐标一致），
+    为None时只检查坐标是否为有限值。
+    """
+
+    def __init__(self, classes, width=None, height=None, max_annotations=DEFAULT_MAX_ANNOTATIONS,
+                 max_vertices=DEFAULT_MAX_VERTICES, max_total_vertices=DEFAULT_MAX_TOTAL_VERTICES):
+        self.classes = frozenset(classes)
+        self.width = width
+        self.height = height
+        self.max_annotations = max_annotations
+        self.max_vertices = max_vertices
+        self.max_total_vertices = max_total_vertices
+
+    def validate(self, annotations):
+        """校验整个标注列表，返回错误列表（为空表示通过）"""
+        if not isinstance(annotations, list):
+            return [_error(None, 'annotations', 'invalid_type', expected='array')]
+        if len(annotations) > self.max_annotations:
+            return [_error(None, 'annotations', 'too_many_annotations',
+                           limit=self.max_annotations, actual=len(annotations))]
+
+        checked = self._check_columns(annotations) if np is not None else None
+        if checked is not None:
+            coordinates, total_vertices = checked
+            errors = []
+        else:
+            errors = []
+            coordinates = _Coordinates()
+            total_vertices = self._check_structure(annotations, errors, coordinates)
+        if len(errors) >= MAX_ERRORS:
+            return errors[:MAX_ERRORS]
+        if total_vertices > self.max_total_vertices:
+            errors.append(_error(None, 'annotations', 'too_many_vertices',
+                                 limit=self.max_total_vertices, actual=total_vertices))
+        errors.extend(coordinates.check(self.width, self.height))
+        return errors[:MAX_ERRORS]
+
+    def validate_one(self, annotation):
+        """校验单个标注（协同编辑的 add / update 操作）"""
+        errors = []
+        coordinates = _Coordinates()
+        self._check_structure([annotation], errors, coordinates)
+        if not errors:
+            errors.extend(coordinates.check(self.width, self.height))
+        return errors
+
+    def check(self, annotations):
+        """校验失败时抛出 AnnotationValidationError"""
+        errors = self.validate(annotations)
+        if errors:
+            raise AnnotationValidationError(errors)
+
+    def _check_columns(self, annotations):
+        """
+        按列整体检查结构，全部通过时返回 (coordinates, 顶点总数)，有任何问题时返回None
+
+        返回None后由 _check_structure 逐个标注检查并给出具体错误。
+        """
+        if not annotations:
+            return _Coordinates(), 0
+        if set(map(type, annotations)) != {dict}:
+            return None
+        kinds = list(map(dict.get, annotations, repeat('type'), repeat('circle')))
+        if not KINDS.issuperset(kinds):
+            return None
+        if 'polygon' in kinds:
+            circle_index = [i for i, kind in enumerate(kinds) if kind == 'circle']
+            polygon_index = [i for i, kind in enumerate(kinds) if kind == 'polygon']
+            circles = list(map(annotations.__getitem__, circle_index))
+            polygons = list(map(annotations.__getitem__, polygon_index))
+        else:
+            circle_index, polygon_index = range(len(annotations)), []
+            circles, polygons = annotations, []
+        if not (all(map(FIELDS['circle'].issuperset, circles)) and all(map(FIELDS['polygon'].issuperset, polygons))):
+            return None
+
+        if not self.classes.issuperset(_column(annotations, 'class')):
+            return None
+        ids = _column(annotations, 'id')
+        if not OPTIONAL_STRING_TYPES.issuperset(map(type, ids)):
+            return None
+        id_lengths = [len(annotation_id) for annotation_id in ids if annotation_id is not None]
+        if id_lengths and (min(id_lengths) == 0 or max(id_lengths) > MAX_ID_LENGTH):
+            return None
+        if not OPTIONAL_STRING_TYPES.issuperset(map(type, _column(annotations, 'timestamp'))):
+            return None
+
+        circle_x = _column(circles, 'x')
+        circle_y = _column(circles, 'y')
+        radii = _column(circles, 'radius')
+        if not (NUMBER_TYPES.issuperset(map(type, circle_x)) and NUMBER_TYPES.issuperset(map(type, circle_y))
+                and NUMBER_TYPES.issuperset(map(type, radii))):
+            return None
+
+        point_lists = _column(polygons, 'points')
+        if not LIST_TYPES.issuperset(map(type, point_lists)):
+            return None
+        counts = np.fromiter(map(len, point_lists), dtype=np.int64, count=len(point_lists))
+        if len(counts) and (counts.min() < 3 or counts.max() > self.max_vertices):
+            return None
+        points = [point for point_list in point_lists for point in point_list]
+        if points and (set(map(type, points)) != {dict} or set(map(len, points)) != {2}):
+            return None
+        try:
+            point_x = list(map(itemgetter('x'), points))
+            point_y = list(map(itemgetter('y'), points))
+        except KeyError:
+            return None
+        if not (NUMBER_TYPES.issuperset(map(type, point_x)) and NUMBER_TYPES.issuperset(map(type, point_y))):
+            return None
+
+        coordinates = _Coordinates()
+        coordinates.xs = circle_x + point_x
+        coordinates.ys = circle_y + point_y
+        coordinates.owners = np.concatenate((np.asarray(circle_index, dtype=np.int64),
+                                             np.repeat(np.asarray(polygon_index, dtype=np.int64), counts)))
+        coordinates.polygons = set(polygon_index)
+        coordinates.radii = radii
+        coordinates.radius_owners = circle_index
+        return coordinates, int(counts.sum())
+
+    def _check_structure(self, annotations, errors, coordinates):
+        """
+        检查字段和类型，通过的坐标交给 coordinates 统一检查；返回顶点总数
+
+        典型图像有数百个标注，循环内避免属性查找和临时对象。
+        """
+        classes = self.classes
+        max_vertices = self.max_vertices
+        circle_fields = FIELDS['circle']
+        polygon_fields = FIELDS['polygon']
+        add_circle = coordinates.add_circle
+        add_points = coordinates.add_points
+        total_vertices = 0
+
+        for index, annotation in enumerate(annotations):
+            if len(errors) >= MAX_ERRORS:
+                break
+            if type(annotation) is not dict:
+                errors.append(_error(index, None, 'invalid_type', expected='object'))
+                continue
+
+            # 旧数据中的圆形标注没有 type 字段
+            kind = annotation.get('type', 'circle')
+            if kind == 'circle':
+                fields = circle_fields
+            elif kind == 'polygon':
+                fields = polygon_fields
+            else:
+                errors.append(_error(index, 'type', 'invalid_value', allowed=sorted(FIELDS)))
+                continue
+            if not fields.issuperset(annotation):
+                errors.append(_error(index, sorted(annotation.keys() - fields)[0], 'unknown_field'))
+                continue
+
+            cls = annotation.get('class')
+            if cls not in classes:
+                errors.append(_error(index, 'class', 'missing_field' if cls is None else 'invalid_class'))
+                continue
+            annotation_id = annotation.get('id')
+            if annotation_id is not None and (type(annotation_id) is not str
+                                              or not 0 < len(annotation_id) <= MAX_ID_LENGTH):
+                errors.append(_error(index, 'id', 'invalid_value'))
+                continue
+            timestamp = annotation.get('timestamp')
+            if timestamp is not None and type(timestamp) is not str:
+                errors.append(_error(index, 'timestamp', 'invalid_value'))
+                continue
+
+            if kind == 'circle':
+                x = annotation.get('x')
+                y = annotation.get('y')
+                radius = annotation.get('radius')
+                if type(x) not in NUMBER_TYPES or type(y) not in NUMBER_TYPES or type(radius) not in NUMBER_TYPES:
+                    field = next(name for name in ('x', 'y', 'radius')
+                                 if type(annotation.get(name)) not in NUMBER_TYPES)
+                    errors.append(_error(index, field, 'missing_field' if field not in annotation else 'invalid_value'))
+                    continue
+                add_circle(index, x, y, radius)
+                continue
+
+            points = annotation.get('points')
+            if type(points) is not list:
+                errors.append(_error(index, 'points', 'missing_field' if points is None else 'invalid_value'))
+                continue
+            count = len(points)
+            if count < 3:
+                errors.append(_error(index, 'points', 'too_few_vertices', limit=3, actual=count))
+                continue
+            total_vertices += count
+            if count > max_vertices:
+                errors.append(_error(index, 'points', 'too_many_vertices', limit=max_vertices, actual=count))
+                continue
+            # 顶点必须是只含数值 x、y 的对象
+            try:
+                xs = [point['x'] for point in points]
+                ys = [point['y'] for point in points]
+                valid = set(map(len, points)) == {2} and set(map(type, xs)) <= NUMBER_TYPES \
+                    and set(map(type, ys)) <= NUMBER_TYPES
+            except (TypeError, KeyError):
+                valid = False
+            if not valid:
+                errors.append(_error(index, 'points', 'invalid_value'))
+                continue
+            add_points(index, xs, ys)
+
+        return total_vertices
+
+
+class _Coordinates:
+    """待检查的坐标（圆心和多边形顶点）及半径，记录每个值所属的标注"""
+
+    def __init__(self):
+        self.xs = []
+        self.ys = []
+        self.owners = []
+        self.polygons = set()
+        self.radii = []
+        self.radius_owners = []
+
+    def add_circle(self, index, x, y, radius):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.owners.append(index)
+        self.radii.append(radius)
+        self.radius_owners.append(index)
+
+    def add_points(self, index, xs, ys):
+        self.xs.extend(xs)
+        self.ys.extend(ys)
+        self.owners.extend([index] * len(xs))
+        self.polygons.add(index)
+
+    def _field(self, index):
+        return 'points' if index in self.polygons else 'x'
+
+    def check(self, width, height):
+        """返回坐标错误（每个标注最多一个）"""
+        if not len(self.owners):
+            return []
+        try:
+            if np is None:
+                raise OverflowError
+            not_finite, out_of_bounds, bad_radius = self._check_numpy(width, height)
+        except OverflowError:
+            # 超出浮点范围的整数无法转换为数组，逐个检查
+            not_finite, out_of_bounds, bad_radius = self._check_python(width, height)
+        if not (not_finite or out_of_bounds or bad_radius):
+            return []
+
+        errors = [_error(index, self._field(index), 'not_finite') for index in not_finite]
+        reported = set(not_finite)
+        errors.extend(_error(index, self._field(index), 'out_of_bounds', width=width, height=height)
+                      for index in out_of_bounds if index not in reported)
+        reported.update(out_of_bounds)
+        errors.extend(_error(index, 'radius', 'invalid_value')
+                      for index in bad_radius if index not in reported)
+        errors.sort(key=lambda error: error['index'])
+        return errors
+
+    def _check_numpy(self, width, height):
+        xs = np.array(self.xs, dtype=np.float64)
+        ys = np.array(self.ys, dtype=np.float64)
+        invalid = ~(np.isfinite(xs) & np.isfinite(ys))
+        outside = None
+        if width and height:
+            # NaN 的比较结果为 False，不会重复计入
+            outside = (xs < -BOUNDS_TOLERANCE) | (xs > width + BOUNDS_TOLERANCE) \
+                | (ys < -BOUNDS_TOLERANCE) | (ys > height + BOUNDS_TOLERANCE)
+        radii = np.array(self.radii, dtype=np.float64)
+        # 非有限值或不为正数（NaN 时 radii > 0 为 False）
+        bad = ~(np.isfinite(radii) & (radii > 0))
+
+        # 全部通过时（常见情况）不再构造序号数组
+        not_finite = out_of_bounds = bad_radius = []
+        if invalid.any() or (outside is not None and outside.any()):
+            owners = np.array(self.owners, dtype=np.int64)
+            not_finite = np.unique(owners[invalid]).tolist()
+            if outside is not None:
+                out_of_bounds = np.unique(owners[outside]).tolist()
+        if bad.any():
+            bad_radius = np.array(self.radius_owners, dtype=np.int64)[bad].tolist()
+        return not_finite, out_of_bounds, bad_radius
+
+    def _check_python(self, width, height):
+        not_finite, out_of_bounds, bad_radius = [], [], []
+        check_bounds = bool(width and height)
+        # 按列检查时 owners 为 NumPy 数组，转换为 int 便于序列化错误
+        owners = self.owners.tolist() if np is not None and isinstance(self.owners, np.ndarray) else self.owners
+        for x, y, index in zip(self.xs, self.ys, owners):
+            if not (_is_finite(x) and _is_finite(y)):
+                if not not_finite or not_finite[-1] != index:
+                    not_finite.append(index)
+            elif check_bounds and not (-BOUNDS_TOLERANCE <= x <= width + BOUNDS_TOLERANCE
+                                       and -BOUNDS_TOLERANCE <= y <= height + BOUNDS_TOLERANCE):
+                if not out_of_bounds or out_of_bounds[-1] != index:
+                    out_of_bounds.append(index)
+        for radius, index in zip(self.radii, self.radius_owners):
+            if not (_is_finite(radius) and radius > 0):
+                bad_radius.append(index)
+        return not_finite, out_of_bounds, bad_radius
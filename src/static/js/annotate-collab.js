@@ -0,0 +1,281 @@
+/**
+ * 蜂格标注工具 - 协同标注
+ * 同一图像的多名标注者通过 /api/frames/<id>/events 接收其他人的操作，
+ * 本地编辑以 add / update / delete 操作（按标注ID）提交到 /api/frames/<id>/ops，
+ * 服务器合并后写入快照。连接不可用时退回到 SyncQueue 的整文档保存。
+ */
+
+const CollabChannel = {
+    clientId: null,
+    imageId: null,
+    source: null,
+    connected: false,
+    degraded: false,          // 操作提交失败后暂时改用整文档保存
+    version: 0,
+    revs: new Map(),          // 标注ID -> 服务器修订号
+    pending: [],
+    sending: null,
+
+    /**
+     * 连接图像的协同事件流
+     */
+    init: function(imageId) {
+        if (!window.EventSource || !imageId) return;
+
+        this.clientId = this.newId();
+        this.imageId = imageId;
+        this.source = new EventSource(`/api/frames/${encodeURIComponent(imageId)}/events`);
+        this.source.addEventListener('state', event => this.onState(JSON.parse(event.data)));
+        this.source.addEventListener('op', event => this.onOp(JSON.parse(event.data)));
+        this.source.addEventListener('reset', event => this.onReset(JSON.parse(event.data)));
+        // 断线后浏览器自动重连，重连时服务器重新推送完整状态
+        this.source.onerror = () => { this.connected = false; };
+        window.addEventListener('beforeunload', () => this.source.close());
+    },
+
+    /**
+     * 生成标注ID
+     */
+    newId: function() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID().replace(/-/g, '').slice(0, 16);
+        }
+        return Date.now().toString(16) + Math.random().toString(16).slice(2, 10);
+    },
+
+    /**
+     * 是否通过协同通道同步编辑
+     */
+    isActive: function() {
+        return this.connected && !this.degraded;
+    },
+
+    setRevs: function(revs) {
+        this.revs = new Map(Object.entries(revs || {}));
+    },
+
+    /**
+     * 连接（或重连）后收到完整状态
+     */
+    onState: function(state) {
+        this.version = state.version;
+        this.setRevs(state.revs);
+        this.connected = true;
+
+        // 本地有尚未送达的修改（如离线编辑）时，以本地版本覆盖服务器状态
+        if (isDirty) {
+            this.pending = [];
+            SyncQueue.saveCurrent(true).catch(() => {});
+            return;
+        }
+
+        ViewportLoader.markComplete(state.annotations);
+        isDirty = false;
+    },
+
+    /**
+     * 整体替换（其他客户端的整文档保存或标注文件被删除）
+     */
+    onReset: function(state) {
+        this.version = state.version;
+        if (state.client_id === this.clientId) {
+            // 本客户端的整文档保存已送达，恢复逐条操作同步
+            this.degraded = false;
+            if (this.pending.length > 0 || this.sending) return;
+        }
+        this.setRevs(state.revs);
+        this.pending = [];
+        ViewportLoader.markComplete(state.annotations);
+        isDirty = false;
+    },
+
+    /**
+     * 其他标注者的操作
+     */
+    onOp: function(message) {
+        this.version = Math.max(this.version, message.version);
+        if (message.op === 'delete') {
+            this.revs.delete(message.id);
+        } else {
+            this.revs.set(message.id, message.rev);
+        }
+        if (message.client_id === this.clientId || !ViewportLoader.complete) return;
+
+        this.applyRemote(message);
+    },
+
+    /**
+     * 将远程操作应用到本地列表，保持选中和拖动中的标注不变
+     */
+    applyRemote: function(message) {
+        const selectedId = selectedIndex >= 0 && annotations[selectedIndex] ? annotations[selectedIndex].id : null;
+        const draggingId = isDraggingAnnotation && annotations[draggingIndex] ? annotations[draggingIndex].id : null;
+        const index = annotations.findIndex(a => a.id === message.id);
+
+        if (message.op === 'delete') {
+            if (index < 0) return;
+            HitIndex.remove(annotations.splice(index, 1)[0]);
+            if (draggingId === message.id) {
+                isDraggingAnnotation = false;
+                dragStartState = null;
+            }
+        } else if (index >= 0) {
+            // 正在拖动的标注以本地为准，松开鼠标后提交的修改会覆盖远程修改
+            if (draggingId === message.id) return;
+            HitIndex.remove(annotations[index]);
+            annotations[index] = message.annotation;
+            HitIndex.insert(message.annotation);
+        } else {
+            annotations.splice(Math.min(message.index, annotations.length), 0, message.annotation);
+            HitIndex.insert(message.annotation);
+        }
+
+        selectedIndex = selectedId ? annotations.findIndex(a => a.id === selectedId) : -1;
+        if (draggingId) {
+            draggingIndex = annotations.findIndex(a => a.id === draggingId);
+        }
+
+        AnnotationTool.redrawAll();
+        AnnotationTool.updateAnnotationList();
+        AnnotationTool.updateAnnotationCount();
+    },
+
+    /**
+     * 将历史操作转换为协同操作并提交
+     *
+     * 返回 false 表示未能通过协同通道同步（未连接或标注缺少ID），
+     * 调用方应改用整文档保存。
+     */
+    send: function(historyOps, reverse) {
+        if (!this.isActive()) return false;
+
+        const ordered = reverse ? historyOps.slice().reverse() : historyOps;
+        const ops = [];
+        for (const op of ordered) {
+            const converted = this.convert(op, reverse);
+            if (!converted) return false;
+            ops.push(...converted);
+        }
+
+        this.pending.push(...ops);
+        this.flush();
+        return true;
+    },
+
+    /**
+     * 单条历史操作 -> 协同操作列表（标注缺少ID时返回null）
+     */
+    convert: function(op, reverse) {
+        const add = (annotation, index) => ({ op: 'add', id: annotation.id, index: index, annotation: annotation });
+        const remove = annotation => ({ op: 'delete', id: annotation.id });
+
+        switch (op.type) {
+            case 'insert':
+            case 'remove': {
+                if (!op.annotation.id) return null;
+                const adding = (op.type === 'insert') !== reverse;
+                return [adding ? add(op.annotation, op.index) : remove(op.annotation)];
+            }
+            case 'update': {
+                const from = reverse ? op.after : op.before;
+                const to = reverse ? op.before : op.after;
+                if (!to.id) return null;
+                return [{ op: 'update', id: to.id, base_rev: this.revs.get(to.id), changes: this.diff(from, to) }];
+            }
+            case 'clear':
+                if (op.before.some(annotation => !annotation.id)) return null;
+                return reverse ? op.before.map((annotation, i) => add(annotation, i)) : op.before.map(remove);
+        }
+        return null;
+    },
+
+    /**
+     * 两个标注版本之间变化的字段
+     */
+    diff: function(from, to) {
+        const changes = {};
+        Object.keys(to).forEach(key => {
+            if (key !== 'timestamp' && JSON.stringify(from[key]) !== JSON.stringify(to[key])) {
+                changes[key] = to[key];
+            }
+        });
+        Object.keys(from).forEach(key => {
+            if (!(key in to)) changes[key] = null;
+        });
+        return changes;
+    },
+
+    /**
+     * 按顺序发送待提交的操作
+     */
+    flush: function() {
+        if (this.sending || this.pending.length === 0) return this.sending;
+
+        this.sending = this.runFlush().finally(() => {
+            this.sending = null;
+            if (this.pending.length > 0 && this.isActive()) this.flush();
+        });
+        return this.sending;
+    },
+
+    runFlush: async function() {
+        const ops = this.pending.splice(0);
+        SyncQueue.updateStatus('saving');
+
+        let response;
+        try {
+            response = await API.post(`/api/frames/${encodeURIComponent(this.imageId)}/ops`, {
+                client_id: this.clientId,
+                ops: ops
+            });
+        } catch (error) {
+            // 网络失败：改用整文档保存（带离线队列和重试），送达后恢复逐条同步
+            console.warn('协同操作提交失败，改用整文档保存:', error);
+            this.degraded = true;
+            this.pending = [];
+            SyncQueue.schedule();
+            return;
+        }
+
+        if (!response.success) {
+            console.error('协同操作被拒绝:', response.error);
+            SyncQueue.updateStatus('error');
+            return;
+        }
+
+        response.results.forEach(result => {
+            if (result.status === 'applied' || result.status === 'merged') {
+                if (result.annotation) this.revs.set(result.id, result.rev);
+                else this.revs.delete(result.id);
+            } else if (result.status === 'rejected') {
+                console.error('协同操作被拒绝:', result);
+            }
+        });
+        this.version = Math.max(this.version, response.version);
+
+        if (this.pending.length === 0) {
+            isDirty = false;
+            SyncQueue.updateStatus('saved');
+        }
+    },
+
+    /**
+     * 等待已提交的操作送达后，要求服务器立即写入快照
+     */
+    saveNow: async function() {
+        while (this.sending || this.pending.length > 0) {
+            await this.flush();
+        }
+        if (this.degraded) return SyncQueue.saveCurrent(true);
+
+        const response = await API.post(`/api/frames/${encodeURIComponent(this.imageId)}/snapshot`, {});
+        if (response.success) {
+            isDirty = false;
+            SyncQueue.updateStatus('saved');
+        }
+        return response;
+    }
+};
+
+// 导出到全局
+window.CollabChannel = CollabChannel;
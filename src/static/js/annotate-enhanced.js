@@ -8,14 +8,14 @@ const AnnotationUtils = {
      * 图像坐标转屏幕坐标
      */
     imageToScreen: function(imageX, imageY) {
-        const imgWidth = imageObj.width * scale;
-        const imgHeight = imageObj.height * scale;
+        const imgWidth = imageWidth * scale;
+        const imgHeight = imageHeight * scale;
         const imgX = (bgCanvas.width - imgWidth) / 2 + offsetX;
         const imgY = (bgCanvas.height - imgHeight) / 2 + offsetY;
         
         return {
-            x: imgX + (imageX / imageObj.width) * imgWidth,
-            y: imgY + (imageY / imageObj.height) * imgHeight
+            x: imgX + (imageX / imageWidth) * imgWidth,
+            y: imgY + (imageY / imageHeight) * imgHeight
         };
     },
 
@@ -23,14 +23,14 @@ const AnnotationUtils = {
      * 屏幕坐标转图像坐标
      */
     screenToImage: function(screenX, screenY) {
-        const imgWidth = imageObj.width * scale;
-        const imgHeight = imageObj.height * scale;
+        const imgWidth = imageWidth * scale;
+        const imgHeight = imageHeight * scale;
         const imgX = (bgCanvas.width - imgWidth) / 2 + offsetX;
         const imgY = (bgCanvas.height - imgHeight) / 2 + offsetY;
         
         return {
-            x: ((screenX - imgX) / imgWidth) * imageObj.width,
-            y: ((screenY - imgY) / imgHeight) * imageObj.height
+            x: ((screenX - imgX) / imgWidth) * imageWidth,
+            y: ((screenY - imgY) / imgHeight) * imageHeight
         };
     },
 
@@ -83,6 +83,9 @@ const AnnotationUtils = {
     }
 };
 
+// 拖拽开始时标注的副本，用于记录历史
+let dragStartState = null;
+
 // 鼠标事件处理
 const MouseHandler = {
     /**
@@ -105,17 +108,21 @@ const MouseHandler = {
             return;
         }
         
-        // 左键处理
-        if (e.button === 0) {
+        // 左键处理（完整标注列表加载前只允许拖动视图）
+        if (e.button === 0 && !ViewportLoader.complete) {
+            isDraggingView = true;
+            annotationCanvas.style.cursor = 'grabbing';
+        } else if (e.button === 0) {
             if (currentTool === 'move') {
                 // 移动工具：检查是否点击标注，否则拖动视图
                 const hitIndex = this.getHitAnnotation(mouseX, mouseY);
                 if (hitIndex !== -1) {
                     isDraggingAnnotation = true;
                     draggingIndex = hitIndex;
+                    dragStartState = HistoryManager.snapshot(annotations[hitIndex]);
                     selectedIndex = hitIndex;
                     AnnotationTool.updateAnnotationList();
-                    AnnotationTool.redrawAll();
+                    AnnotationTool.requestRedraw();
                 } else {
                     isDraggingView = true;
                     annotationCanvas.style.cursor = 'grabbing';
@@ -126,9 +133,10 @@ const MouseHandler = {
                 if (hitIndex !== -1) {
                     isDraggingAnnotation = true;
                     draggingIndex = hitIndex;
+                    dragStartState = HistoryManager.snapshot(annotations[hitIndex]);
                     selectedIndex = hitIndex;
                     AnnotationTool.updateAnnotationList();
-                    AnnotationTool.redrawAll();
+                    AnnotationTool.requestRedraw();
                 }
             }
         }
@@ -153,7 +161,7 @@ const MouseHandler = {
                 hasDragged = true;
                 offsetX += deltaX;
                 offsetY += deltaY;
-                AnnotationTool.redrawAll();
+                AnnotationTool.requestRedraw();
                 
                 lastMouseX = mouseX;
                 lastMouseY = mouseY;
@@ -165,8 +173,8 @@ const MouseHandler = {
             
             if (annotations[draggingIndex].type === 'circle') {
                 const imagePos = AnnotationUtils.screenToImage(mouseX, mouseY);
-                annotations[draggingIndex].x = AnnotationUtils.clamp(imagePos.x, 0, imageObj.width);
-                annotations[draggingIndex].y = AnnotationUtils.clamp(imagePos.y, 0, imageObj.height);
+                annotations[draggingIndex].x = AnnotationUtils.clamp(imagePos.x, 0, imageWidth);
+                annotations[draggingIndex].y = AnnotationUtils.clamp(imagePos.y, 0, imageHeight);
             } else if (annotations[draggingIndex].type === 'polygon') {
                 // 拖拽多边形：移动所有顶点和洞
                 const imageDelta = AnnotationUtils.screenToImage(deltaX, deltaY);
@@ -176,16 +184,16 @@ const MouseHandler = {
                 
                 // 移动外边界顶点
                 annotations[draggingIndex].points.forEach(point => {
-                    point.x = AnnotationUtils.clamp(point.x + realDeltaX, 0, imageObj.width);
-                    point.y = AnnotationUtils.clamp(point.y + realDeltaY, 0, imageObj.height);
+                    point.x = AnnotationUtils.clamp(point.x + realDeltaX, 0, imageWidth);
+                    point.y = AnnotationUtils.clamp(point.y + realDeltaY, 0, imageHeight);
                 });
                 
                 // 移动所有洞的顶点
                 if (annotations[draggingIndex].holes && annotations[draggingIndex].holes.length > 0) {
                     annotations[draggingIndex].holes.forEach(hole => {
                         hole.forEach(point => {
-                            point.x = AnnotationUtils.clamp(point.x + realDeltaX, 0, imageObj.width);
-                            point.y = AnnotationUtils.clamp(point.y + realDeltaY, 0, imageObj.height);
+                            point.x = AnnotationUtils.clamp(point.x + realDeltaX, 0, imageWidth);
+                            point.y = AnnotationUtils.clamp(point.y + realDeltaY, 0, imageHeight);
                         });
                     });
                 }
@@ -194,7 +202,11 @@ const MouseHandler = {
             lastMouseX = mouseX;
             lastMouseY = mouseY;
             isDirty = true;
-            AnnotationTool.redrawAll();
+            // 拖动的是选中标注，只需更新其路径并重绘动态层
+            HitIndex.update(annotations[draggingIndex]);
+            GeometryService.invalidate(annotations[draggingIndex]);
+            RenderEngine.invalidateAnnotation(annotations[draggingIndex]);
+            AnnotationTool.requestRedraw();
         }
         
         // 更新光标样式
@@ -209,6 +221,12 @@ const MouseHandler = {
     handleMouseUp: function(e) {
         const wasViewDragging = isDraggingView;
         
+        // 一次拖拽只记录一条历史（拖拽前后的状态）
+        if (isDraggingAnnotation && draggingIndex !== -1 && dragStartState) {
+            HistoryManager.recordUpdate(draggingIndex, dragStartState, annotations[draggingIndex]);
+        }
+        dragStartState = null;
+        
         isDraggingView = false;
         isDraggingAnnotation = false;
         draggingIndex = -1;
@@ -232,7 +250,11 @@ const MouseHandler = {
      * 获取被点击的标注索引
      */
     getHitAnnotation: function(screenX, screenY) {
-        for (let i = annotations.length - 1; i >= 0; i--) {
+        // 边框检测容差最大为8像素，换算为图像坐标后从空间索引取候选标注
+        const imagePos = AnnotationUtils.screenToImage(screenX, screenY);
+        const candidates = HitIndex.queryPoint(imagePos.x, imagePos.y, 8 / scale);
+        
+        for (const i of candidates) {
             const annotation = annotations[i];
             
             if (annotation.type === 'circle') {
@@ -263,7 +285,6 @@ const MouseHandler = {
                     }
                 } else {
                     // 其他类别检测整个区域，但要考虑洞的存在
-                    const imagePos = AnnotationUtils.screenToImage(screenX, screenY);
                     if (GeometryUtils.pointInComplexPolygon(imagePos, annotation)) {
                         return i;
                     }
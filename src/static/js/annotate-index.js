@@ -0,0 +1,173 @@
+/**
+ * 蜂格标注工具 - 标注空间索引
+ * 均匀网格索引（图像坐标），用于点击选中、拖拽和悬停检测，
+ * 每次指针事件只需精确检测附近的少量候选标注。
+ */
+
+const HitIndex = {
+    // 网格边长（图像像素），与常见蜂房直径同一量级
+    cellSize: 64,
+
+    cells: new Map(),     // "cx,cy" -> Set(标注对象)
+    entries: new Map(),   // 标注对象 -> { bbox, keys }
+    positions: null,      // 标注对象 -> 数组下标，删除后延迟重建
+    source: null,         // 建立索引时的标注数组
+
+    /**
+     * 计算标注外接矩形 [x0, y0, x1, y1]
+     */
+    getBbox: function(annotation) {
+        if (annotation.type === 'circle') {
+            const r = annotation.radius || 0;
+            return [annotation.x - r, annotation.y - r, annotation.x + r, annotation.y + r];
+        }
+
+        const points = annotation.points || [];
+        if (points.length === 0) return null;
+
+        let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+        for (const point of points) {
+            if (point.x < minX) minX = point.x;
+            if (point.y < minY) minY = point.y;
+            if (point.x > maxX) maxX = point.x;
+            if (point.y > maxY) maxY = point.y;
+        }
+        return [minX, minY, maxX, maxY];
+    },
+
+    /**
+     * 外接矩形覆盖的网格键
+     */
+    getCellKeys: function(bbox) {
+        const keys = [];
+        const cx0 = Math.floor(bbox[0] / this.cellSize), cx1 = Math.floor(bbox[2] / this.cellSize);
+        const cy0 = Math.floor(bbox[1] / this.cellSize), cy1 = Math.floor(bbox[3] / this.cellSize);
+        for (let cx = cx0; cx <= cx1; cx++) {
+            for (let cy = cy0; cy <= cy1; cy++) {
+                keys.push(`${cx},${cy}`);
+            }
+        }
+        return keys;
+    },
+
+    /**
+     * 根据当前标注数组重建索引（加载、撤销、清空等整体替换后）
+     */
+    rebuild: function() {
+        this.cells.clear();
+        this.entries.clear();
+        this.positions = null;
+        this.source = annotations;
+        annotations.forEach(annotation => this.add(annotation));
+    },
+
+    /**
+     * 标注数组被整体替换或长度不一致时重建
+     */
+    sync: function() {
+        if (this.source !== annotations || this.entries.size !== annotations.length) {
+            this.rebuild();
+        }
+    },
+
+    add: function(annotation) {
+        const bbox = this.getBbox(annotation);
+        const keys = bbox ? this.getCellKeys(bbox) : [];
+        keys.forEach(key => {
+            let members = this.cells.get(key);
+            if (!members) {
+                members = new Set();
+                this.cells.set(key, members);
+            }
+            members.add(annotation);
+        });
+        this.entries.set(annotation, { bbox: bbox, keys: keys });
+    },
+
+    detach: function(annotation) {
+        const entry = this.entries.get(annotation);
+        if (!entry) return;
+        entry.keys.forEach(key => {
+            const members = this.cells.get(key);
+            if (!members) return;
+            members.delete(annotation);
+            if (members.size === 0) this.cells.delete(key);
+        });
+        this.entries.delete(annotation);
+    },
+
+    /**
+     * 新增标注（在 push 之后调用）
+     */
+    insert: function(annotation) {
+        if (this.source !== annotations) return;
+        this.add(annotation);
+        if (this.positions && annotations[annotations.length - 1] === annotation) {
+            this.positions.set(annotation, annotations.length - 1);
+        } else {
+            this.positions = null;
+        }
+    },
+
+    /**
+     * 标注几何变化（拖拽、调整半径）
+     */
+    update: function(annotation) {
+        if (this.source !== annotations || !this.entries.has(annotation)) return;
+        this.detach(annotation);
+        this.add(annotation);
+    },
+
+    /**
+     * 删除标注（在 splice/pop 之后调用）
+     */
+    remove: function(annotation) {
+        if (this.source !== annotations) return;
+        this.detach(annotation);
+        this.positions = null;
+    },
+
+    /**
+     * 查询与矩形相交的标注下标（按下标降序，即绘制顺序从上到下）
+     */
+    queryRect: function(x0, y0, x1, y1) {
+        this.sync();
+
+        if (!this.positions) {
+            this.positions = new Map();
+            annotations.forEach((annotation, i) => this.positions.set(annotation, i));
+        }
+
+        const candidates = new Set();
+        const keys = this.getCellKeys([x0, y0, x1, y1]);
+        if (keys.length > this.cells.size) {
+            // 查询范围大于已占用的网格时直接遍历已占用网格
+            this.cells.forEach(members => members.forEach(a => candidates.add(a)));
+        } else {
+            keys.forEach(key => {
+                const members = this.cells.get(key);
+                if (members) members.forEach(a => candidates.add(a));
+            });
+        }
+
+        const hits = [];
+        candidates.forEach(annotation => {
+            const bbox = this.entries.get(annotation).bbox;
+            if (bbox[0] <= x1 && bbox[2] >= x0 && bbox[1] <= y1 && bbox[3] >= y0) {
+                hits.push(this.positions.get(annotation));
+            }
+        });
+        return hits.sort((a, b) => b - a);
+    },
+
+    /**
+     * 查询点附近（容差范围内）的候选标注
+     */
+    queryPoint: function(x, y, tolerance) {
+        const t = tolerance || 0;
+        return this.queryRect(x - t, y - t, x + t, y + t);
+    }
+};
+
+// 导出到全局
+window.HitIndex = HitIndex;
@@ -0,0 +1,282 @@
+/**
+ * 蜂格标注工具 - 渲染引擎
+ * 分层渲染：背景层（仅在视图变换时重绘）、静态标注层（离屏缓存未选中的标注）、
+ * 动态层（选中标注与绘制预览），所有重绘请求合并到 requestAnimationFrame。
+ */
+
+const RenderEngine = {
+    // 标注 -> { key, path, bbox, center }，标注对象被替换后自动失效
+    pathCache: new WeakMap(),
+    colorCache: {},
+
+    staticLayer: null,
+    staticCtx: null,
+    staticDirty: true,
+    staticState: null,
+
+    backgroundKey: null,
+    frameRequested: false,
+    settleTimer: null,
+
+    // 标注在屏幕上小于该尺寸时不绘制编号
+    minLabelSize: 8,
+
+    /**
+     * 初始化离屏静态层
+     */
+    init: function() {
+        this.staticLayer = document.createElement('canvas');
+        this.staticCtx = this.staticLayer.getContext('2d');
+    },
+
+    /**
+     * 画布尺寸变化
+     */
+    resize: function(width, height) {
+        if (!this.staticLayer) this.init();
+        this.staticLayer.width = width;
+        this.staticLayer.height = height;
+        this.backgroundKey = null;
+        this.staticDirty = true;
+    },
+
+    /**
+     * 请求下一帧重绘（同一帧内多次请求只绘制一次）
+     */
+    requestRender: function() {
+        if (this.frameRequested) return;
+        this.frameRequested = true;
+        requestAnimationFrame(() => {
+            this.frameRequested = false;
+            this.render();
+        });
+    },
+
+    /**
+     * 标注集合或样式发生变化，静态层需要重建
+     */
+    invalidateAnnotations: function() {
+        this.staticDirty = true;
+    },
+
+    /**
+     * 单个标注几何发生变化（拖动、调整半径）
+     */
+    invalidateAnnotation: function(annotation) {
+        if (annotation) this.pathCache.delete(annotation);
+        this.staticDirty = true;
+    },
+
+    /**
+     * 获取标注的缓存路径（图像坐标）
+     */
+    getEntry: function(annotation) {
+        const key = annotation.type === 'circle'
+            ? `c|${annotation.x}|${annotation.y}|${annotation.radius}`
+            : `p|${annotation.points ? annotation.points.length : 0}`;
+
+        let entry = this.pathCache.get(annotation);
+        if (entry && entry.key === key) return entry;
+
+        const path = new Path2D();
+        let bbox, center;
+
+        if (annotation.type === 'circle') {
+            path.arc(annotation.x, annotation.y, annotation.radius, 0, 2 * Math.PI);
+            bbox = [annotation.x - annotation.radius, annotation.y - annotation.radius,
+                    annotation.x + annotation.radius, annotation.y + annotation.radius];
+            center = { x: annotation.x, y: annotation.y };
+        } else {
+            const points = annotation.points || [];
+            if (points.length < 3) return null;
+
+            let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+            path.moveTo(points[0].x, points[0].y);
+            points.forEach((point, i) => {
+                if (i > 0) path.lineTo(point.x, point.y);
+                if (point.x < minX) minX = point.x;
+                if (point.y < minY) minY = point.y;
+                if (point.x > maxX) maxX = point.x;
+                if (point.y > maxY) maxY = point.y;
+            });
+            path.closePath();
+            bbox = [minX, minY, maxX, maxY];
+            center = GeometryUtils.getPolygonCenter(points);
+        }
+
+        entry = { key: key, path: path, bbox: bbox, center: center };
+        this.pathCache.set(annotation, entry);
+        return entry;
+    },
+
+    /**
+     * 获取类别对应的填充色
+     */
+    getFillColor: function(hex, alpha) {
+        const cacheKey = `${hex}|${alpha}`;
+        if (!this.colorCache[cacheKey]) {
+            this.colorCache[cacheKey] = AnnotationTool.hexToRgba(hex, alpha);
+        }
+        return this.colorCache[cacheKey];
+    },
+
+    /**
+     * 当前视图变换：图像坐标 -> 屏幕坐标
+     */
+    getTransform: function() {
+        const imgX = (bgCanvas.width - imageWidth * scale) / 2 + offsetX;
+        const imgY = (bgCanvas.height - imageHeight * scale) / 2 + offsetY;
+        return { scale: scale, x: imgX, y: imgY };
+    },
+
+    /**
+     * 当前视口对应的图像坐标范围
+     */
+    getVisibleRect: function(transform) {
+        return [
+            -transform.x / transform.scale,
+            -transform.y / transform.scale,
+            (annotationCanvas.width - transform.x) / transform.scale,
+            (annotationCanvas.height - transform.y) / transform.scale
+        ];
+    },
+
+    /**
+     * 执行一帧绘制
+     */
+    render: function() {
+        if (!annotCtx || !window.cellClasses || !imageReady) return;
+
+        const transform = this.getTransform();
+        const transformKey = `${transform.scale}|${transform.x}|${transform.y}|${bgCanvas.width}|${bgCanvas.height}`;
+        let blitOffset = null;
+
+        if (transformKey !== this.backgroundKey) {
+            AnnotationTool.drawBackground();
+            this.backgroundKey = transformKey;
+
+            const state = this.staticState;
+            if (isDraggingView && !this.staticDirty && state && state.scale === transform.scale) {
+                // 平移过程中平移复用静态层，停止后再完整重建
+                blitOffset = { x: transform.x - state.x, y: transform.y - state.y };
+                clearTimeout(this.settleTimer);
+                this.settleTimer = setTimeout(() => {
+                    this.staticDirty = true;
+                    this.requestRender();
+                }, 120);
+            } else {
+                this.staticDirty = true;
+            }
+        }
+
+        if (this.staticDirty || (this.staticState && this.staticState.selectedIndex !== selectedIndex)) {
+            this.renderStaticLayer(transform);
+            blitOffset = null;
+        }
+
+        // 动态层：静态层 + 选中标注 + 预览
+        annotCtx.setTransform(1, 0, 0, 1, 0, 0);
+        annotCtx.clearRect(0, 0, annotationCanvas.width, annotationCanvas.height);
+        annotCtx.drawImage(this.staticLayer, blitOffset ? blitOffset.x : 0, blitOffset ? blitOffset.y : 0);
+
+        if (selectedIndex !== -1 && annotations[selectedIndex]) {
+            this.drawAnnotation(annotCtx, annotations[selectedIndex], selectedIndex, transform, true);
+        }
+
+        if (isDrawingPolygon && currentPolygon.length > 0) {
+            AnnotationTool.drawPolygonPreview();
+        }
+    },
+
+    /**
+     * 重建静态层：按类别合并路径，每个类别只填充和描边一次
+     */
+    renderStaticLayer: function(transform) {
+        const ctx = this.staticCtx;
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.clearRect(0, 0, this.staticLayer.width, this.staticLayer.height);
+
+        const visible = this.getVisibleRect(transform);
+        const batches = {};
+        const labels = [];
+
+        annotations.forEach((annotation, index) => {
+            if (index === selectedIndex) return;
+
+            const entry = this.getEntry(annotation);
+            if (!entry) return;
+
+            // 视口裁剪
+            const bbox = entry.bbox;
+            if (bbox[2] < visible[0] || bbox[0] > visible[2] || bbox[3] < visible[1] || bbox[1] > visible[3]) {
+                return;
+            }
+
+            const classKey = window.cellClasses[annotation.class] ? annotation.class : 'other';
+            if (!batches[classKey]) batches[classKey] = new Path2D();
+            batches[classKey].addPath(entry.path);
+
+            const screenSize = Math.min(bbox[2] - bbox[0], bbox[3] - bbox[1]) * transform.scale;
+            if (screenSize >= this.minLabelSize) {
+                labels.push({ index: index, center: entry.center });
+            }
+        });
+
+        ctx.setTransform(transform.scale, 0, 0, transform.scale, transform.x, transform.y);
+        ctx.lineWidth = 2 / transform.scale;
+
+        Object.keys(batches).forEach(classKey => {
+            const classInfo = window.cellClasses[classKey];
+            // 蜂巢类别只显示边框，不填充
+            if (classKey !== 'honeycomb') {
+                ctx.fillStyle = this.getFillColor(classInfo.border, 0.05);
+                ctx.fill(batches[classKey]);
+            }
+            ctx.strokeStyle = classInfo.border;
+            ctx.stroke(batches[classKey]);
+        });
+
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.fillStyle = '#000';
+        ctx.font = '12px Arial';
+        ctx.textAlign = 'center';
+        labels.forEach(label => {
+            ctx.fillText((label.index + 1).toString(),
+                         transform.x + label.center.x * transform.scale,
+                         transform.y + label.center.y * transform.scale + 4);
+        });
+
+        this.staticDirty = false;
+        this.staticState = { scale: transform.scale, x: transform.x, y: transform.y, selectedIndex: selectedIndex };
+    },
+
+    /**
+     * 绘制单个标注（用于动态层中的选中标注）
+     */
+    drawAnnotation: function(ctx, annotation, index, transform, isSelected) {
+        const entry = this.getEntry(annotation);
+        if (!entry) return;
+
+        const classInfo = window.cellClasses[annotation.class] || window.cellClasses.other;
+
+        ctx.setTransform(transform.scale, 0, 0, transform.scale, transform.x, transform.y);
+        if (annotation.class !== 'honeycomb') {
+            ctx.fillStyle = this.getFillColor(classInfo.border, isSelected ? 0.15 : 0.05);
+            ctx.fill(entry.path);
+        }
+        ctx.strokeStyle = isSelected ? '#ff0000' : classInfo.border;
+        ctx.lineWidth = (isSelected ? 3 : 2) / transform.scale;
+        ctx.stroke(entry.path);
+
+        ctx.setTransform(1, 0, 0, 1, 0, 0);
+        ctx.fillStyle = '#000';
+        ctx.font = '12px Arial';
+        ctx.textAlign = 'center';
+        ctx.fillText((index + 1).toString(),
+                     transform.x + entry.center.x * transform.scale,
+                     transform.y + entry.center.y * transform.scale + 4);
+    }
+};
+
+// 导出到全局
+window.RenderEngine = RenderEngine;
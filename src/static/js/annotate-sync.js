@@ -0,0 +1,255 @@
+/**
+ * 蜂格标注工具 - 自动保存与离线队列
+ * 编辑后延迟合并保存；每次保存先写入 IndexedDB 再发送，失败按指数退避重试，
+ * 网络恢复后按入队顺序补发。同一图像在队列中只保留最新版本。
+ */
+
+const SyncQueue = {
+    dbName: 'beeanotate-sync',
+    storeName: 'saves',
+    db: null,
+    memoryStore: new Map(),   // IndexedDB 不可用时的内存队列
+
+    // 最后一次编辑后多久自动保存（毫秒）
+    autosaveDelay: 2000,
+    retryBaseDelay: 1000,
+    retryMaxDelay: 60000,
+
+    autosaveTimer: null,
+    retryTimer: null,
+    attempts: 0,
+    flushing: null,
+    seq: 0,
+    lastSaved: new Map(),     // image_id -> 最近一次成功保存的序列化内容
+    status: 'saved',
+
+    /**
+     * 打开数据库，返回当前图像未同步的保存记录（如有）
+     */
+    init: async function(imageId) {
+        window.addEventListener('online', () => this.flush().catch(() => {}));
+
+        try {
+            this.db = await this.openDatabase();
+        } catch (error) {
+            console.warn('IndexedDB不可用，离线队列仅保存在内存中:', error);
+            this.db = null;
+        }
+
+        const entries = await this.getAll();
+        this.seq = entries.reduce((max, entry) => Math.max(max, entry.seq), 0);
+        this.updateStatus(entries.length > 0 ? 'queued' : 'saved', entries.length);
+        return entries.find(entry => entry.image_id === imageId) || null;
+    },
+
+    openDatabase: function() {
+        return new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                reject(new Error('不支持IndexedDB'));
+                return;
+            }
+            const request = indexedDB.open(this.dbName, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(this.storeName, { keyPath: 'image_id' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    },
+
+    /**
+     * 在对象仓库上执行一次请求
+     */
+    transact: function(mode, action) {
+        return new Promise((resolve, reject) => {
+            const tx = this.db.transaction(this.storeName, mode);
+            const request = action(tx.objectStore(this.storeName));
+            tx.oncomplete = () => resolve(request ? request.result : undefined);
+            tx.onerror = () => reject(tx.error);
+        });
+    },
+
+    put: function(entry) {
+        if (!this.db) {
+            this.memoryStore.set(entry.image_id, entry);
+            return Promise.resolve();
+        }
+        return this.transact('readwrite', store => store.put(entry));
+    },
+
+    get: function(imageId) {
+        if (!this.db) return Promise.resolve(this.memoryStore.get(imageId));
+        return this.transact('readonly', store => store.get(imageId));
+    },
+
+    remove: function(imageId) {
+        if (!this.db) {
+            this.memoryStore.delete(imageId);
+            return Promise.resolve();
+        }
+        return this.transact('readwrite', store => store.delete(imageId));
+    },
+
+    getAll: async function() {
+        const entries = this.db
+            ? await this.transact('readonly', store => store.getAll())
+            : [...this.memoryStore.values()];
+        return entries.sort((a, b) => a.seq - b.seq);
+    },
+
+    /**
+     * 编辑后调用：延迟一段时间再保存，期间的多次编辑合并为一次
+     */
+    schedule: function() {
+        clearTimeout(this.autosaveTimer);
+        this.updateStatus('pending');
+        this.autosaveTimer = setTimeout(() => this.saveCurrent().catch(() => {}), this.autosaveDelay);
+    },
+
+    /**
+     * 将当前图像的完整标注列表写入队列并立即同步
+     *
+     * 协同通道可用时改为提交待发送的操作并请求服务器写入快照；
+     * full 为 true 时强制整文档保存。
+     */
+    saveCurrent: async function(full) {
+        clearTimeout(this.autosaveTimer);
+        if (!full && CollabChannel.isActive()) {
+            return CollabChannel.saveNow();
+        }
+
+        // 确保保存的是完整标注列表
+        await ViewportLoader.loadAll();
+
+        const imageId = window.imageData.id;
+        const body = JSON.stringify(annotations);
+        if (this.lastSaved.get(imageId) === body) {
+            isDirty = false;
+            this.updateStatus('saved');
+            return null;
+        }
+
+        await this.enqueue(imageId, JSON.parse(body));
+        return this.flush(imageId);
+    },
+
+    /**
+     * 写入（覆盖）某图像的待同步记录
+     */
+    enqueue: function(imageId, list) {
+        this.seq += 1;
+        return this.put({
+            image_id: imageId,
+            annotations: list,
+            seq: this.seq,
+            queued_at: new Date().toISOString()
+        });
+    },
+
+    /**
+     * 按入队顺序发送所有待同步记录
+     *
+     * 网络错误时停止并按指数退避安排重试；服务器拒绝的记录保留在队列中，
+     * 不阻塞后续记录。返回 waitFor 对应图像的服务器响应（如有）。
+     */
+    flush: function(waitFor) {
+        if (this.flushing) {
+            // 正在同步时，等本轮结束后再补一轮，确保新入队的记录被发送
+            return this.flushing.catch(() => {}).then(() => this.flush(waitFor));
+        }
+
+        clearTimeout(this.retryTimer);
+        this.flushing = this.runFlush(waitFor).finally(() => {
+            this.flushing = null;
+        });
+        return this.flushing;
+    },
+
+    runFlush: async function(waitFor) {
+        const entries = await this.getAll();
+        let result = null;
+        let rejected = 0;
+
+        for (const entry of entries) {
+            this.updateStatus('saving', entries.length);
+            let response;
+            try {
+                response = await API.post('/api/save_annotation', {
+                    image_id: entry.image_id,
+                    annotations: entry.annotations,
+                    client_id: CollabChannel.clientId
+                });
+            } catch (error) {
+                this.scheduleRetry();
+                // 队列在此中断，等待中的图像尚未送达
+                if (waitFor) throw error;
+                return result;
+            }
+
+            if (!response.success) {
+                console.error(`服务器拒绝保存 ${entry.image_id}:`, response.error, response.errors || []);
+                rejected += 1;
+                if (entry.image_id === waitFor) result = response;
+                continue;
+            }
+
+            // 发送期间如有更新的版本入队，则保留新版本
+            const current = await this.get(entry.image_id);
+            if (current && current.seq === entry.seq) {
+                await this.remove(entry.image_id);
+            }
+            this.lastSaved.set(entry.image_id, JSON.stringify(entry.annotations));
+            if (entry.image_id === window.imageData.id && JSON.stringify(annotations) === this.lastSaved.get(entry.image_id)) {
+                isDirty = false;
+            }
+            if (entry.image_id === waitFor) result = response;
+        }
+
+        this.attempts = 0;
+        const remaining = (await this.getAll()).length;
+        this.updateStatus(rejected > 0 ? 'error' : (remaining > 0 ? 'queued' : 'saved'), remaining);
+        return result;
+    },
+
+    /**
+     * 指数退避重试（带随机抖动）
+     */
+    scheduleRetry: function() {
+        const delay = Math.min(this.retryBaseDelay * Math.pow(2, this.attempts), this.retryMaxDelay);
+        this.attempts += 1;
+
+        const status = navigator.onLine === false ? 'offline' : 'retrying';
+        this.status = status;
+        this.getAll().then(entries => this.updateStatus(status, entries.length));
+
+        clearTimeout(this.retryTimer);
+        this.retryTimer = setTimeout(() => this.flush().catch(() => {}), delay * (0.5 + Math.random() / 2));
+    },
+
+    /**
+     * 更新保存状态显示
+     */
+    updateStatus: function(status, count) {
+        this.status = status;
+        const element = document.getElementById('syncStatus');
+        if (!element) return;
+
+        const styles = {
+            saved: ['bi-cloud-check', 'text-success'],
+            pending: ['bi-pencil', 'text-muted'],
+            saving: ['bi-cloud-arrow-up', 'text-primary'],
+            queued: ['bi-cloud-arrow-up', 'text-warning'],
+            retrying: ['bi-arrow-repeat', 'text-warning'],
+            offline: ['bi-cloud-slash', 'text-danger'],
+            error: ['bi-exclamation-triangle', 'text-danger']
+        };
+        const [icon, color] = styles[status];
+        const text = getI18nText(`sync_${status}`).replace('{count}', count || 0);
+
+        element.className = `small ${color}`;
+        element.innerHTML = `<i class="bi ${icon}"></i> ${text}`;
+    }
+};
+
+// 导出到全局
+window.SyncQueue = SyncQueue;
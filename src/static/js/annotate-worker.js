@@ -0,0 +1,183 @@
+/**
+ * 蜂格标注工具 - 后台服务
+ * 封装 geometry-worker.js：图像解码、批量几何计算、相邻图像及标注预取。
+ * 浏览器不支持 Worker 时各方法回退到主线程或直接跳过。
+ */
+
+const GeometryService = {
+    worker: null,
+    disabled: false,
+    pending: new Map(),
+    nextId: 1,
+
+    // 标注对象 -> { area, center }
+    measures: new WeakMap(),
+    measuring: null,
+
+    // 标注列表超过该数量时，多边形质心交给 Worker 计算
+    bulkThreshold: 200,
+
+    prefetchKeyPrefix: 'beeanotate:prefetch:',
+
+    /**
+     * 获取（按需创建）Worker
+     */
+    getWorker: function() {
+        if (this.worker || this.disabled) return this.worker;
+        if (!window.Worker || !window.geometryWorkerUrl) {
+            this.disabled = true;
+            return null;
+        }
+
+        try {
+            this.worker = new Worker(window.geometryWorkerUrl);
+        } catch (error) {
+            console.warn('Worker创建失败，回退到主线程:', error);
+            this.disabled = true;
+            return null;
+        }
+
+        this.worker.onmessage = (e) => {
+            const { id, result, error } = e.data;
+            const task = this.pending.get(id);
+            if (!task) return;
+            this.pending.delete(id);
+            if (error) {
+                task.reject(new Error(error));
+            } else {
+                task.resolve(result);
+            }
+        };
+        this.worker.onerror = (e) => {
+            console.warn('Worker运行错误，回退到主线程:', e.message);
+            this.disabled = true;
+            this.worker.terminate();
+            this.worker = null;
+            this.pending.forEach(task => task.reject(new Error(e.message)));
+            this.pending.clear();
+        };
+        return this.worker;
+    },
+
+    /**
+     * 向 Worker 发送任务
+     */
+    call: function(op, payload) {
+        const worker = this.getWorker();
+        if (!worker) {
+            return Promise.reject(new Error('Worker不可用'));
+        }
+
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve: resolve, reject: reject });
+            worker.postMessage({ id: id, op: op, payload: payload });
+        });
+    },
+
+    /**
+     * 在 Worker 中下载并解码图像，返回 ImageBitmap
+     */
+    decodeImage: function(url) {
+        if (!window.createImageBitmap) {
+            return Promise.reject(new Error('不支持createImageBitmap'));
+        }
+        return this.call('decode', { url: new URL(url, window.location.href).href });
+    },
+
+    /**
+     * 获取已计算的多边形面积与质心
+     */
+    getMeasure: function(annotation) {
+        return this.measures.get(annotation) || null;
+    },
+
+    /**
+     * 标注几何变化后清除缓存
+     */
+    invalidate: function(annotation) {
+        if (annotation) this.measures.delete(annotation);
+    },
+
+    /**
+     * 批量计算尚未缓存的多边形面积与质心
+     */
+    measureList: function(list) {
+        if (this.measuring) return this.measuring;
+
+        const targets = list.filter(a => a.type === 'polygon' && a.points && !this.measures.has(a));
+        if (targets.length === 0) return Promise.resolve();
+
+        const polygons = targets.map(a => a.points.map(p => ({ x: p.x, y: p.y })));
+        this.measuring = this.call('measure', { polygons: polygons })
+            .catch(() => polygons.map(points => ({
+                area: GeometryUtils.getPolygonArea(points),
+                center: GeometryUtils.getPolygonCenter(points)
+            })))
+            .then(results => {
+                targets.forEach((annotation, i) => this.measures.set(annotation, results[i]));
+            })
+            .finally(() => {
+                this.measuring = null;
+            });
+        return this.measuring;
+    },
+
+    /**
+     * 预取上一张/下一张图像及其标注
+     *
+     * 图像由 Worker 下载并试解码后进入浏览器缓存；标注写入 sessionStorage，
+     * 打开对应页面时若修订号一致则直接使用，无需再请求。
+     */
+    prefetchNeighbours: function(navigation) {
+        if (!navigation || !this.getWorker()) return;
+
+        const neighbours = [navigation.prev_image, navigation.next_image].filter(Boolean);
+        if (neighbours.length === 0) return;
+
+        const payload = {
+            images: neighbours.map(n => new URL(n.path, window.location.href).href),
+            annotations: neighbours
+                .filter(n => n.annotation_count > 0)
+                .map(n => ({
+                    id: n.id,
+                    url: new URL(`/api/annotations/${encodeURIComponent(n.id)}`, window.location.href).href
+                }))
+        };
+
+        this.call('prefetch', payload)
+            .then(result => {
+                Object.keys(result.annotations).forEach(imageId => {
+                    const data = result.annotations[imageId];
+                    try {
+                        sessionStorage.setItem(this.prefetchKeyPrefix + imageId, JSON.stringify({
+                            revision: data.revision,
+                            annotations: data.annotations
+                        }));
+                    } catch (error) {
+                        // 超出存储配额时放弃缓存该图像的标注
+                    }
+                });
+            })
+            .catch(error => console.warn('预取相邻图像失败:', error));
+    },
+
+    /**
+     * 取出预取的标注（修订号不一致时丢弃）
+     */
+    takePrefetched: function(imageId, revision) {
+        const key = this.prefetchKeyPrefix + imageId;
+        let entry = null;
+        try {
+            entry = JSON.parse(sessionStorage.getItem(key));
+            sessionStorage.removeItem(key);
+        } catch (error) {
+            return null;
+        }
+        if (!entry || !revision || entry.revision !== revision) return null;
+        return entry.annotations;
+    }
+};
+
+// 导出到全局
+window.GeometryService = GeometryService;
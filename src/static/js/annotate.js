@@ -6,6 +6,9 @@
 // 全局变量
 let bgCanvas, annotationCanvas, bgCtx, annotCtx;
 let imageObj = new Image();
+let imageReady = false;
+// 标注坐标空间中的图像尺寸（原图像素）；显示的可能是缩小后的浏览副本
+let imageWidth = 0, imageHeight = 0;
 let annotations = [];
 let currentClass = 'other';
 let isDirty = false;
@@ -41,25 +44,38 @@ let currentMousePos = null;
 
 /**
  * 操作历史管理器
- * 支持撤销/重做功能
+ * 支持撤销/重做功能。每条历史记录只保存被修改标注的前后状态（增量），
+ * 内存占用与编辑量成正比，撤销/重做的开销与单次编辑的规模成正比。
+ * 标注带ID时按ID定位（协同编辑中其他人的修改会改变下标）。
+ *
+ * 操作类型：
+ *   insert  { index, annotation }     在 index 处插入标注
+ *   remove  { index, annotation }     删除 index 处的标注
+ *   update  { index, before, after }  替换 index 处的标注
+ *   clear   { before }                清空全部标注
  */
 const HistoryManager = {
     stack: [],
     currentIndex: -1,
-    maxSize: 20,
+    maxSize: 100,
+    // 同一标注的连续调整（如拖动半径滑块）在该时间内合并为一条记录
+    mergeWindow: 1000,
     
     /**
-     * 保存当前状态到历史栈
+     * 复制单个标注
      */
-    saveState: function() {
-        // 深拷贝当前标注状态
-        const state = JSON.parse(JSON.stringify(annotations));
-        
-        // 如果当前不在栈顶，删除后面的状态
+    snapshot: function(annotation) {
+        return JSON.parse(JSON.stringify(annotation));
+    },
+    
+    /**
+     * 记录一组操作（作为一次撤销单位）
+     */
+    record: function(ops, mergeKey) {
+        // 如果当前不在栈顶，删除后面的记录
         this.stack = this.stack.slice(0, this.currentIndex + 1);
         
-        // 添加新状态
-        this.stack.push(state);
+        this.stack.push({ ops: ops, mergeKey: mergeKey || null, time: Date.now() });
         
         // 限制栈大小
         if (this.stack.length > this.maxSize) {
@@ -70,41 +86,150 @@ const HistoryManager = {
         
         // 更新按钮状态
         this.updateButtons();
+        this.sync(ops, false);
+    },
+    
+    /**
+     * 同步一组操作：优先通过协同通道逐条提交，否则整文档自动保存
+     */
+    sync: function(ops, reverse) {
+        if (!CollabChannel.send(ops, reverse)) {
+            SyncQueue.schedule();
+        }
+    },
+    
+    /**
+     * 记录新增标注（在 push/splice 之后调用）
+     */
+    recordInsert: function(index, annotation) {
+        this.record([{ type: 'insert', index: index, annotation: this.snapshot(annotation) }]);
+    },
+    
+    /**
+     * 记录删除标注（被删除的对象已不在列表中，无需复制）
+     */
+    recordRemove: function(index, annotation) {
+        this.record([{ type: 'remove', index: index, annotation: annotation }]);
+    },
+    
+    /**
+     * 记录标注修改，before 为修改前的副本；状态未变化时不记录
+     */
+    recordUpdate: function(index, before, annotation, mergeKey) {
+        const after = this.snapshot(annotation);
+        if (JSON.stringify(before) === JSON.stringify(after)) return;
+        
+        const top = this.stack[this.currentIndex];
+        if (mergeKey && top && this.currentIndex === this.stack.length - 1 &&
+            top.mergeKey === mergeKey && top.ops[0].index === index &&
+            Date.now() - top.time < this.mergeWindow) {
+            const previous = top.ops[0].after;
+            top.ops[0].after = after;
+            top.time = Date.now();
+            this.sync([{ type: 'update', index: index, before: previous, after: after }], false);
+            return;
+        }
+        
+        this.record([{ type: 'update', index: index, before: before, after: after }], mergeKey);
+    },
+    
+    /**
+     * 记录清空全部标注（旧列表已被替换，直接保存引用）
+     */
+    recordClear: function(before) {
+        this.record([{ type: 'clear', before: before }]);
+    },
+    
+    /**
+     * 查找操作对应标注的当前下标（有ID时按ID，否则使用记录的下标）
+     */
+    locate: function(op, annotation) {
+        if (annotation && annotation.id) {
+            return annotations.findIndex(a => a.id === annotation.id);
+        }
+        return op.index;
     },
     
     /**
-     * 撤销到上一个状态
+     * 正向或反向应用一条操作
+     */
+    applyOp: function(op, reverse) {
+        switch (op.type) {
+            case 'insert':
+            case 'remove': {
+                const adding = (op.type === 'insert') !== reverse;
+                if (adding) {
+                    const annotation = this.snapshot(op.annotation);
+                    annotations.splice(Math.min(op.index, annotations.length), 0, annotation);
+                    HitIndex.insert(annotation);
+                } else {
+                    const index = this.locate(op, op.annotation);
+                    if (index >= 0) HitIndex.remove(annotations.splice(index, 1)[0]);
+                }
+                break;
+            }
+            case 'update': {
+                const index = this.locate(op, op.after);
+                if (index < 0) break;
+                HitIndex.remove(annotations[index]);
+                annotations[index] = this.snapshot(reverse ? op.before : op.after);
+                HitIndex.insert(annotations[index]);
+                break;
+            }
+            case 'clear':
+                if (reverse) {
+                    // 保留清空之后（其他标注者）新增的标注
+                    annotations = op.before.map(a => this.snapshot(a)).concat(annotations);
+                } else {
+                    const ids = new Set(op.before.map(a => a.id).filter(Boolean));
+                    annotations = annotations.filter(a => a.id && !ids.has(a.id));
+                }
+                break;
+        }
+    },
+    
+    /**
+     * 应用历史记录后刷新界面
+     */
+    afterApply: function(messageKey) {
+        isDirty = true;
+        if (selectedIndex >= annotations.length) {
+            selectedIndex = -1;
+        }
+        
+        AnnotationTool.redrawAll();
+        AnnotationTool.updateAnnotationList();
+        AnnotationTool.updateAnnotationCount();
+        
+        this.updateButtons();
+        Utils.showMessage(getI18nText(messageKey), 'info', 1000);
+    },
+    
+    /**
+     * 撤销上一条记录
      */
     undo: function() {
         if (this.canUndo()) {
+            const entry = this.stack[this.currentIndex];
+            for (let i = entry.ops.length - 1; i >= 0; i--) {
+                this.applyOp(entry.ops[i], true);
+            }
             this.currentIndex--;
-            annotations = JSON.parse(JSON.stringify(this.stack[this.currentIndex]));
-            isDirty = true;
-            
-            AnnotationTool.redrawAll();
-            AnnotationTool.updateAnnotationList();
-            AnnotationTool.updateAnnotationCount();
-            
-            this.updateButtons();
-            Utils.showMessage(getI18nText('operation_undone'), 'info', 1000);
+            this.sync(entry.ops, true);
+            this.afterApply('operation_undone');
         }
     },
     
     /**
-     * 重做到下一个状态
+     * 重做下一条记录
      */
     redo: function() {
         if (this.canRedo()) {
             this.currentIndex++;
-            annotations = JSON.parse(JSON.stringify(this.stack[this.currentIndex]));
-            isDirty = true;
-            
-            AnnotationTool.redrawAll();
-            AnnotationTool.updateAnnotationList();
-            AnnotationTool.updateAnnotationCount();
-            
-            this.updateButtons();
-            Utils.showMessage(getI18nText('operation_redone'), 'info', 1000);
+            const entry = this.stack[this.currentIndex];
+            entry.ops.forEach(op => this.applyOp(op, false));
+            this.sync(entry.ops, false);
+            this.afterApply('operation_redone');
         }
     },
     
@@ -112,7 +237,7 @@ const HistoryManager = {
      * 检查是否可以撤销
      */
     canUndo: function() {
-        return this.currentIndex > 0;
+        return this.currentIndex >= 0;
     },
     
     /**
@@ -147,11 +272,155 @@ const HistoryManager = {
     },
     
     /**
-     * 初始化历史管理器
+     * 初始化历史管理器（以当前标注列表为起点）
      */
     init: function() {
-        // 保存初始状态
-        this.saveState();
+        this.clear();
+    }
+};
+
+/**
+ * 视口标注加载器
+ * 先加载当前视口内的标注，平移/缩放时按视口补充，空闲时在后台加载完整列表。
+ * 完整列表加载完成前不允许编辑，避免保存不完整的标注。
+ */
+const ViewportLoader = {
+    loaded: new Map(),
+    total: 0,
+    complete: false,
+    fullLoadPromise: null,
+    scheduleViewportLoad: null,
+
+    /**
+     * 初始化加载器
+     */
+    init: function() {
+        this.total = (window.imageData && window.imageData.annotation_count) || 0;
+        this.scheduleViewportLoad = Utils.debounce(() => this.loadViewport(), 150);
+        
+        if (this.total === 0) {
+            this.markComplete([]);
+            return;
+        }
+        
+        // 上一页已预取且修订号一致时直接使用
+        const prefetched = GeometryService.takePrefetched(window.imageData.id, window.imageData.revision);
+        if (prefetched) {
+            this.markComplete(prefetched);
+        }
+    },
+
+    /**
+     * 获取当前视口对应的图像坐标范围
+     */
+    getViewportBbox: function() {
+        const topLeft = AnnotationUtils.screenToImage(0, 0);
+        const bottomRight = AnnotationUtils.screenToImage(annotationCanvas.width, annotationCanvas.height);
+        
+        return [
+            AnnotationUtils.clamp(topLeft.x, 0, imageWidth),
+            AnnotationUtils.clamp(topLeft.y, 0, imageHeight),
+            AnnotationUtils.clamp(bottomRight.x, 0, imageWidth),
+            AnnotationUtils.clamp(bottomRight.y, 0, imageHeight)
+        ].map(v => Math.round(v));
+    },
+
+    /**
+     * 加载当前视口内的标注
+     */
+    loadViewport: async function() {
+        if (this.complete || !imageWidth) return;
+        
+        const bbox = this.getViewportBbox().join(',');
+        try {
+            const response = await API.get(`/api/annotations/${encodeURIComponent(window.imageData.id)}?bbox=${bbox}`);
+            if (!response.success || this.complete) return;
+            
+            response.indices.forEach((annotationIndex, i) => {
+                this.loaded.set(annotationIndex, response.annotations[i]);
+            });
+            annotations = [...this.loaded.keys()].sort((a, b) => a - b).map(i => this.loaded.get(i));
+            
+            AnnotationTool.redrawAll();
+            AnnotationTool.updateAnnotationList();
+        } catch (error) {
+            console.error('视口标注加载失败:', error);
+        }
+    },
+
+    /**
+     * 加载完整标注列表（只请求一次）
+     */
+    loadAll: function() {
+        if (this.complete) return Promise.resolve();
+        
+        if (!this.fullLoadPromise) {
+            this.fullLoadPromise = API.get(`/api/annotations/${encodeURIComponent(window.imageData.id)}`)
+                .then(response => {
+                    if (!response.success) {
+                        throw new Error(response.error);
+                    }
+                    // 离线队列中的本地版本可能已先行载入
+                    if (!this.complete) {
+                        this.markComplete(response.annotations);
+                    }
+                })
+                .catch(error => {
+                    this.fullLoadPromise = null;
+                    Utils.showMessage(getI18nText('annotations_load_failed'), 'error');
+                    throw error;
+                });
+        }
+        return this.fullLoadPromise;
+    },
+
+    /**
+     * 首屏视口加载后，在浏览器空闲时加载完整列表
+     */
+    loadAllWhenIdle: function() {
+        const start = () => this.loadAll().catch(() => {});
+        if ('requestIdleCallback' in window) {
+            requestIdleCallback(start, { timeout: 2000 });
+        } else {
+            setTimeout(start, 200);
+        }
+    },
+
+    /**
+     * 完整列表就绪
+     */
+    markComplete: function(list) {
+        this.complete = true;
+        this.loaded.clear();
+        annotations = list;
+        selectedIndex = -1;
+        
+        AnnotationTool.redrawAll();
+        AnnotationTool.updateAnnotationList();
+        AnnotationTool.updateAnnotationCount();
+        
+        // 以完整列表作为历史起点
+        HistoryManager.clear();
+        HistoryManager.init();
+        
+        // 当前图像就绪后，空闲时预取相邻图像
+        const prefetch = () => GeometryService.prefetchNeighbours(window.navigationData);
+        if ('requestIdleCallback' in window) {
+            requestIdleCallback(prefetch, { timeout: 5000 });
+        } else {
+            setTimeout(prefetch, 1000);
+        }
+    },
+
+    /**
+     * 编辑前检查完整列表是否已加载
+     */
+    requireComplete: function() {
+        if (this.complete) return true;
+        
+        Utils.showMessage(getI18nText('annotations_loading'), 'info', 1500);
+        this.loadAll().catch(() => {});
+        return false;
     }
 };
 
@@ -295,6 +564,19 @@ const GeometryUtils = {
             x: totalX / points.length,
             y: totalY / points.length
         };
+    },
+
+    /**
+     * 计算多边形面积（鞋带公式）
+     */
+    getPolygonArea: function(points) {
+        if (!points || points.length < 3) return 0;
+        
+        let twiceArea = 0;
+        for (let i = 0, j = points.length - 1; i < points.length; j = i++) {
+            twiceArea += points[j].x * points[i].y - points[i].x * points[j].y;
+        }
+        return Math.abs(twiceArea) / 2;
     }
 };
 
@@ -336,6 +618,18 @@ const AnnotationTool = {
         
         // 初始化历史管理器
         HistoryManager.init();
+        
+        // 初始化离线队列：当前图像有未同步的本地版本时优先使用，然后补发队列
+        SyncQueue.init(window.imageData && window.imageData.id).then(entry => {
+            if (entry) {
+                ViewportLoader.markComplete(entry.annotations);
+                isDirty = true;
+            }
+            SyncQueue.flush().catch(() => {});
+            
+            // 连接协同通道（在载入本地版本之后，避免被服务器状态覆盖）
+            CollabChannel.init(window.imageData && window.imageData.id);
+        });
     },
 
     /**
@@ -409,17 +703,43 @@ const AnnotationTool = {
             return;
         }
 
-        imageObj.onload = () => {
+        const onReady = () => {
+            // 浏览副本按原图尺寸拉伸绘制，标注坐标始终是原图像素
+            if (!window.imageData.derivative || !imageWidth) {
+                imageWidth = imageObj.width;
+                imageHeight = imageObj.height;
+            }
+            imageReady = true;
             this.resetView();
             this.redrawAll();
             Utils.showMessage(getI18nText('image_load_success'), 'success', 2000);
+            
+            if (!ViewportLoader.complete) {
+                ViewportLoader.loadViewport().then(() => ViewportLoader.loadAllWhenIdle());
+            }
         };
 
-        imageObj.onerror = () => {
-            Utils.showMessage(getI18nText('image_load_failed'), 'error');
-        };
+        // 服务器已知图像尺寸时先按尺寸布局视图并加载视口内标注，不必等待图像下载
+        if (window.imageData.width && window.imageData.height) {
+            imageWidth = window.imageData.width;
+            imageHeight = window.imageData.height;
+            this.resetView();
+            ViewportLoader.loadViewport();
+        }
 
-        imageObj.src = window.imageData.path;
+        // 优先在Worker中下载并解码，避免大图解码阻塞UI线程
+        GeometryService.decodeImage(window.imageData.path)
+            .then(bitmap => {
+                imageObj = bitmap;
+                onReady();
+            })
+            .catch(() => {
+                imageObj.onload = onReady;
+                imageObj.onerror = () => {
+                    Utils.showMessage(getI18nText('image_load_failed'), 'error');
+                };
+                imageObj.src = window.imageData.path;
+            });
     },
 
     /**
@@ -442,20 +762,22 @@ const AnnotationTool = {
         annotationCanvas.height = height;
         annotationCanvas.style.width = width + 'px';
         annotationCanvas.style.height = height + 'px';
+        
+        RenderEngine.resize(width, height);
     },
 
     /**
      * 重置视图到初始状态
      */
     resetView: function() {
-        if (!imageObj.complete) return;
+        if (!imageWidth) return;
         
         const containerWidth = bgCanvas.width;
         const containerHeight = bgCanvas.height;
         
         // 计算适合的缩放比例
-        const scaleX = containerWidth / imageObj.width;
-        const scaleY = containerHeight / imageObj.height;
+        const scaleX = containerWidth / imageWidth;
+        const scaleY = containerHeight / imageHeight;
         scale = Math.min(scaleX, scaleY, 1); // 不超过1倍
         
         // 居中显示
@@ -466,25 +788,37 @@ const AnnotationTool = {
     },
 
     /**
-     * 重绘所有内容
+     * 重绘所有内容（标注发生变化时调用，重建静态层）
      */
     redrawAll: function() {
-        this.drawBackground();
-        this.drawAnnotations();
+        RenderEngine.invalidateAnnotations();
+        this.requestRedraw();
+    },
+
+    /**
+     * 请求重绘（仅视图变换或选中/预览变化时调用，复用静态层）
+     */
+    requestRedraw: function() {
+        RenderEngine.requestRender();
+        
+        // 完整列表加载前，视口变化时补充加载
+        if (!ViewportLoader.complete && ViewportLoader.scheduleViewportLoad) {
+            ViewportLoader.scheduleViewportLoad();
+        }
     },
 
     /**
-     * 绘制背景图像
+     * 绘制背景图像（由渲染引擎在视图变换时调用）
      */
     drawBackground: function() {
-        if (!bgCtx || !imageObj.complete) return;
+        if (!bgCtx || !imageReady) return;
         
         // 清除背景Canvas
         bgCtx.clearRect(0, 0, bgCanvas.width, bgCanvas.height);
         
         // 计算图像绘制位置和大小
-        const imgWidth = imageObj.width * scale;
-        const imgHeight = imageObj.height * scale;
+        const imgWidth = imageWidth * scale;
+        const imgHeight = imageHeight * scale;
         const imgX = (bgCanvas.width - imgWidth) / 2 + offsetX;
         const imgY = (bgCanvas.height - imgHeight) / 2 + offsetY;
         
@@ -492,125 +826,13 @@ const AnnotationTool = {
         bgCtx.drawImage(imageObj, imgX, imgY, imgWidth, imgHeight);
     },
 
-    /**
-     * 绘制所有标注
-     */
-    drawAnnotations: function() {
-        if (!annotCtx || !window.cellClasses) return;
-        
-        // 清除标注Canvas
-        annotCtx.clearRect(0, 0, annotationCanvas.width, annotationCanvas.height);
-        
-        annotations.forEach((annotation, index) => {
-            this.drawSingleAnnotation(annotation, index);
-        });
-        
-        // 绘制正在创建的多边形
-        if (isDrawingPolygon && currentPolygon.length > 0) {
-            this.drawPolygonPreview();
-        }
-        
-
-    },
-
-    /**
-     * 绘制单个标注
-     */
-    drawSingleAnnotation: function(annotation, index) {
-        const classInfo = window.cellClasses[annotation.class] || window.cellClasses.other;
-        const isSelected = index === selectedIndex;
-        
-        if (annotation.type === 'circle') {
-            this.drawCircleAnnotation(annotation, classInfo, index, isSelected);
-        } else if (annotation.type === 'polygon') {
-            this.drawPolygonAnnotation(annotation, classInfo, index, isSelected);
-        }
-    },
-
-    /**
-     * 绘制圆形标注
-     */
-    drawCircleAnnotation: function(annotation, classInfo, index, isSelected) {
-        const screenPos = this.imageToScreen(annotation.x, annotation.y);
-        const screenRadius = annotation.radius * scale;
-        
-        annotCtx.beginPath();
-        annotCtx.arc(screenPos.x, screenPos.y, screenRadius, 0, 2 * Math.PI);
-        
-        // 填充（蜂巢类别只显示边框，不填充）
-        if (annotation.class !== 'honeycomb') {
-            // 将颜色转换为极浅的透明色（审查模式）
-            const baseColor = this.hexToRgba(classInfo.border, isSelected ? 0.15 : 0.05);
-            annotCtx.fillStyle = baseColor;
-            annotCtx.fill();
-        }
-        
-        // 边框
-        annotCtx.strokeStyle = isSelected ? '#ff0000' : classInfo.border;
-        annotCtx.lineWidth = isSelected ? 3 : 2;
-        annotCtx.stroke();
-        
-        // 标注编号
-        annotCtx.fillStyle = '#000';
-        annotCtx.font = '12px Arial';
-        annotCtx.textAlign = 'center';
-        annotCtx.fillText((index + 1).toString(), screenPos.x, screenPos.y + 4);
-    },
-
-    /**
-     * 绘制多边形标注
-     */
-    drawPolygonAnnotation: function(annotation, classInfo, index, isSelected) {
-        if (!annotation.points || annotation.points.length < 3) return;
-        
-        // 绘制简单多边形
-        this.drawSimplePolygon(annotation, classInfo, index, isSelected);
-    },
-
-    /**
-     * 绘制简单多边形（无洞）
-     */
-    drawSimplePolygon: function(annotation, classInfo, index, isSelected) {
-        annotCtx.beginPath();
-        const firstPoint = this.imageToScreen(annotation.points[0].x, annotation.points[0].y);
-        annotCtx.moveTo(firstPoint.x, firstPoint.y);
-        
-        for (let i = 1; i < annotation.points.length; i++) {
-            const point = this.imageToScreen(annotation.points[i].x, annotation.points[i].y);
-            annotCtx.lineTo(point.x, point.y);
-        }
-        annotCtx.closePath();
-        
-        // 填充（蜂巢类别只显示边框，不填充）
-        if (annotation.class !== 'honeycomb') {
-            // 将颜色转换为极浅的透明色（审查模式）
-            const baseColor = this.hexToRgba(classInfo.border, isSelected ? 0.15 : 0.05);
-            annotCtx.fillStyle = baseColor;
-            annotCtx.fill();
-        }
-        
-        // 边框
-        annotCtx.strokeStyle = isSelected ? '#ff0000' : classInfo.border;
-        annotCtx.lineWidth = isSelected ? 3 : 2;
-        annotCtx.stroke();
-        
-        // 标注编号（在质心位置）
-        const center = GeometryUtils.getPolygonCenter(annotation.points);
-        const screenCenter = this.imageToScreen(center.x, center.y);
-        annotCtx.fillStyle = '#000';
-        annotCtx.font = '12px Arial';
-        annotCtx.textAlign = 'center';
-        annotCtx.fillText((index + 1).toString(), screenCenter.x, screenCenter.y + 4);
-    },
-
-
-
     /**
      * 处理Canvas点击事件
      */
     handleCanvasClick: function(e) {
         // 忽略右键点击和拖动后的点击
         if (isDraggingView || isDraggingAnnotation || e.button === 2 || hasDragged) return;
+        if (!ViewportLoader.requireComplete()) return;
         
         const rect = annotationCanvas.getBoundingClientRect();
         const screenX = e.clientX - rect.left;
@@ -658,9 +880,9 @@ const AnnotationTool = {
             y: e.clientY - rect.top
         };
         
-        // 如果正在绘制多边形，需要重绘以显示预览线段
+        // 如果正在绘制多边形，需要重绘以显示预览线段（仅动态层）
         if (isDrawingPolygon) {
-            this.redrawAll();
+            this.requestRedraw();
         }
         
         // 处理拖动和光标更新
@@ -696,14 +918,15 @@ const AnnotationTool = {
         const imagePos = AnnotationUtils.screenToImage(screenX, screenY);
         
         // 检查是否在图像范围内
-        if (imagePos.x < 0 || imagePos.x > imageObj.width || 
-            imagePos.y < 0 || imagePos.y > imageObj.height) {
+        if (imagePos.x < 0 || imagePos.x > imageWidth || 
+            imagePos.y < 0 || imagePos.y > imageHeight) {
             Utils.showMessage(getI18nText('click_within_image'), 'warning', 2000);
             return;
         }
         
         // 创建新标注
         const annotation = {
+            id: CollabChannel.newId(),
             type: 'circle',
             x: imagePos.x,
             y: imagePos.y,
@@ -713,6 +936,7 @@ const AnnotationTool = {
         };
         
         annotations.push(annotation);
+        HitIndex.insert(annotation);
         selectedIndex = annotations.length - 1;
         isDirty = true;
         
@@ -721,7 +945,7 @@ const AnnotationTool = {
         this.updateAnnotationCount();
         
         // 保存状态到历史
-        HistoryManager.saveState();
+        HistoryManager.recordInsert(annotations.length - 1, annotation);
         
         Utils.showMessage(getI18nText('annotation_added').replace('{type}', window.cellClasses[currentClass].name), 'success', 1000);
     },
@@ -734,8 +958,8 @@ const AnnotationTool = {
         const imagePos = AnnotationUtils.screenToImage(screenX, screenY);
         
         // 检查是否在图像范围内
-        if (imagePos.x < 0 || imagePos.x > imageObj.width || 
-            imagePos.y < 0 || imagePos.y > imageObj.height) {
+        if (imagePos.x < 0 || imagePos.x > imageWidth || 
+            imagePos.y < 0 || imagePos.y > imageHeight) {
             Utils.showMessage(getI18nText('click_within_image'), 'warning', 2000);
             return;
         }
@@ -756,7 +980,7 @@ const AnnotationTool = {
         isDrawingPolygon = true;
         currentPolygon = [{x: x, y: y}];
         Utils.showMessage(getI18nText('polygon_start'), 'info', 3000);
-        this.redrawAll();
+        this.requestRedraw();
     },
 
     /**
@@ -764,7 +988,7 @@ const AnnotationTool = {
      */
     addPolygonPoint: function(x, y) {
         currentPolygon.push({x: x, y: y});
-        this.redrawAll();
+        this.requestRedraw();
     },
 
     /**
@@ -778,6 +1002,7 @@ const AnnotationTool = {
         
         // 创建多边形标注
         const annotation = {
+            id: CollabChannel.newId(),
             type: 'polygon',
             points: [...currentPolygon],
             class: currentClass,
@@ -785,6 +1010,7 @@ const AnnotationTool = {
         };
         
         annotations.push(annotation);
+        HitIndex.insert(annotation);
         selectedIndex = annotations.length - 1;
         isDirty = true;
         
@@ -797,7 +1023,7 @@ const AnnotationTool = {
         this.updateAnnotationCount();
         
         // 保存状态到历史
-        HistoryManager.saveState();
+        HistoryManager.recordInsert(annotations.length - 1, annotation);
         
         Utils.showMessage(getI18nText('polygon_added').replace('{type}', window.cellClasses[currentClass].name), 'success', 1000);
     },
@@ -865,8 +1091,10 @@ const AnnotationTool = {
      * 删除标注
      */
     removeAnnotation: function(index) {
+        if (!ViewportLoader.requireComplete()) return;
         if (index >= 0 && index < annotations.length) {
             const removed = annotations.splice(index, 1)[0];
+            HitIndex.remove(removed);
             isDirty = true;
             
             this.redrawAll();
@@ -874,7 +1102,7 @@ const AnnotationTool = {
             this.updateAnnotationCount();
             
             // 保存状态到历史
-            HistoryManager.saveState();
+            HistoryManager.recordRemove(index, removed);
             
             Utils.showMessage(getI18nText('annotation_deleted').replace('{type}', window.cellClasses[removed.class].name), 'warning', 1000);
         }
@@ -931,11 +1159,16 @@ const AnnotationTool = {
         currentRadius = Math.max(5, Math.min(100, radius));
         
         // 如果有选中的圆形标注，更新其半径
-        if (selectedIndex !== -1 && annotations[selectedIndex] && 
+        if (ViewportLoader.complete && selectedIndex !== -1 && annotations[selectedIndex] && 
             annotations[selectedIndex].type === 'circle') {
+            const before = HistoryManager.snapshot(annotations[selectedIndex]);
             annotations[selectedIndex].radius = currentRadius;
             isDirty = true;
-            this.redrawAll();
+            HitIndex.update(annotations[selectedIndex]);
+            // 连续调整半径合并为一条历史记录
+            HistoryManager.recordUpdate(selectedIndex, before, annotations[selectedIndex], 'radius');
+            RenderEngine.invalidateAnnotation(annotations[selectedIndex]);
+            this.requestRedraw();
         }
         
         this.updateRadiusDisplay();
@@ -1016,8 +1249,10 @@ const AnnotationTool = {
      * 更换标注类别
      */
     changeAnnotationClass: function(index, newClass) {
+        if (!ViewportLoader.requireComplete()) return;
         if (index >= 0 && index < annotations.length) {
             const oldClass = annotations[index].class;
+            const before = HistoryManager.snapshot(annotations[index]);
             annotations[index].class = newClass;
             annotations[index].timestamp = new Date().toISOString();
             isDirty = true;
@@ -1026,7 +1261,7 @@ const AnnotationTool = {
             this.updateAnnotationList();
             
             // 保存状态到历史
-            HistoryManager.saveState();
+            HistoryManager.recordUpdate(index, before, annotations[index]);
             
             const oldName = window.cellClasses[oldClass]?.name || '未知';
             const newName = window.cellClasses[newClass]?.name || '未知';
@@ -1040,7 +1275,7 @@ const AnnotationTool = {
     selectAnnotation: function(index) {
         selectedIndex = index;
         this.updateAnnotationList();
-        this.redrawAll();
+        this.requestRedraw();
     },
 
     /**
@@ -1118,7 +1353,7 @@ const AnnotationTool = {
         // 窗口大小变化
         window.addEventListener('resize', () => {
             this.resizeCanvas();
-            this.redrawAll();
+            this.requestRedraw();
         });
         
         // 页面离开警告
@@ -1134,11 +1369,8 @@ const AnnotationTool = {
      * 加载现有标注
      */
     loadExistingAnnotations: function() {
-        if (window.existingAnnotations && Array.isArray(window.existingAnnotations)) {
-            annotations = [...window.existingAnnotations];
-            this.updateAnnotationList();
-            this.updateAnnotationCount();
-        }
+        // 标注按视口渐进加载，见 ViewportLoader
+        ViewportLoader.init();
     },
 
     /**
@@ -1167,6 +1399,9 @@ const AnnotationTool = {
             return;
         }
         
+        const bulk = annotations.length > GeometryService.bulkThreshold;
+        let pendingMeasure = false;
+        
         const listHTML = annotations.map((annotation, index) => {
             const classInfo = window.cellClasses[annotation.class] || window.cellClasses.other;
             
@@ -1175,8 +1410,12 @@ const AnnotationTool = {
             if (annotation.type === 'circle') {
                 coordInfo = `${getI18nText('circle')} (${Math.round(annotation.x)}, ${Math.round(annotation.y)}) r=${annotation.radius}`;
             } else if (annotation.type === 'polygon' && annotation.points) {
-                const center = GeometryUtils.getPolygonCenter(annotation.points);
-                coordInfo = `${getI18nText('polygon')} (${Math.round(center.x)}, ${Math.round(center.y)}) ${annotation.points.length}${getI18nText('points')}`;
+                // 标注较多时质心由Worker批量计算，完成后重新渲染列表
+                const measure = GeometryService.getMeasure(annotation);
+                const center = measure ? measure.center : (bulk ? null : GeometryUtils.getPolygonCenter(annotation.points));
+                const position = center ? `${Math.round(center.x)}, ${Math.round(center.y)}` : '…';
+                if (!center) pendingMeasure = true;
+                coordInfo = `${getI18nText('polygon')} (${position}) ${annotation.points.length}${getI18nText('points')}`;
             } else {
                 coordInfo = getI18nText('unknown_type');
             }
@@ -1217,6 +1456,10 @@ const AnnotationTool = {
         }).join('');
         
         listElement.innerHTML = listHTML;
+        
+        if (pendingMeasure) {
+            GeometryService.measureList(annotations).then(() => this.updateAnnotationList());
+        }
     },
 
     /**
@@ -1225,7 +1468,7 @@ const AnnotationTool = {
     updateAnnotationCount: function() {
         const countElement = document.getElementById('annotationCount');
         if (countElement) {
-            countElement.textContent = annotations.length;
+            countElement.textContent = ViewportLoader.complete ? annotations.length : ViewportLoader.total;
         }
     },
 
@@ -1246,18 +1489,16 @@ const AnnotationTool = {
                 saveBtn.innerHTML = '<i class="bi bi-spinner spin"></i> 保存中...';
             }
             
-            const response = await API.post('/api/save_annotation', {
-                image_id: window.imageData.id,
-                annotations: annotations
-            });
+            // 写入离线队列并立即同步（内容未变化时返回null）
+            const response = await SyncQueue.saveCurrent();
             
-            if (response.success) {
-                isDirty = false;
-                Utils.showMessage(response.message, 'success');
+            if (!response || response.success) {
+                const message = response ? response.message : getI18nText('sync_saved');
+                Utils.showMessage(message, 'success');
                 
                 // 显示成功模态框
                 const modal = new bootstrap.Modal(document.getElementById('saveSuccessModal'));
-                document.getElementById('saveMessage').textContent = response.message;
+                document.getElementById('saveMessage').textContent = message;
                 modal.show();
             } else {
                 Utils.showMessage(response.error || getI18nText('save_failed'), 'error');
@@ -1265,7 +1506,9 @@ const AnnotationTool = {
             
         } catch (error) {
             console.error('保存标注失败:', error);
-            Utils.showMessage(getI18nText('save_failed_retry'), 'error');
+            // 网络失败时标注已保存在本地队列，联网后自动同步
+            const queued = SyncQueue.status === 'offline' || SyncQueue.status === 'retrying';
+            Utils.showMessage(getI18nText(queued ? 'save_queued_offline' : 'save_failed_retry'), queued ? 'warning' : 'error');
         } finally {
             // 恢复按钮状态
             const saveBtn = document.querySelector('button[onclick="saveAnnotations()"]');
@@ -1280,14 +1523,17 @@ const AnnotationTool = {
      * 清空所有标注
      */
     clearAllAnnotations: function() {
+        if (!ViewportLoader.requireComplete()) return;
         if (annotations.length === 0) {
             Utils.showMessage(getI18nText('no_annotations_to_clear'), 'warning');
             return;
         }
         
         if (confirm(getI18nText('clear_all_confirm').replace('{count}', annotations.length))) {
+            const before = annotations;
             annotations = [];
             isDirty = true;
+            HistoryManager.recordClear(before);
             this.redrawAll();
             this.updateAnnotationList();
             this.updateAnnotationCount();
@@ -1299,12 +1545,15 @@ const AnnotationTool = {
      * 撤销最后一个标注
      */
     undoLastAnnotation: function() {
+        if (!ViewportLoader.requireComplete()) return;
         if (annotations.length === 0) {
             Utils.showMessage(getI18nText('no_annotations_to_undo'), 'warning');
             return;
         }
         
         const removed = annotations.pop();
+        HitIndex.remove(removed);
+        HistoryManager.recordRemove(annotations.length, removed);
         isDirty = true;
         this.redrawAll();
         this.updateAnnotationList();
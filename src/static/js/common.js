@@ -179,6 +179,33 @@ const StatsUpdater = {
             progressBar.style.width = `${percentage}%`;
             progressBar.textContent = `${percentage}%`;
         }
+    },
+
+    /**
+     * 订阅服务器推送的统计信息（浏览器不支持SSE时回退到轮询）
+     */
+    subscribe: function() {
+        if (!window.EventSource) {
+            this.updateStats();
+            setInterval(this.updateStats.bind(this), 30000); // 30秒更新一次
+            return;
+        }
+        
+        const source = new EventSource('/api/events');
+        source.addEventListener('stats', (e) => this.displayStats(JSON.parse(e.data)));
+        source.addEventListener('annotations', (e) => this.updateImageCard(JSON.parse(e.data)));
+    },
+
+    /**
+     * 更新图像卡片上的标注数量
+     */
+    updateImageCard: function(change) {
+        const card = document.querySelector(`.image-card[data-image-id="${CSS.escape(change.image_id)}"]`);
+        const badge = card && card.querySelector('.annotation-badge');
+        if (!badge) return;
+        
+        badge.hidden = change.annotation_count === 0;
+        badge.querySelector('.badge').textContent = change.annotation_count;
     }
 };
 
@@ -222,10 +249,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // 初始化文件上传
     FileUploader.init();
     
-    // 定期更新统计信息（如果在首页）
+    // 实时更新统计信息（如果在首页）
     if (window.location.pathname === '/') {
-        StatsUpdater.updateStats();
-        setInterval(StatsUpdater.updateStats.bind(StatsUpdater), 30000); // 30秒更新一次
+        StatsUpdater.subscribe();
     }
     
     // 初始化提示工具
@@ -246,6 +272,15 @@ document.addEventListener('DOMContentLoaded', function() {
     }, 5000);
 });
 
+// 注册Service Worker（缓存静态资源和图像）
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', function() {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.warn('Service Worker注册失败:', error);
+        });
+    });
+}
+
 // 错误处理
 window.addEventListener('error', function(event) {
     console.error('JavaScript错误:', event.error);
@@ -0,0 +1,84 @@
+/**
+ * 蜂格标注工具 - 后台 Worker
+ * 在UI线程之外执行图像下载解码、批量几何计算和相邻图像预取。
+ */
+
+/**
+ * 计算多边形面积（鞋带公式）与质心（顶点均值，与标注列表显示一致）
+ */
+function measurePolygon(points) {
+    if (!points || points.length === 0) {
+        return { area: 0, center: { x: 0, y: 0 } };
+    }
+
+    let twiceArea = 0;
+    let totalX = 0, totalY = 0;
+    for (let i = 0, j = points.length - 1; i < points.length; j = i++) {
+        twiceArea += points[j].x * points[i].y - points[i].x * points[j].y;
+        totalX += points[i].x;
+        totalY += points[i].y;
+    }
+
+    return {
+        area: Math.abs(twiceArea) / 2,
+        center: { x: totalX / points.length, y: totalY / points.length }
+    };
+}
+
+/**
+ * 下载并解码图像
+ */
+async function decodeImage(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return createImageBitmap(await response.blob());
+}
+
+const handlers = {
+    decode: async function(payload) {
+        const bitmap = await decodeImage(payload.url);
+        return { result: bitmap, transfer: [bitmap] };
+    },
+
+    measure: async function(payload) {
+        return { result: payload.polygons.map(measurePolygon) };
+    },
+
+    /**
+     * 预取相邻图像（下载并验证可解码，写入浏览器缓存）及其标注
+     */
+    prefetch: async function(payload) {
+        const tasks = (payload.images || []).map(async url => {
+            const bitmap = await decodeImage(url);
+            bitmap.close();
+        });
+
+        const annotations = {};
+        (payload.annotations || []).forEach(item => {
+            tasks.push(fetch(item.url)
+                .then(response => response.ok ? response.json() : null)
+                .then(data => {
+                    if (data && data.success) annotations[item.id] = data;
+                }));
+        });
+
+        await Promise.allSettled(tasks);
+        return { result: { annotations: annotations } };
+    }
+};
+
+self.onmessage = async function(e) {
+    const { id, op, payload } = e.data;
+    try {
+        const handler = handlers[op];
+        if (!handler) {
+            throw new Error(`unknown op: ${op}`);
+        }
+        const { result, transfer } = await handler(payload);
+        self.postMessage({ id: id, result: result }, transfer || []);
+    } catch (error) {
+        self.postMessage({ id: id, error: String(error && error.message || error) });
+    }
+};
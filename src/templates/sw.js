@@ -0,0 +1,144 @@
+/**
+ * 蜂格标注工具 - Service Worker
+ * 静态资源：按版本预缓存，缓存优先；版本变化时清理旧缓存。
+ * 图像：stale-while-revalidate，按最近访问时间淘汰，总大小不超过预算。
+ */
+
+const VERSION = {{ version | tojson }};
+const STATIC_CACHE = `beeanotate-static-${VERSION}`;
+const IMAGE_CACHE = 'beeanotate-images';
+const PRECACHE_URLS = {{ precache_urls | tojson }};
+const IMAGE_PREFIXES = {{ image_prefixes | tojson }};
+const IMAGE_CACHE_MAX_BYTES = {{ image_cache_max_bytes | tojson }};
+// 缓存命中后超过该时间才在后台重新验证
+const REVALIDATE_AFTER = {{ revalidate_after | tojson }} * 1000;
+
+// 图像缓存索引 url -> { size, accessed }，首次使用时从缓存重建
+let imageIndex = null;
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith('beeanotate-static-') && name !== STATIC_CACHE)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheFirst(request));
+    } else if (IMAGE_PREFIXES.some(prefix => url.pathname.startsWith(prefix))) {
+        event.respondWith(staleWhileRevalidate(event));
+    }
+});
+
+/**
+ * 静态资源：忽略查询参数（如 ?v=）匹配预缓存
+ */
+async function cacheFirst(request) {
+    const cache = await caches.open(STATIC_CACHE);
+    const cached = await cache.match(request, { ignoreSearch: true });
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (response.ok) {
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(event) {
+    const cache = await caches.open(IMAGE_CACHE);
+    const cached = await cache.match(event.request);
+
+    if (cached) {
+        await touch(cache, event.request.url);
+        const cachedAt = Number(cached.headers.get('X-SW-Cached-At') || 0);
+        if (Date.now() - cachedAt > REVALIDATE_AFTER) {
+            event.waitUntil(fetchAndStore(cache, event.request).catch(() => {}));
+        }
+        return cached;
+    }
+
+    return fetchAndStore(cache, event.request);
+}
+
+/**
+ * 请求网络并写入图像缓存（附带写入时间和大小，供淘汰使用）
+ */
+async function fetchAndStore(cache, request) {
+    const response = await fetch(request);
+    if (!response.ok || response.type !== 'basic') return response;
+
+    const blob = await response.clone().blob();
+    if (blob.size > IMAGE_CACHE_MAX_BYTES) return response;
+
+    const headers = new Headers(response.headers);
+    headers.set('X-SW-Cached-At', String(Date.now()));
+    headers.set('X-SW-Size', String(blob.size));
+    await cache.put(request, new Response(blob, {
+        status: response.status,
+        statusText: response.statusText,
+        headers: headers
+    }));
+
+    const index = await loadIndex(cache);
+    index.set(request.url, { size: blob.size, accessed: Date.now() });
+    await trim(cache, index);
+    return response;
+}
+
+async function loadIndex(cache) {
+    if (imageIndex) return imageIndex;
+
+    const index = new Map();
+    for (const request of await cache.keys()) {
+        const response = await cache.match(request);
+        if (!response) continue;
+        index.set(request.url, {
+            size: Number(response.headers.get('X-SW-Size') || 0),
+            accessed: Number(response.headers.get('X-SW-Cached-At') || 0)
+        });
+    }
+    imageIndex = index;
+    return index;
+}
+
+async function touch(cache, url) {
+    const index = await loadIndex(cache);
+    const entry = index.get(url);
+    if (entry) entry.accessed = Date.now();
+}
+
+/**
+ * 超出大小预算时按最近访问时间淘汰
+ */
+async function trim(cache, index) {
+    let total = 0;
+    index.forEach(entry => { total += entry.size; });
+    if (total <= IMAGE_CACHE_MAX_BYTES) return;
+
+    const entries = [...index.entries()].sort((a, b) => a[1].accessed - b[1].accessed);
+    for (const [url, entry] of entries) {
+        if (total <= IMAGE_CACHE_MAX_BYTES) break;
+        await cache.delete(url);
+        index.delete(url);
+        total -= entry.size;
+    }
+}